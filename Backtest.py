@@ -0,0 +1,227 @@
+import argparse
+import datetime
+import logging
+from itertools import product
+
+import numpy as np
+
+from Database import CYCLE, FundingData, Symbol, Exchange, as_of
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+HOURS_PER_YEAR = 24 * 365
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest funding rate arbitrage on the stored fundingdata")
+    parser.add_argument("--days", type=int, default=365, help="history to replay")
+    parser.add_argument("--step", type=int, default=5, help="grid resolution in minutes")
+    parser.add_argument("--symbols", nargs="*", help="subset of symbols (default: all)")
+    parser.add_argument("--entry", type=float, nargs="+", default=[20, 50, 100],
+                        help="open a position when the yearly spread is above this, in percent")
+    parser.add_argument("--exit", type=float, nargs="+", default=[0, 10],
+                        help="close it when the yearly spread falls below this, in percent")
+    parser.add_argument("--fee", type=float, default=5, help="taker fee per leg and trade in bps")
+    parser.add_argument("--rebalance", type=float, default=2, help="cost per leg of one rebalance in bps")
+    parser.add_argument("--rebalance-hours", type=float, default=24, help="hours between rebalances of an open position")
+    parser.add_argument("--reya-only", action="store_true", help="only pairs with Reya on one side, like the alerts")
+    parser.add_argument("--top", type=int, default=10, help="pairs to show for the best parameters")
+    args = parser.parse_args()
+
+    end = datetime.datetime.utcnow().replace(second=0, microsecond=0)
+    backtest = Backtest.load(end - datetime.timedelta(days=args.days), end, step=args.step * 60, symbols=args.symbols)
+    results = backtest.sweep(args.entry, args.exit, fee_bps=args.fee, rebalance_bps=args.rebalance,
+                             rebalance_hours=args.rebalance_hours, reya_only=args.reya_only)
+    print_results(backtest, results, args.top)
+
+
+class Backtest:
+    """Replays a spread position per (symbol, long exchange, short exchange) over a rate grid.
+
+    rates is a time x exchange x symbol array of hourly funding rates in percent, NaN where an exchange
+    did not report. A position opens when the yearly spread (short rate - long rate) rises above the
+    entry threshold and closes when it falls below the exit threshold or a leg stops reporting. It earns
+    the spread continuously while open and pays fee_bps per leg on entry and exit and rebalance_bps per
+    leg every rebalance_hours. The rules are applied to all pairs of a symbol at once with array
+    operations, PnL is in percent of the notional of one leg.
+    """
+
+    def __init__(self, times, rates, exchanges, symbols):
+        self.times = times
+        self.rates = rates
+        self.exchanges = exchanges
+        self.symbols = symbols
+        self.step_hours = float((times[1] - times[0]) / np.timedelta64(1, 'h')) if len(times) > 1 else 1.0
+
+    @classmethod
+    def load(cls, start, end, step=300, symbols=None):
+        """Forward filled grid of the fundingdata rows between start and end"""
+        columns = (FundingData.symbol_id, FundingData.exchange_id, FundingData.timestamp, FundingData.valid_until,
+                   FundingData.interval, FundingData.rate)
+        previous = as_of(start).select(*columns).tuples()
+        window = (FundingData.select(*columns)
+                  .where((FundingData.timestamp > start) & (FundingData.timestamp < end))
+                  .tuples())
+        rows = list(previous) + list(window)
+        logging.info(f"{len(rows)} fundingdata rows loaded")
+
+        symbol_names = dict(Symbol.select(Symbol.id, Symbol.name).tuples())
+        exchange_names = dict(Exchange.select(Exchange.id, Exchange.name).tuples())
+        if symbols:
+            wanted = {symbol_id for symbol_id, name in symbol_names.items() if name in symbols}
+            rows = [row for row in rows if row[0] in wanted]
+        if not rows:
+            raise ValueError("no funding data in the selected range")
+
+        symbol_ids, exchange_ids, timestamps, valid_until, intervals, values = zip(*rows)
+        symbol_ids = np.array(symbol_ids)
+        exchange_ids = np.array(exchange_ids)
+        # backfilled settlements carry no valid_until and hold for their interval
+        confirmed = np.array([value is not None for value in valid_until])
+        valid_until = np.array([value or timestamp for value, timestamp in zip(valid_until, timestamps)],
+                               dtype="datetime64[s]").astype(np.int64)
+        timestamps = np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+        intervals = np.array([interval or 8 for interval in intervals], dtype=np.float64)
+        valid_until = np.where(confirmed, valid_until + int(CYCLE.total_seconds()),
+                               timestamps + (intervals * 3600).astype(np.int64))
+        values = np.array([np.nan if value is None else value for value in values], dtype=np.float32)
+
+        symbol_index, s = np.unique(symbol_ids, return_inverse=True)
+        exchange_index, e = np.unique(exchange_ids, return_inverse=True)
+
+        # sort by series and time, a row holds until the next row of its series or its expiry
+        order = np.lexsort((timestamps, e, s))
+        s, e, timestamps, valid_until, values = s[order], e[order], timestamps[order], valid_until[order], values[order]
+        stop = valid_until.copy()
+        same_series = (s[1:] == s[:-1]) & (e[1:] == e[:-1])
+        stop[:-1][same_series] = np.minimum(stop[:-1][same_series], timestamps[1:][same_series])
+
+        t0 = int(np.datetime64(start, 's').astype(np.int64)) // step * step
+        steps = int(np.ceil((np.datetime64(end, 's').astype(np.int64) - t0) / step))
+        first = np.clip(-((t0 - timestamps) // step), 0, steps)  # ceil
+        last = np.clip(-((t0 - stop) // step), 0, steps)
+        lengths = np.maximum(last - first, 0)
+
+        rates = np.full((steps, len(exchange_index), len(symbol_index)), np.nan, dtype=np.float32)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rates[np.repeat(first, lengths) + offsets, np.repeat(e, lengths), np.repeat(s, lengths)] = np.repeat(values, lengths)
+
+        times = (t0 + np.arange(steps) * step).astype("datetime64[s]")
+        return cls(times, rates,
+                   [exchange_names.get(i, str(i)) for i in exchange_index],
+                   [symbol_names.get(i, str(i)) for i in symbol_index])
+
+    def pairs(self, s, reya_only=False):
+        """(long, short) exchange indices of all ordered pairs that reported the symbol"""
+        reporting = np.flatnonzero(~np.isnan(self.rates[:, :, s]).all(axis=0))
+        long, short = np.meshgrid(reporting, reporting, indexing="ij")
+        mask = long != short
+        if reya_only:
+            reya = [i for i, name in enumerate(self.exchanges) if name.lower() == "reya"]
+            mask &= np.isin(long, reya) | np.isin(short, reya)
+        return long[mask], short[mask]
+
+    def run(self, entry, exit, fee_bps=5, rebalance_bps=2, rebalance_hours=24, reya_only=False):
+        """Trades of every pair as arrays: symbol, long, short, start step, holding hours, net PnL"""
+        entry_1h, exit_1h = entry / HOURS_PER_YEAR, exit / HOURS_PER_YEAR
+        trade_cost = 2 * 2 * fee_bps / 100  # both legs, in and out
+        holding_cost = 2 * rebalance_bps / 100 * self.step_hours / rebalance_hours
+        steps = len(self.times)
+
+        trades = []
+        for s in range(len(self.symbols)):
+            long, short = self.pairs(s, reya_only)
+            if not len(long):
+                continue
+            # pairs x steps, every row is contiguous in memory
+            rates = np.ascontiguousarray(self.rates[:, :, s].T)
+            spread = (rates[short] - rates[long]).ravel()
+
+            # hysteresis: 1 above entry, 0 below exit or without data (NaN compares False), otherwise the last
+            # decided state; every pair starts flat so the forward fill never crosses into the next pair
+            state = np.full(spread.shape, -1, dtype=np.int8)
+            state[~(spread >= exit_1h)] = 0
+            state[spread > entry_1h] = 1
+            state[::steps] = state[::steps] == 1
+            decided = np.arange(len(state), dtype=np.int32)
+            decided[state < 0] = 0
+            np.maximum.accumulate(decided, out=decided)
+            position = state[decided] == 1
+
+            # trades are the runs of an open position
+            opened = position.copy()
+            opened[1:] &= ~position[:-1]
+            opened[::steps] = position[::steps]
+            closed = position.copy()
+            closed[:-1] &= ~position[1:]
+            closed[steps - 1::steps] = position[steps - 1::steps]
+            starts = np.flatnonzero(opened)
+            ends = np.flatnonzero(closed) + 1
+            held = ends - starts
+
+            # the held steps of a trade are consecutive in the compressed spread
+            cumulative = np.concatenate(([0.0], np.cumsum(spread[position], dtype=np.float64)))
+            bounds = np.concatenate(([0], np.cumsum(held)))
+            pnl = (cumulative[bounds[1:]] - cumulative[bounds[:-1]]) * self.step_hours - held * holding_cost - trade_cost
+
+            pair = starts // steps
+            trades.append((np.full(len(starts), s), long[pair], short[pair], starts % steps, held * self.step_hours, pnl))
+
+        if not trades:
+            return {name: np.array([]) for name in ("symbol", "long", "short", "start", "hours", "pnl")}
+        return dict(zip(("symbol", "long", "short", "start", "hours", "pnl"), map(np.concatenate, zip(*trades))))
+
+    def summarize(self, trades, **params):
+        pnl = trades["pnl"]
+        return dict(
+            params,
+            trades=len(pnl),
+            pnl=float(pnl.sum()),
+            pnl_per_trade=float(pnl.mean()) if len(pnl) else 0.0,
+            hit_rate=float((pnl > 0).mean()) if len(pnl) else 0.0,
+            holding_mean=float(trades["hours"].mean()) if len(pnl) else 0.0,
+            holding_median=float(np.median(trades["hours"])) if len(pnl) else 0.0,
+            trades_by_pair=trades,
+        )
+
+    def sweep(self, entries, exits, **costs):
+        """Summary per (entry, exit) combination, exit thresholds above the entry are skipped"""
+        results = []
+        for entry, exit in product(entries, exits):
+            if exit > entry:
+                continue
+            trades = self.run(entry, exit, **costs)
+            results.append(self.summarize(trades, entry=entry, exit=exit))
+        return results
+
+    def by_pair(self, trades):
+        """Net PnL, trades and hours per (symbol, long, short), best first"""
+        pairs = {}
+        for s, long, short, hours, pnl in zip(trades["symbol"], trades["long"], trades["short"], trades["hours"], trades["pnl"]):
+            key = (self.symbols[int(s)], self.exchanges[int(long)], self.exchanges[int(short)])
+            total = pairs.setdefault(key, [0.0, 0, 0.0])
+            total[0] += pnl
+            total[1] += 1
+            total[2] += hours
+        return sorted(((key, *values) for key, values in pairs.items()), key=lambda item: item[1], reverse=True)
+
+
+def print_results(backtest, results, top=10):
+    print(f"{'entry':>7s} {'exit':>7s} {'trades':>7s} {'pnl %':>10s} {'per trade':>10s} {'hit rate':>9s} "
+          f"{'hold avg h':>11s} {'hold med h':>11s}")
+    for result in results:
+        print(f"{result['entry']:7.1f} {result['exit']:7.1f} {result['trades']:7d} {result['pnl']:10.3f} "
+              f"{result['pnl_per_trade']:10.4f} {result['hit_rate'] * 100:8.1f}% {result['holding_mean']:11.1f} "
+              f"{result['holding_median']:11.1f}")
+
+    if not results:
+        return
+    best = max(results, key=lambda result: result["pnl"])
+    print(f"\nbest pairs for entry {best['entry']} / exit {best['exit']}:")
+    for (symbol, long, short), pnl, count, hours in backtest.by_pair(best["trades_by_pair"])[:top]:
+        print(f"{symbol:10s} long {long:16s} short {short:16s} {pnl:10.3f}% {count:5d} trades {hours:9.1f}h")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import ccxt
+
+import Metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# errors that say the exchange is unreachable or overloaded, any other error still is an answer of the exchange
+FAILURES = (ccxt.NetworkError,)
+# throttling answers subclass NetworkError, the RateLimiter backs off on them and they say nothing about
+# the exchange's health
+THROTTLED = (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+
+
+class CircuitBreaker:
+    """Stops calling an exchange after consecutive failures.
+
+    closed: every call goes through, FAILURE_THRESHOLD failures in a row open the breaker.
+    open: calls are rejected right away until the cooldown has passed.
+    half open: a single probe call is let through, success closes the breaker, failure opens it again
+    with a doubled cooldown.
+    """
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 60
+    MAX_COOLDOWN = 600
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = self.COOLDOWN
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        Metrics.CIRCUIT_STATE.set(STATES[CLOSED], exchange=name)
+
+    def allow(self):
+        """True if a call may be made now, a rejected call should be treated as failed without trying"""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            if self.state == CLOSED:
+                return True
+        Metrics.CIRCUIT_REJECTED.inc(exchange=self.name)
+        return False
+
+    @contextmanager
+    def track(self):
+        """Record the outcome of the call made inside the block"""
+        try:
+            yield
+        except THROTTLED:
+            self.record_throttled()
+            raise
+        except FAILURES:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        self.record_success()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self.cooldown = self.COOLDOWN
+                self.transition(CLOSED)
+
+    def record_throttled(self):
+        # neither outcome, a half open breaker lets the next call probe again
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.probing = False
+                self.cooldown = min(self.MAX_COOLDOWN, self.cooldown * 2)
+                self.open()
+            elif self.state == CLOSED and self.failures >= self.FAILURE_THRESHOLD:
+                self.open()
+
+    def open(self):
+        self.opened_at = time.monotonic()
+        self.transition(OPEN)
+
+    def transition(self, state):
+        logging.warning(f"{self.name}: circuit {self.state} -> {state}"
+                        + (f", retry in {self.cooldown}s" if state == OPEN else ""))
+        self.state = state
+        Metrics.CIRCUIT_STATE.set(STATES[state], exchange=self.name)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def for_exchange(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
@@ -0,0 +1,158 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+CYCLE_LOG_FILE = os.getenv("CYCLE_LOG_FILE", "cycle_log.jsonl")
+SLOWEST_REQUESTS = 5
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the last crawl cycles of the cycle log")
+    parser.add_argument("--last", type=int, default=100, help="number of cycles to summarize")
+    parser.add_argument("--file", default=CYCLE_LOG_FILE, help="cycle log file")
+    args = parser.parse_args()
+
+    records = read(args.file, args.last)
+    if not records:
+        print(f"no cycles in {args.file}")
+        return
+    print_summary(summarize(records))
+
+
+class Cycle:
+    """Timings of one crawl cycle: wall time per stage and every exchange request.
+
+    Stages add up when entered more than once, db_write is the sum of all database writes of the cycle.
+    """
+
+    def __init__(self, snapshot_id=None):
+        self.snapshot_id = snapshot_id
+        self.timestamp = datetime.datetime.utcnow().replace(microsecond=0)
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.stages[name] += seconds
+
+    def request(self, exchange, method, seconds, result, symbol=None):
+        with self.lock:
+            self.requests.append((seconds, exchange, method, symbol, result))
+
+    def record(self, slowest=SLOWEST_REQUESTS):
+        exchanges = defaultdict(lambda: [0, 0])
+        for _, exchange, _, _, result in self.requests:
+            exchanges[exchange][0] += 1
+            exchanges[exchange][1] += result == "success"
+
+        return {
+            "snapshot_id": self.snapshot_id,
+            "timestamp": self.timestamp.isoformat(),
+            "total": round(time.perf_counter() - self.started, 3),
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "requests": len(self.requests),
+            "slowest": [
+                {"exchange": exchange, "method": method, "symbol": symbol, "seconds": round(seconds, 3), "result": result}
+                for seconds, exchange, method, symbol, result in sorted(self.requests, key=lambda r: r[0], reverse=True)[:slowest]
+            ],
+            "exchanges": {exchange: {"requests": total, "success_ratio": round(succeeded / total, 3)}
+                          for exchange, (total, succeeded) in sorted(exchanges.items())},
+        }
+
+
+def write(cycle, path=CYCLE_LOG_FILE):
+    """Append the cycle as one JSON line"""
+    record = cycle.record()
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in record["stages"].items())
+    logging.info(f"cycle {record['snapshot_id']} took {record['total']:.1f}s ({stages})")
+    return record
+
+
+def read(path=CYCLE_LOG_FILE, last=None):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return records[-last:] if last else records
+
+
+# ==========================
+# Summary
+# ==========================
+def percentile(values, p):
+    """Linear interpolation between the closest ranks"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def distribution(values):
+    return {f"p{p}": percentile(values, p) for p in (50, 90, 99)} | {"max": max(values)}
+
+
+def summarize(records):
+    stages = defaultdict(list)
+    requests = defaultdict(lambda: [0, 0.0])
+    slow = defaultdict(int)
+    for record in records:
+        for name, seconds in record["stages"].items():
+            stages[name].append(seconds)
+        for exchange, stats in record["exchanges"].items():
+            requests[exchange][0] += stats["requests"]
+            requests[exchange][1] += stats["requests"] * stats["success_ratio"]
+        for request in record["slowest"]:
+            slow[request["exchange"]] += 1
+
+    return {
+        "cycles": len(records),
+        "from": records[0]["timestamp"],
+        "to": records[-1]["timestamp"],
+        "total": distribution([record["total"] for record in records]),
+        "stages": {name: distribution(values) for name, values in stages.items()},
+        "success_ratio": {exchange: succeeded / total for exchange, (total, succeeded) in sorted(requests.items()) if total},
+        # how often an exchange was among the slowest requests of a cycle
+        "slowest_exchanges": dict(sorted(slow.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['cycles']} cycles from {summary['from']} to {summary['to']}\n")
+    print(f"{'stage':16s} {'p50':>8s} {'p90':>8s} {'p99':>8s} {'max':>8s}")
+    for name, values in [("total", summary["total"])] + list(summary["stages"].items()):
+        print(f"{name:16s} " + " ".join(f"{values[key]:8.2f}" for key in ("p50", "p90", "p99", "max")))
+
+    print(f"\n{'exchange':16s} {'success':>8s} {'slowest':>8s}")
+    for exchange, ratio in summary["success_ratio"].items():
+        print(f"{exchange:16s} {ratio * 100:7.1f}% {summary['slowest_exchanges'].get(exchange, 0):8d}")
+
+
+if __name__ == '__main__':
+    main()
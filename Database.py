@@ -0,0 +1,379 @@
+import datetime
+import logging
+import os
+import threading
+
+from dotenv import load_dotenv
+from peewee import (
+    Model, CharField, DateTimeField, AutoField, FloatField, DoubleField, IntegerField, SmallIntegerField,
+    BigIntegerField, TextField, CompositeKey, DatabaseProxy, fn
+)
+from playhouse.migrate import MySQLMigrator, migrate
+
+from Storage import open_storage
+
+# Load environment variables
+load_dotenv()
+
+# The models are bound to a proxy, use_storage() switches every user of db to another backend
+db = DatabaseProxy()
+storage = None
+
+
+def use_storage(new_storage):
+    global storage
+    storage = new_storage
+    db.initialize(new_storage.database)
+
+
+# MariaDB, or DB_BACKEND=sqlite with the file DB_PATH for local runs without a server
+use_storage(open_storage(
+    os.getenv("DB_BACKEND", "mariadb"),
+    path=os.getenv("DB_PATH", "reya.db"),
+    schema=os.getenv("DB_SCHEMA"),
+    user=os.getenv("DB_USER"),
+    password=os.getenv("DB_PASSWORD"),
+    host=os.getenv("DB_HOST", "localhost"),
+    port=int(os.getenv("DB_PORT", 3306)),
+))
+
+
+class BaseModel(Model):
+    class Meta:
+        database = db
+
+
+class DimensionModel(BaseModel):
+    """Small lookup table, the time series tables only store its integer id"""
+    id = AutoField()
+    name = CharField(max_length=32, unique=True)
+
+    _lock = threading.Lock()
+
+    @classmethod
+    def id_for(cls, name, **fields):
+        """Id of the entry with this name, created with the given fields on first use"""
+        ids = cls.__dict__.get('_ids')
+        if ids is None:
+            ids = cls._ids = {}
+        if name not in ids:
+            with cls._lock:
+                if name not in ids:
+                    cls.insert(name=name, **fields).on_conflict_ignore().execute()
+                    ids[name] = cls.get(cls.name == name).id
+        return ids[name]
+
+
+class Symbol(DimensionModel):
+    ticker = CharField(max_length=64, null=True)
+
+
+class Exchange(DimensionModel):
+    pass
+
+
+class Snapshot(BaseModel):
+    """One crawl cycle, every row written in the cycle carries its id and timestamp"""
+    id = AutoField()
+    timestamp = DateTimeField(index=True)
+    duration = FloatField(null=True)
+    exchanges_succeeded = TextField(null=True)
+    exchanges_failed = TextField(null=True)
+    rows = IntegerField(default=0)
+
+
+class FundingRate(BaseModel):
+    id = AutoField()
+    symbol_id = SmallIntegerField()
+    fundingRate = DoubleField(null=True)
+    interval = FloatField(null=True)  # hours
+    fundingDatetime = BigIntegerField(null=True)  # ms since epoch
+    fundingRateAnnualized = DoubleField(null=True)
+    timestamp = DateTimeField()
+    valid_until = DateTimeField(null=True)
+    snapshot_id = IntegerField(null=True, index=True)
+
+    class Meta:
+        indexes = (
+            (('symbol_id', 'timestamp'), False),
+        )
+
+    @classmethod
+    def named(cls):
+        """Query with the symbol name joined in"""
+        return (cls.select(cls, Symbol.name.alias('symbol'), Symbol.ticker)
+                .join(Symbol, on=(cls.symbol_id == Symbol.id)))
+
+
+class Staking(BaseModel):
+    id = AutoField()
+    # Add staking metrics
+    stakeApy = DoubleField(null=True)
+    sharePrice = DoubleField(null=True)
+    timestamp = DateTimeField()
+    valid_until = DateTimeField(null=True)
+    snapshot_id = IntegerField(null=True, index=True)
+
+
+class FundingData(BaseModel):
+    symbol_id = SmallIntegerField()
+    exchange_id = SmallIntegerField()
+    rate = DoubleField()
+    rate_1y = DoubleField()
+    next_funding = BigIntegerField(null=True)  # ms since epoch
+    interval = FloatField()  # hours
+    timestamp = DateTimeField()
+    valid_until = DateTimeField(null=True)
+    snapshot_id = IntegerField(null=True)
+
+    class Meta:
+        # history queries filter on symbol/exchange and a time range
+        indexes = (
+            (('symbol_id', 'exchange_id', 'timestamp'), False),
+            (('snapshot_id', 'symbol_id', 'exchange_id'), False),
+        )
+
+    @classmethod
+    def row(cls, symbol, exchange, **fields):
+        """Insertable row for the given symbol and exchange names"""
+        return dict(fields, symbol_id=Symbol.id_for(symbol), exchange_id=Exchange.id_for(exchange))
+
+    @classmethod
+    def named(cls):
+        """Query with the symbol and exchange names joined in"""
+        return (cls.select(cls, Symbol.name.alias('symbol'), Exchange.name.alias('exchange'))
+                .join(Symbol, on=(cls.symbol_id == Symbol.id))
+                .switch(cls)
+                .join(Exchange, on=(cls.exchange_id == Exchange.id)))
+
+
+def extend_validity(model, ids, until):
+    """Mark unchanged rows as still valid instead of writing a copy of them"""
+    if ids:
+        model.update(valid_until=until).where(model.id.in_(ids)).execute()
+
+
+def bulk_insert(model, rows):
+    """Insert many rows in the batches the storage backend handles best"""
+    storage.bulk_insert(model, rows)
+
+
+def upsert(model, rows):
+    """Insert rows or update the existing rows with the same primary key"""
+    storage.upsert(model, rows)
+
+
+# Every crawl cycle (5 minutes of sleep plus the crawl itself) confirms the rows it fetched again. A row holds
+# until one cycle past its valid_until, a series without confirmation for longer is no longer crawled. Every
+# reader of the delta rows (as_of, rolling averages, compaction, backtest, charts) uses this margin.
+CYCLE = datetime.timedelta(minutes=10)
+
+
+def as_of(timestamp):
+    """Latest funding row per symbol and exchange at the given time, the forward filled view of the delta writes"""
+    latest = (FundingData
+              .select(FundingData.symbol_id, FundingData.exchange_id, fn.MAX(FundingData.timestamp).alias('max_ts'))
+              .where(FundingData.timestamp <= timestamp)
+              .group_by(FundingData.symbol_id, FundingData.exchange_id)
+              .alias('latest'))
+    # a series that is no longer crawled ends shortly after the validity of its last row
+    return (FundingData.named()
+            .join(latest, on=((FundingData.symbol_id == latest.c.symbol_id) &
+                              (FundingData.exchange_id == latest.c.exchange_id) &
+                              (FundingData.timestamp == latest.c.max_ts)), src=FundingData)
+            .where(FundingData.valid_until >= timestamp - CYCLE))
+
+
+class Compaction(BaseModel):
+    """Up to which hour the raw rows of a table have been compacted into hourly rows"""
+    table_name = CharField(max_length=64, primary_key=True)
+    compacted_until = DateTimeField()
+
+
+class RollingAverage(BaseModel):
+    """Hourly mean and trailing 7/30 day averages of a series, maintained by RollingAverages"""
+    series = CharField(max_length=16)
+    symbol_id = SmallIntegerField(default=0)  # 0 for series without symbol
+    hour = DateTimeField()
+    mean = DoubleField()
+    avg_7d = DoubleField()
+    avg_30d = DoubleField()
+
+    class Meta:
+        primary_key = CompositeKey('series', 'symbol_id', 'hour')
+
+
+class StatisticsCheckpoint(BaseModel):
+    """Last checkpoint of the streaming statistics of a series, see FundingStatistics"""
+    series = CharField(max_length=128, primary_key=True)
+    state = TextField()
+    updated = DateTimeField()
+
+
+# Views with the names joined in, used by the dashboards' plain SQL; {next_funding} and {funding_datetime}
+# are the backend's conversion of the ms timestamps
+VIEWS = {
+    'fundingdata_v': """
+        SELECT f.id, f.symbol_id, f.exchange_id, s.name AS symbol, e.name AS exchange, f.rate, f.rate_1y,
+               {next_funding} AS next_funding, f.`interval`, f.timestamp, f.valid_until,
+               f.snapshot_id
+        FROM fundingdata f
+        JOIN symbol s ON s.id = f.symbol_id
+        JOIN exchange e ON e.id = f.exchange_id
+    """,
+    'fundingrate_v': """
+        SELECT f.id, f.symbol_id, s.name AS symbol, s.ticker, f.fundingRate, f.`interval`,
+               {funding_datetime} AS fundingDatetime, f.fundingRateAnnualized,
+               f.timestamp, f.valid_until, f.snapshot_id
+        FROM fundingrate f
+        JOIN symbol s ON s.id = f.symbol_id
+    """,
+}
+
+ISO_FORMAT = '%Y-%m-%dT%H:%i:%s'
+# the baseline crawler stored 'N/A' or '' for unknown times, STR_TO_DATE rejects them in strict mode
+ISO_PATTERN = '^[0-9]{4}-[0-9]{2}-[0-9]{2}T'
+INTERVAL_PATTERN = '^[0-9]+([.][0-9]+)?h?$'
+# ms since epoch of an ISO string without the session time zone, NULL unless it matches ISO_PATTERN
+ISO_TO_MILLIS = "IF({column} REGEXP %s, TIMESTAMPDIFF(SECOND, '1970-01-01', STR_TO_DATE(LEFT({column}, 19), %s)) * 1000, NULL)"
+
+
+def create_table():
+    # Create table if not exists
+    db.connect(reuse_if_open=True)
+    db.create_tables([Symbol, Exchange, Snapshot, Compaction, RollingAverage, StatisticsCheckpoint])
+    # existing tables have to be migrated before their indexes are created, local databases start
+    # with the current schema
+    if storage.name == "mariadb":
+        migrate_tables()
+    db.create_tables([FundingRate, Staking, FundingData])
+    for name, query in VIEWS.items():
+        storage.create_view(name, query.format(next_funding=storage.from_millis("f.next_funding"),
+                                               funding_datetime=storage.from_millis("f.fundingDatetime")))
+
+
+def migrate_tables():
+    """Add columns introduced after the tables were first created"""
+    migrator = MySQLMigrator(db)
+    operations = []
+    for model in [FundingRate, Staking, FundingData]:
+        if not model.table_exists():
+            continue
+        table = model._meta.table_name
+        columns = [column.name for column in db.get_columns(table)]
+        if "snapshot_id" not in columns:
+            operations.append(migrator.add_column(table, "snapshot_id", IntegerField(null=True)))
+            operations.append(migrator.add_index(table, ("snapshot_id",), False))
+    if operations:
+        migrate(*operations)
+
+    migrate_compact_schema()
+
+    operations = []
+    for model in [FundingRate, Staking, FundingData]:
+        if model.table_exists() and "valid_until" not in [column.name for column in db.get_columns(model._meta.table_name)]:
+            operations.append(migrator.add_column(model._meta.table_name, "valid_until", DateTimeField(null=True)))
+    if operations:
+        migrate(*operations)
+
+
+def column_names(table):
+    """Columns of a table, from information_schema"""
+    return {column.name for column in db.get_columns(table)}
+
+
+def add_missing_columns(table, definitions):
+    """ADD COLUMN for the columns of definitions the table does not have yet"""
+    missing = [f"ADD COLUMN {name} {definition}" for name, definition in definitions.items()
+               if name not in column_names(table)]
+    if missing:
+        db.execute_sql(f"ALTER TABLE {table} {', '.join(missing)}")
+
+
+def migrate_compact_schema():
+    """Convert tables from the string/decimal schema to dimension ids, numeric timestamps and doubles.
+
+    Runs on tables that still have the old or temporary columns. Every step checks the columns first, so an
+    interrupted migration continues where it stopped when it is run again.
+    """
+    if FundingData.table_exists() and {'symbol', 'next_funding_ms'} & column_names('fundingdata'):
+        logging.info("fundingdata: migrating to compact schema")
+        if 'symbol' in column_names('fundingdata'):
+            db.execute_sql("INSERT IGNORE INTO symbol (name) SELECT DISTINCT symbol FROM fundingdata")
+            db.execute_sql("INSERT IGNORE INTO exchange (name) SELECT DISTINCT exchange FROM fundingdata")
+            db.execute_sql("DROP INDEX IF EXISTS fundingdata_symbol_exchange_timestamp ON fundingdata")
+            db.execute_sql("DROP INDEX IF EXISTS fundingdata_snapshot_id ON fundingdata")
+            db.execute_sql("DROP INDEX IF EXISTS fundingdata_snapshot_id_symbol_exchange ON fundingdata")
+            add_missing_columns('fundingdata', {
+                'symbol_id': 'SMALLINT NULL',
+                'exchange_id': 'SMALLINT NULL',
+                'next_funding_ms': 'BIGINT NULL',
+            })
+            db.execute_sql(f"""
+                UPDATE fundingdata f
+                JOIN symbol s ON s.name = f.symbol
+                JOIN exchange e ON e.name = f.exchange
+                SET f.symbol_id = s.id,
+                    f.exchange_id = e.id,
+                    f.next_funding_ms = {ISO_TO_MILLIS.format(column='f.next_funding')}
+                WHERE f.symbol_id IS NULL
+            """, (ISO_PATTERN, ISO_FORMAT))
+            db.execute_sql("""
+                ALTER TABLE fundingdata
+                    DROP COLUMN symbol,
+                    DROP COLUMN exchange,
+                    DROP COLUMN next_funding,
+                    MODIFY symbol_id SMALLINT NOT NULL,
+                    MODIFY exchange_id SMALLINT NOT NULL,
+                    MODIFY rate DOUBLE NOT NULL,
+                    MODIFY rate_1y DOUBLE NOT NULL
+            """)
+        db.execute_sql("""
+            ALTER TABLE fundingdata
+                CHANGE next_funding_ms next_funding BIGINT NULL,
+                ADD INDEX IF NOT EXISTS fundingdata_symbol_id_exchange_id_timestamp (symbol_id, exchange_id, timestamp),
+                ADD INDEX IF NOT EXISTS fundingdata_snapshot_id_symbol_id_exchange_id (snapshot_id, symbol_id, exchange_id)
+        """)
+
+    if FundingRate.table_exists() and {'symbol', 'funding_ms'} & column_names('fundingrate'):
+        logging.info("fundingrate: migrating to compact schema")
+        if 'symbol' in column_names('fundingrate'):
+            db.execute_sql("""
+                INSERT INTO symbol (name, ticker)
+                SELECT symbol, MAX(ticker) FROM fundingrate GROUP BY symbol
+                ON DUPLICATE KEY UPDATE ticker = VALUES(ticker)
+            """)
+            add_missing_columns('fundingrate', {
+                'symbol_id': 'SMALLINT NULL',
+                'funding_ms': 'BIGINT NULL',
+                'interval_h': 'FLOAT NULL',
+            })
+            db.execute_sql(f"""
+                UPDATE fundingrate f
+                JOIN symbol s ON s.name = f.symbol
+                SET f.symbol_id = s.id,
+                    f.funding_ms = {ISO_TO_MILLIS.format(column='f.fundingDatetime')},
+                    f.interval_h = IF(f.`interval` REGEXP %s, REPLACE(f.`interval`, 'h', '') + 0, NULL)
+                WHERE f.symbol_id IS NULL
+            """, (ISO_PATTERN, ISO_FORMAT, INTERVAL_PATTERN))
+            db.execute_sql("""
+                ALTER TABLE fundingrate
+                    DROP COLUMN symbol,
+                    DROP COLUMN ticker,
+                    DROP COLUMN fundingDatetime,
+                    DROP COLUMN `interval`,
+                    MODIFY symbol_id SMALLINT NOT NULL,
+                    MODIFY fundingRate DOUBLE NULL,
+                    MODIFY fundingRateAnnualized DOUBLE NULL
+            """)
+        db.execute_sql("""
+            ALTER TABLE fundingrate
+                CHANGE funding_ms fundingDatetime BIGINT NULL,
+                CHANGE interval_h `interval` FLOAT NULL,
+                ADD INDEX IF NOT EXISTS fundingrate_symbol_id_timestamp (symbol_id, timestamp)
+        """)
+
+    columns = {column.name: column.data_type.lower() for column in db.get_columns('staking')} if Staking.table_exists() else {}
+    if columns.get('stakeApy') == 'decimal':
+        logging.info("staking: migrating to compact schema")
+        db.execute_sql("ALTER TABLE staking MODIFY stakeApy DOUBLE NULL, MODIFY sharePrice DOUBLE NULL")
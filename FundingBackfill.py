@@ -0,0 +1,180 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ccxt
+
+import FundingNormalizer
+import RateLimiter
+from Database import FundingData, bulk_insert, create_table
+from FundingSample import RawFunding
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historical funding rates into fundingdata")
+    parser.add_argument("--days", type=int, default=365, help="how far back to fetch on a fresh start")
+    parser.add_argument("--exchanges", nargs="*", help="subset of exchanges to backfill (default: all supported)")
+    parser.add_argument("--checkpoint", default=FundingBackfill.CHECKPOINT_FILE, help="checkpoint file for resuming")
+    args = parser.parse_args()
+
+    create_table()
+    FundingBackfill(days=args.days, exchanges=args.exchanges, checkpoint_file=args.checkpoint).run()
+
+
+class FundingBackfill:
+    """Pulls funding rate history from every exchange that offers it and stores it in fundingdata.
+
+    Every exchange runs in its own worker so the exchanges are fetched in parallel, while the
+    requests against a single exchange stay sequential and share the exchange's budget with the crawler (RateLimiter).
+    Progress is written to a checkpoint file after every page, a restart continues from there and skips
+    the rows of a page that was stored but not yet checkpointed.
+    """
+    SYMBOLS = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT', 'HYPE/USDT:USDT', 'ENA/USDT:USDT', 'TAO/USDT:USDT', "ARB/USDT:USDT", "LTC/USDT:USDT"]
+
+    # exchanges with fetchFundingRateHistory and the max page size they accept
+    HISTORY_EXCHANGES = {
+        'binance': (ccxt.binance, 1000),
+        'bybit': (ccxt.bybit, 200),
+        'okx': (ccxt.okx, 100),
+        'hyperliquid': (ccxt.hyperliquid, 500),
+    }
+
+    CHECKPOINT_FILE = "backfill_checkpoint.json"
+    DEFAULT_INTERVAL = 8
+
+    def __init__(self, days=365, exchanges=None, checkpoint_file=CHECKPOINT_FILE):
+        self.since = int((time.time() - days * 24 * 60 * 60) * 1000)
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint = self.load_checkpoint()
+        self.checkpoint_lock = threading.Lock()
+
+        self.exchanges = {}
+        for exchange_name, (exchange_class, page_size) in self.HISTORY_EXCHANGES.items():
+            if exchanges and exchange_name not in exchanges:
+                continue
+            exchange = RateLimiter.install(exchange_class({'enableRateLimit': True}))
+            if not exchange.has.get('fetchFundingRateHistory'):
+                logging.warning(f"{exchange_name} does not support funding rate history, skipping")
+                continue
+            self.exchanges[exchange_name] = (exchange, page_size)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=len(self.exchanges) or 1) as executor:
+            futures = {executor.submit(self.backfill_exchange, exchange_name, exchange, page_size): exchange_name
+                       for exchange_name, (exchange, page_size) in self.exchanges.items()}
+            for future in as_completed(futures):
+                exchange_name = futures[future]
+                try:
+                    logging.info(f"{exchange_name}: backfill finished, {future.result()} rows inserted")
+                except Exception as e:
+                    logging.error(f"{exchange_name}: backfill failed: {e}")
+
+    def backfill_exchange(self, exchange_name, exchange, page_size):
+        inserted = 0
+        for symbol in self.SYMBOLS:
+            try:
+                inserted += self.backfill_symbol(exchange_name, exchange, symbol, page_size)
+            except Exception as e:
+                # keep the checkpoint, the next run continues with this symbol
+                logging.error(f"{exchange_name}: error backfilling {symbol}: {e}")
+        return inserted
+
+    def backfill_symbol(self, exchange_name, exchange, symbol, page_size):
+        fetch_symbol = symbol
+        if exchange.name == "Hyperliquid":
+            fetch_symbol = symbol.replace("USDT", "USDC")
+
+        since = self.checkpoint.get(exchange_name, {}).get(symbol)
+        since = since + 1 if since is not None else self.since
+        now = exchange.milliseconds()
+        inserted = 0
+        last_interval = None
+
+        while since < now:
+            history = exchange.fetch_funding_rate_history(fetch_symbol, since=since, limit=page_size)
+            history = [entry for entry in history if entry.get('timestamp') and entry['timestamp'] >= since]
+            if not history:
+                break
+
+            rows = self.to_rows(exchange, symbol, history, last_interval)
+            last_interval = rows[-1]['interval'] if rows else last_interval
+            rows = self.without_stored(rows)
+            bulk_insert(FundingData, rows)
+            inserted += len(rows)
+
+            since = history[-1]['timestamp'] + 1
+            self.save_checkpoint(exchange_name, symbol, history[-1]['timestamp'])
+            logging.info(f"{exchange_name}/{symbol}: {len(rows)} rows up to {history[-1]['datetime']}")
+
+        return inserted
+
+    def to_rows(self, exchange, symbol, history, last_interval=None):
+        base_symbol = symbol.replace('/USDT:USDT', '')
+        raws = []
+        previous = None
+        for i, entry in enumerate(history):
+            rate = entry.get('fundingRate')
+            if rate is None:
+                continue
+
+            # history entries carry no interval, derive it from the distance to the neighbour settlement
+            if previous is not None:
+                interval = round((entry['timestamp'] - previous) / 3600000) or self.DEFAULT_INTERVAL
+            elif i + 1 < len(history):
+                interval = round((history[i + 1]['timestamp'] - entry['timestamp']) / 3600000) or self.DEFAULT_INTERVAL
+            else:
+                interval = last_interval or self.DEFAULT_INTERVAL
+            previous = entry['timestamp']
+            raws.append(RawFunding(base_symbol, exchange.name, float(rate), float(interval), entry['timestamp']))
+
+        return [FundingData.row(
+            sample.symbol,
+            sample.exchange,
+            rate=sample.rate,
+            rate_1y=sample.rate_1y,
+            next_funding=sample.next_funding,
+            interval=sample.interval,
+            timestamp=datetime.datetime.utcfromtimestamp(sample.next_funding / 1000),
+        ) for sample in FundingNormalizer.normalize(raws)]
+
+    def without_stored(self, rows):
+        """Rows of a page that are not stored yet; a page inserted before an interruption, but not yet
+        checkpointed, is fetched again on resume and must not be counted twice"""
+        if not rows:
+            return rows
+        timestamps = [row['timestamp'] for row in rows]
+        # backfilled rows have no snapshot, the crawler's rows of the same time are a series of their own
+        stored = {timestamp.replace(microsecond=0) for (timestamp,) in FundingData
+                  .select(FundingData.timestamp)
+                  .where((FundingData.symbol_id == rows[0]['symbol_id']) &
+                         (FundingData.exchange_id == rows[0]['exchange_id']) &
+                         FundingData.timestamp.between(min(timestamps), max(timestamps)) &
+                         FundingData.snapshot_id.is_null())
+                  .tuples()}
+        return [row for row in rows if row['timestamp'].replace(microsecond=0) not in stored]
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, exchange_name, symbol, timestamp):
+        with self.checkpoint_lock:
+            self.checkpoint.setdefault(exchange_name, {})[symbol] = timestamp
+            tmp_file = self.checkpoint_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(self.checkpoint, f, indent=2)
+            os.replace(tmp_file, self.checkpoint_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import logging
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from FundingSample import FundingSample
+
+# The only place where reported funding rates become hourly and annualized percentages.
+
+DEFAULT_INTERVAL = 8.0
+HOURS_PER_YEAR = 24 * 365
+
+# rates are reported as fractions and stored as percent, Reya already reports percent
+DEFAULT_FACTOR = 100
+FACTORS = {"Reya": 1}
+
+# last known settlement interval per (exchange, symbol), used when a response carries none
+_intervals = {}
+_intervals_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def parse_interval(value):
+    """'8h', '240m', '8' or 8 -> hours"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip().lower()
+    if value.endswith("m"):
+        return float(value[:-1]) / 60
+    return float(value.rstrip("h"))
+
+
+def interval_for(exchange, symbol, interval=None):
+    key = (exchange, symbol)
+    try:
+        hours = parse_interval(interval)
+    except (AttributeError, ValueError):
+        # one unparsable interval must not cost the whole batch, it counts as not reported
+        logging.warning(f"{exchange} {symbol}: unparsable funding interval {interval!r}")
+        hours = None
+    with _intervals_lock:
+        if hours:
+            _intervals[key] = hours
+            return hours
+        return _intervals.get(key, DEFAULT_INTERVAL)
+
+
+def annualize(funding_rate, interval_hours):
+    """Per-interval rate -> per-year rate, in the unit of the input"""
+    return funding_rate / interval_hours * HOURS_PER_YEAR
+
+
+def normalize(raws):
+    """RawFunding batch -> FundingSample list with hourly and annualized rates in percent"""
+    if not raws:
+        return []
+    intervals = np.fromiter((interval_for(raw.exchange, raw.symbol, raw.interval) for raw in raws),
+                            dtype=np.float64, count=len(raws))
+    factors = np.fromiter((FACTORS.get(raw.exchange, DEFAULT_FACTOR) for raw in raws),
+                          dtype=np.float64, count=len(raws))
+    rates = np.fromiter((raw.funding_rate for raw in raws), dtype=np.float64, count=len(raws))
+
+    hourly = rates * factors / intervals
+    yearly = hourly * HOURS_PER_YEAR
+    return [FundingSample(raw.symbol, raw.exchange, rate, rate_1y, interval, raw.next_funding)
+            for raw, rate, rate_1y, interval in zip(raws, hourly.tolist(), yearly.tolist(), intervals.tolist())]
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class RawFunding:
+    """A funding rate as reported by the exchange, turned into a FundingSample by FundingNormalizer"""
+    symbol: str
+    exchange: str
+    funding_rate: float  # per settlement interval, fraction (Reya: percent)
+    interval: str | float | None = None  # '8h' or hours, None if the exchange does not report it
+    next_funding: int | None = None  # ms
+
+
+@dataclass(slots=True)
+class FundingSample:
+    """One funding rate of a symbol on an exchange, rates in percent"""
+    symbol: str
+    exchange: str
+    rate: float  # per hour
+    rate_1y: float
+    interval: float  # hours between settlements
+    next_funding: int | None = None  # ms
+
+
+@dataclass(slots=True)
+class ArbitrageOpportunity:
+    """Long the negative rate, short the positive rate of the same symbol"""
+    symbol: str
+    long_exchange: str
+    long_rate: float
+    long_rate_1y: float
+    short_exchange: str
+    short_rate: float
+    short_rate_1y: float
+
+    @classmethod
+    def of(cls, long, short):
+        return cls(long.symbol, long.exchange, long.rate, long.rate_1y, short.exchange, short.rate, short.rate_1y)
+
+    @classmethod
+    def find(cls, samples):
+        """Best opportunity per symbol with Reya on one side, and every positive/negative pair, by spread"""
+        by_symbol = defaultdict(list)
+        for sample in samples:
+            by_symbol[sample.symbol].append(sample)
+
+        best_results = []
+        all_results = []
+        for symbol, symbol_samples in by_symbol.items():
+            positives = [sample for sample in symbol_samples if sample.rate > 0]
+            negatives = [sample for sample in symbol_samples if sample.rate < 0]
+
+            if not positives or not negatives:
+                continue  # no arbitrage possible for this symbol
+
+            # Find max positive & min negative
+            best_pos = max(positives, key=lambda sample: sample.rate)
+            best_neg = min(negatives, key=lambda sample: sample.rate)
+
+            # ✅ only keep if Reya is involved on either side
+            if "reya" in (best_pos.exchange.lower(), best_neg.exchange.lower()):
+                best_results.append(cls.of(best_neg, best_pos))
+
+            # Compare ALL positives vs negatives
+            all_results.extend(cls.of(neg, pos) for pos in positives for neg in negatives)
+
+        best_results.sort(key=lambda opportunity: opportunity.spread, reverse=True)
+        all_results.sort(key=lambda opportunity: opportunity.spread, reverse=True)
+        return best_results, all_results
+
+    @property
+    def spread(self):
+        return self.short_rate - self.long_rate
+
+    @property
+    def spread_1y(self):
+        return self.short_rate_1y - self.long_rate_1y
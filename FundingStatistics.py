@@ -0,0 +1,233 @@
+import json
+import math
+from collections import defaultdict
+from itertools import combinations
+
+# Streaming statistics of the annualized funding rates and the spreads between exchanges. Every update
+# is O(1) per series, the state is checkpointed as JSON so the dashboard can use it without the history.
+
+# one crawl cycle every 5 minutes, the EWMA forgets with a half life of 7 days
+EWMA_HALF_LIFE = 7 * 24 * 12
+# z-scores and percentiles of a series with fewer samples are not shown
+MIN_SAMPLES = 288
+COMPRESSION = 50
+
+
+class Welford:
+    """Mean and variance over all samples"""
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class Ewma:
+    """Exponentially weighted mean and variance, follows the current regime of a series"""
+
+    def __init__(self, half_life=EWMA_HALF_LIFE, n=0, mean=0.0, var=0.0):
+        self.alpha = 1 - 0.5 ** (1 / half_life)
+        self.n = n
+        self.mean = mean
+        self.var = var
+
+    def update(self, value):
+        self.n += 1
+        # plain mean and variance until the series is longer than the EWMA memory
+        alpha = max(self.alpha, 1 / self.n)
+        delta = value - self.mean
+        increment = alpha * delta
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + delta * increment)
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+
+class Digest:
+    """Merging t-digest: approximate quantiles and percentile ranks in a few dozen centroids.
+
+    Values are buffered and merged into the sorted [mean, weight] centroids when the buffer is full, the
+    arcsine scale keeps the centroids at the tails small so the extreme percentiles stay accurate.
+    """
+
+    def __init__(self, compression=COMPRESSION, centroids=None):
+        self.compression = compression
+        self.centroids = centroids or []
+        self.buffer = []
+        self.count = sum(weight for _, weight in self.centroids)
+
+    def update(self, value):
+        self.buffer.append(value)
+        self.count += 1
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+
+    def scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + [[value, 1] for value in self.buffer])
+        self.buffer = []
+
+        merged = []
+        current = list(points[0])
+        weight_before = 0
+        k_low = self.scale(0)
+        for mean, weight in points[1:]:
+            if self.scale((weight_before + current[1] + weight) / self.count) - k_low <= 1:
+                current[1] += weight
+                current[0] += (mean - current[0]) * weight / current[1]
+            else:
+                merged.append(current)
+                weight_before += current[1]
+                k_low = self.scale(weight_before / self.count)
+                current = [mean, weight]
+        merged.append(current)
+        self.centroids = merged
+
+    def rank(self, value):
+        """Fraction of the samples below value"""
+        self.compress()
+        if not self.centroids:
+            return None
+        below = 0
+        for i, (mean, weight) in enumerate(self.centroids):
+            if value < mean:
+                if i == 0:
+                    return 0.0
+                # half of the weight of a centroid lies on either side of its mean
+                previous_mean, previous_weight = self.centroids[i - 1]
+                fraction = (value - previous_mean) / (mean - previous_mean)
+                return (below - previous_weight / 2 + (previous_weight + weight) / 2 * fraction) / self.count
+            below += weight
+        return 1.0
+
+    def quantile(self, q):
+        self.compress()
+        if not self.centroids:
+            return None
+        target = q * self.count
+        cumulative = 0
+        previous_mean, previous_center = self.centroids[0][0], self.centroids[0][1] / 2
+        if target <= previous_center:
+            return previous_mean
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target <= center:
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+            cumulative += weight
+            previous_mean, previous_center = mean, center
+        return self.centroids[-1][0]
+
+
+class SeriesStatistics:
+    """Welford, EWMA and digest of one series"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.welford = Welford(*state.get("welford", ()))
+        self.ewma = Ewma(EWMA_HALF_LIFE, *state.get("ewma", ()))
+        self.digest = Digest(COMPRESSION, state.get("centroids"))
+
+    def update(self, value):
+        self.welford.update(value)
+        self.ewma.update(value)
+        self.digest.update(value)
+
+    def describe(self, value):
+        """z-score against the EWMA and percentile rank of value, None until enough samples were seen"""
+        if self.welford.n < MIN_SAMPLES:
+            return None
+        std = self.ewma.std
+        return {
+            "zscore": (value - self.ewma.mean) / std if std > 0 else 0.0,
+            "percentile": self.digest.rank(value) * 100,
+            "mean": self.welford.mean,
+            "std": self.welford.std,
+            "samples": self.welford.n,
+        }
+
+    def state(self):
+        self.digest.compress()
+        return {
+            "welford": [self.welford.n, self.welford.mean, self.welford.m2],
+            "ewma": [self.ewma.n, self.ewma.mean, self.ewma.var],
+            "centroids": [[round(mean, 6), weight] for mean, weight in self.digest.centroids],
+        }
+
+
+class FundingStatistics:
+    """Statistics of the annualized rate per (exchange, symbol) and of the spread per (symbol, exchange pair).
+
+    A pair is stored once, as the rate of the second minus the rate of the first exchange in name order;
+    the other direction is the negated series, so its z-score is negated and its percentile mirrored.
+    """
+
+    def __init__(self):
+        self.series = defaultdict(SeriesStatistics)
+
+    @staticmethod
+    def rate_key(exchange, symbol):
+        return f"rate|{exchange}|{symbol}"
+
+    @staticmethod
+    def spread_key(symbol, first, second):
+        return f"spread|{symbol}|{first}|{second}"
+
+    def update(self, samples):
+        """Add the FundingSamples of one crawl cycle"""
+        by_symbol = defaultdict(list)
+        for sample in samples:
+            self.series[self.rate_key(sample.exchange, sample.symbol)].update(sample.rate_1y)
+            by_symbol[sample.symbol].append(sample)
+
+        for symbol, symbol_samples in by_symbol.items():
+            symbol_samples.sort(key=lambda sample: sample.exchange)
+            for first, second in combinations(symbol_samples, 2):
+                self.series[self.spread_key(symbol, first.exchange, second.exchange)].update(
+                    second.rate_1y - first.rate_1y)
+
+    def describe_rate(self, exchange, symbol, rate_1y):
+        series = self.series.get(self.rate_key(exchange, symbol))
+        return series.describe(rate_1y) if series else None
+
+    def describe_spread(self, symbol, long_exchange, short_exchange, spread_1y):
+        """Statistics of the spread of going long on one and short on the other exchange"""
+        if long_exchange < short_exchange:
+            series = self.series.get(self.spread_key(symbol, long_exchange, short_exchange))
+            return series.describe(spread_1y) if series else None
+
+        series = self.series.get(self.spread_key(symbol, short_exchange, long_exchange))
+        description = series.describe(-spread_1y) if series else None
+        if description:
+            description.update(zscore=-description["zscore"], percentile=100 - description["percentile"],
+                               mean=-description["mean"])
+        return description
+
+    # ==========================
+    # Checkpoints
+    # ==========================
+    def to_rows(self):
+        """(series, JSON state) of every series"""
+        return [(key, json.dumps(series.state())) for key, series in self.series.items()]
+
+    @classmethod
+    def from_rows(cls, rows):
+        statistics = cls()
+        for key, state in rows:
+            statistics.series[key] = SeriesStatistics(json.loads(state))
+        return statistics
@@ -0,0 +1,214 @@
+import argparse
+import datetime
+import logging
+
+from Database import CYCLE, db, Compaction, create_table, storage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioning and retention for the time series tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    partition = subparsers.add_parser("partition", help="partition the tables by month and create upcoming partitions")
+    partition.add_argument("--months-ahead", type=int, default=3, help="number of future monthly partitions to keep ready")
+
+    retention = subparsers.add_parser("retention", help="compact old raw rows into hourly rows and drop old partitions")
+    retention.add_argument("--compact-after", type=int, default=30, help="compact raw rows older than this many days")
+    retention.add_argument("--drop-after", type=int, default=None, help="drop partitions older than this many days")
+
+    args = parser.parse_args()
+    if storage.name != "mariadb":
+        parser.error("partitioning and retention need the MariaDB storage backend")
+
+    create_table()
+    maintenance = Maintenance()
+    if args.command == "partition":
+        maintenance.partition(months_ahead=args.months_ahead)
+    elif args.command == "retention":
+        maintenance.compact(older_than_days=args.compact_after)
+        if args.drop_after is not None:
+            maintenance.drop_partitions(older_than_days=args.drop_after)
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def next_month(value):
+    return datetime.datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+class Maintenance:
+    """Keeps fundingrate, staking and fundingdata at a flat size and query latency.
+
+    The tables are RANGE partitioned by month on the timestamp, so time filtered queries only touch
+    the partitions of the requested range and old months can be dropped without a DELETE.
+    Raw 5 minute rows older than the retention window are replaced by one time weighted row per hour.
+    """
+    # table -> (series columns, columns averaged over the time each row holds, columns taking the maximum)
+    TABLES = {
+        'fundingrate': (
+            ("symbol_id",),
+            ("fundingRate", "fundingRateAnnualized"),
+            ("`interval`", "fundingDatetime"),
+        ),
+        'staking': (
+            (),
+            ("stakeApy", "sharePrice"),
+            (),
+        ),
+        'fundingdata': (
+            ("symbol_id", "exchange_id"),
+            ("rate", "rate_1y", "`interval`"),
+            ("next_funding",),
+        ),
+    }
+
+    # ==========================
+    # Partitioning
+    # ==========================
+    def partition(self, months_ahead=3):
+        for table in self.TABLES:
+            partitions = self.get_partitions(table)
+            if not partitions:
+                self.convert_to_partitioned(table, months_ahead)
+            else:
+                self.add_future_partitions(table, partitions, months_ahead)
+
+    def get_partitions(self, table):
+        """Monthly partitions of a table as {name: upper bound}, empty if the table is not partitioned"""
+        cursor = db.execute_sql(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = %s
+              AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """, (table,))
+        return {name: description for name, description in cursor.fetchall()}
+
+    def partition_definition(self, month):
+        upper = next_month(month)
+        return f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))"
+
+    def convert_to_partitioned(self, table, months_ahead):
+        oldest = db.execute_sql(f"SELECT MIN(timestamp) FROM {table}").fetchone()[0]
+        month = month_start(oldest or datetime.datetime.utcnow())
+        last_month = month_start(datetime.datetime.utcnow())
+        for _ in range(months_ahead):
+            last_month = next_month(last_month)
+
+        definitions = []
+        while month <= last_month:
+            definitions.append(self.partition_definition(month))
+            month = next_month(month)
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+        logging.info(f"{table}: converting to {len(definitions)} monthly partitions")
+        # the partitioning column has to be part of every unique key
+        db.execute_sql(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+        db.execute_sql(f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(timestamp)) ({', '.join(definitions)})")
+
+    def add_future_partitions(self, table, partitions, months_ahead):
+        existing = {name for name in partitions if name != "pmax"}
+        month = month_start(datetime.datetime.utcnow())
+        definitions = []
+        for _ in range(months_ahead + 1):
+            if f"p{month:%Y%m}" not in existing:
+                definitions.append(self.partition_definition(month))
+            month = next_month(month)
+
+        if definitions:
+            logging.info(f"{table}: adding {len(definitions)} partitions")
+            definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+            db.execute_sql(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+
+    def drop_partitions(self, older_than_days):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+        for table in self.TABLES:
+            for name in self.get_partitions(table):
+                if name == "pmax":
+                    continue
+                month = datetime.datetime.strptime(name[1:], "%Y%m")
+                if next_month(month) <= cutoff:
+                    logging.info(f"{table}: dropping partition {name}")
+                    db.execute_sql(f"ALTER TABLE {table} DROP PARTITION {name}")
+
+    # ==========================
+    # Compaction
+    # ==========================
+    def compact(self, older_than_days):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+        cutoff = cutoff.replace(minute=0, second=0, microsecond=0)
+        for table in self.TABLES:
+            self.compact_table(table, cutoff)
+
+    def compact_table(self, table, cutoff):
+        state = Compaction.get_or_none(Compaction.table_name == table)
+        start = state.compacted_until if state else db.execute_sql(f"SELECT MIN(timestamp) FROM {table}").fetchone()[0]
+        if start is None:
+            return
+        start = start.replace(minute=0, second=0, microsecond=0)
+
+        # one day per transaction keeps locks and undo log small
+        while start < cutoff:
+            end = min(start + datetime.timedelta(days=1), cutoff)
+            with db.atomic():
+                rows = self.compact_window(table, start, end)
+                Compaction.insert(table_name=table, compacted_until=end).on_conflict(
+                    update={Compaction.compacted_until: end}).execute()
+            logging.info(f"{table}: compacted {start} - {end} into {rows} hourly rows")
+            start = end
+
+    def compact_window(self, table, start, end):
+        series, averaged, maximum = self.TABLES[table]
+        keys = ", ".join(series)
+        partition = f"PARTITION BY {', '.join(f'r.{column}' for column in series)} " if series else ""
+        on = " AND ".join(f"l.{column} = r.{column}" for column in series) or "TRUE"
+        latest = f"SELECT {keys + ', ' if series else ''}MAX(timestamp) AS latest_ts FROM {table}"
+        if series:
+            latest += f" GROUP BY {keys}"
+
+        # the raw rows of the window with the seconds each holds within its hour: until the next row, one
+        # cycle past its validity or the end of the hour, like RollingAverages.hourly_means. The hour of a
+        # series' latest row stays raw, the crawler keeps extending the validity of that row by its id.
+        db.execute_sql(f"DROP TEMPORARY TABLE IF EXISTS {table}_compact")
+        db.execute_sql(
+            f"""
+            CREATE TEMPORARY TABLE {table}_compact AS
+            SELECT w.*, GREATEST(TIMESTAMPDIFF(SECOND, w.timestamp,
+                                               LEAST(w.next_ts, w.held_until, w.hour_ts + INTERVAL 1 HOUR)), 1) AS weight
+            FROM (
+                SELECT r.*, {storage.time_bucket("r.timestamp", 3600)} AS hour_ts,
+                       COALESCE(LEAD(r.timestamp) OVER ({partition}ORDER BY r.timestamp), %s) AS next_ts,
+                       COALESCE(r.valid_until, r.timestamp) + INTERVAL {int(CYCLE.total_seconds())} SECOND AS held_until
+                FROM {table} r
+                JOIN ({latest}) l ON {on}
+                WHERE r.timestamp >= %s AND r.timestamp < %s
+                  AND r.timestamp < {storage.time_bucket("l.latest_ts", 3600)}
+            ) w
+            """, (end, start, end))
+        db.execute_sql(f"DELETE r FROM {table} r JOIN {table}_compact c ON c.id = r.id")
+
+        # NULLIF keeps a column without any value NULL instead of dividing by zero
+        columns = [*series, *averaged, *maximum, "valid_until", "snapshot_id", "timestamp"]
+        select = [*series,
+                  *(f"SUM({column} * weight) / NULLIF(SUM(IF({column} IS NULL, 0, weight)), 0)" for column in averaged),
+                  *(f"MAX({column})" for column in maximum),
+                  "MAX(valid_until)", "MAX(snapshot_id)", "hour_ts"]
+        cursor = db.execute_sql(
+            f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT {', '.join(select)}
+            FROM {table}_compact
+            GROUP BY {keys + ', ' if series else ''}hour_ts
+            """)
+        db.execute_sql(f"DROP TEMPORARY TABLE {table}_compact")
+        return cursor.rowcount
+
+if __name__ == '__main__':
+    main()
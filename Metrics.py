@@ -0,0 +1,177 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+# Prometheus text format without an extra dependency, the crawler only needs counters, gauges and histograms
+
+PREFIX = "reya_crawler_"
+DEFAULT_PORT = 9108
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def format_labels(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key, value):
+        return [f"{self.name}{self.format_labels(key)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_value(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self.format_labels(key, [('le', bound)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self.format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{self.format_labels(key)} {cumulative}")
+        return lines
+
+
+# ==========================
+# Crawler metrics
+# ==========================
+REQUEST_LATENCY = Histogram("request_duration_seconds", "Exchange request latency", ("exchange", "method"))
+REQUESTS = Counter("requests_total", "Exchange requests by result (success, empty, error)", ("exchange", "method", "result"))
+RETRIES = Counter("request_retries_total", "Retried exchange requests", ("exchange", "method"))
+CYCLE_DURATION = Gauge("cycle_duration_seconds", "Duration of the last crawl cycle")
+CYCLE_TIMESTAMP = Gauge("cycle_timestamp_seconds", "Unix time the last crawl cycle finished")
+CYCLE_ROWS = Gauge("cycle_rows", "Rows written in the last crawl cycle")
+CYCLE_FAILED_EXCHANGES = Gauge("cycle_failed_exchanges", "Exchanges without any result in the last crawl cycle")
+FUNDING_UPDATED = Gauge("funding_updated_timestamp_seconds", "Unix time of the last funding rate per exchange and symbol",
+                        ("exchange", "symbol"))
+RATE_LIMITED = Counter("rate_limited_total", "429/418 answers per exchange", ("exchange",))
+RATE_LIMIT_WAIT = Counter("rate_limit_wait_seconds_total", "Time spent waiting for the rate limiter", ("exchange",))
+CIRCUIT_STATE = Gauge("circuit_state", "Circuit breaker state per exchange (0 closed, 1 half open, 2 open)", ("exchange",))
+CIRCUIT_REJECTED = Counter("circuit_rejected_total", "Calls skipped because the circuit of the exchange was open", ("exchange",))
+DB_WRITE_LATENCY = Histogram("db_write_duration_seconds", "Database write latency", ("table", "operation"),
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+
+@contextmanager
+def track_request(exchange, method, cycle=None, symbol=None):
+    """Time an exchange request and count its result, the caller can mark it as empty via result["result"].
+    The request is also added to the cycle log if a cycle is given."""
+    result = {"result": "success"}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result["result"] = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        REQUEST_LATENCY.observe(seconds, exchange=exchange, method=method)
+        REQUESTS.inc(exchange=exchange, method=method, result=result["result"])
+        if cycle is not None:
+            cycle.request(exchange, method, seconds, result["result"], symbol)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def start_server(port=None):
+    """Serve /metrics from a background thread, METRICS_PORT=0 disables it"""
+    load_dotenv()
+    port = int(os.getenv("METRICS_PORT", DEFAULT_PORT)) if port is None else port
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "127.0.0.1"), port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"metrics served on http://{server.server_address[0]}:{port}/metrics")
+    return server
@@ -0,0 +1,123 @@
+import email.utils
+import logging
+import threading
+import time
+
+import Metrics
+
+
+class TokenBucket:
+    """Request budget of one exchange, shared by every thread and every ccxt instance of that exchange.
+
+    Tokens refill at `rate` per second up to `capacity`, a request takes as many tokens as its endpoint cost.
+    A 429/418 answer blocks the bucket until Retry-After (or an exponential backoff) and halves the rate,
+    which then grows back step by step while the exchange stays quiet.
+    """
+    RECOVERY_INTERVAL = 30  # seconds without a rate limit answer before the rate grows again
+    RECOVERY_STEP = 0.1  # fraction of the base rate added per recovery interval
+    MIN_RATE_FACTOR = 0.1
+    MAX_BACKOFF = 60
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_penalty = 0.0
+        self.strikes = 0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.rate < self.base_rate and now - self.last_penalty >= self.RECOVERY_INTERVAL:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * self.RECOVERY_STEP)
+            self.last_penalty = now
+            self.strikes = 0
+
+    def acquire(self, cost=1):
+        """Take the tokens for one request and wait until they are available"""
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            # tokens may go negative: the request reserves its place and waits for the refill outside the lock
+            self.tokens -= cost
+            wait = max(-self.tokens / self.rate, self.blocked_until - now, 0)
+        if wait > 0:
+            Metrics.RATE_LIMIT_WAIT.inc(wait, exchange=self.name)
+            time.sleep(wait)
+
+    def penalize(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self.strikes += 1
+            backoff = retry_after if retry_after is not None else min(self.MAX_BACKOFF, 2 ** self.strikes)
+            self.blocked_until = max(self.blocked_until, now + backoff)
+            self.rate = max(self.base_rate * self.MIN_RATE_FACTOR, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            self.last_penalty = now
+        Metrics.RATE_LIMITED.inc(exchange=self.name)
+        logging.warning(f"{self.name}: rate limited, pausing {backoff:.1f}s, rate now {self.rate:.2f}/s")
+
+
+# exchange id -> (requests per second, burst), overrides the rate derived from ccxt's rateLimit
+RATE_LIMITS = {}
+DEFAULT_BURST = 5
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(exchange):
+    with _buckets_lock:
+        if exchange.id not in _buckets:
+            # ccxt's rateLimit is the number of milliseconds per cost unit
+            rate, burst = RATE_LIMITS.get(exchange.id, (1000 / (exchange.rateLimit or 1000), DEFAULT_BURST))
+            _buckets[exchange.id] = TokenBucket(exchange.id, rate, burst)
+        return _buckets[exchange.id]
+
+
+def retry_after_seconds(headers):
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def install(exchange):
+    """Route the throttling of a ccxt exchange through the shared bucket of its exchange id.
+
+    ccxt calls throttle(cost) before every request with the cost of the endpoint (the 'cost' of the
+    Entry definitions), handle_errors sees the status and headers of every failed response.
+    """
+    if getattr(exchange, "rate_limiter", None) is not None:
+        return exchange
+    bucket = bucket_for(exchange)
+    handle_errors = exchange.handle_errors
+
+    def throttle(cost=None):
+        bucket.acquire(1 if cost is None else cost)
+
+    def handle_rate_limit(code, reason, url, method, headers, *args):
+        if code in (429, 418):
+            bucket.penalize(retry_after_seconds(headers))
+        return handle_errors(code, reason, url, method, headers, *args)
+
+    exchange.enableRateLimit = True
+    exchange.throttle = throttle
+    exchange.handle_errors = handle_rate_limit
+    exchange.rate_limiter = bucket
+    return exchange
+
+
+def install_all(exchanges):
+    for exchange in exchanges.values():
+        install(exchange)
+    return exchanges
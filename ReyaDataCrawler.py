@@ -1,18 +1,24 @@
 import datetime
 import logging
-import os
-import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 
 import ccxt
-import pandas as pd
 import requests
 from ccxt_wrapper.Reya import Reya
 from sdk.reya_rest_api import TradingConfig, ReyaTradingClient
 
-from dotenv import load_dotenv
-
+import CircuitBreaker
+import CycleLog
+import Metrics
+import RateLimiter
+import SnapshotApi
+from RollingAverages import RollingAverages
+from SnapshotExport import SnapshotExport
+from SymbolUniverse import SymbolUniverse
+import FundingNormalizer
+from FundingStatistics import FundingStatistics
+from FundingSample import RawFunding, ArbitrageOpportunity
 from Telegram import Telegram
 from pages.exchanges.edgeX import EdgeX
 from pages.exchanges.lighter import Lighter
@@ -21,75 +27,29 @@ from datetime import datetime as dt
 # Set up logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
-# Create a logger for this module
-from peewee import (
-    Model, CharField, DateTimeField, DecimalField, AutoField, FloatField, SQL
-)
-from playhouse.mysql_ext import MariaDBConnectorDatabase
-
-# Load environment variables
-load_dotenv()
-
-# Connect to MariaDB
-db = MariaDBConnectorDatabase(
-    os.getenv("DB_SCHEMA"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST", "localhost"),
-    port=int(os.getenv("DB_PORT", 3306)),
+from Database import (
+    db, Symbol, Snapshot, FundingRate, Staking, FundingData, StatisticsCheckpoint, create_table, bulk_insert,
+    extend_validity, upsert
 )
 
 
-class BaseModel(Model):
-    class Meta:
-        database = db
-
-
-class FundingRate(BaseModel):
-    id = AutoField()
-    symbol = CharField(max_length=32)
-    ticker = CharField(max_length=64, null=True)
-    fundingRate = DecimalField(max_digits=20, decimal_places=10, null=True)
-    interval = CharField(max_length=16, null=True)
-    fundingDatetime = CharField(max_length=64, null=True)
-    fundingRateAnnualized = DecimalField(max_digits=20, decimal_places=10, null=True)
-    timestamp = DateTimeField()
-
-
-class Staking(BaseModel):
-    id = AutoField()
-    # Add staking metrics
-    stakeApy = DecimalField(max_digits=20, decimal_places=10, null=True)
-    sharePrice = DecimalField(max_digits=36, decimal_places=18, null=True)
-    timestamp = DateTimeField()
-
-
-class FundingData(BaseModel):
-    symbol = CharField()
-    exchange = CharField()
-    rate = FloatField()
-    rate_1y = FloatField()
-    next_funding = CharField()
-    interval = FloatField()
-    timestamp = DateTimeField()
-
-
-def create_table():
-    # Create table if not exists
-    db.connect()
-    db.create_tables([FundingRate, Staking, FundingData])
-
-
 def main():
+    Metrics.start_server()
+    SnapshotApi.start_server()
     ReyaDataCrawler().run()
 
 
+# columns that identify a series of a table, the key of the crawler's last written rows
+SERIES_COLUMNS = {FundingData: ("symbol_id", "exchange_id"), FundingRate: ("symbol_id",), Staking: ()}
+
+
 class ReyaDataCrawler:
     top3_symbols = ["BTC/RUSD:RUSD", "ETH/RUSD:RUSD", "SOL/RUSD:RUSD"]
     SYMBOLS = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT', 'HYPE/USDT:USDT', 'ENA/USDT:USDT', 'TAO/USDT:USDT', "ARB/USDT:USDT", "LTC/USDT:USDT"]  # predefined subset, since the x scales fast big
 
     # --- Exchange configurations ---
-    ALL_EXCHANGES = {
+    # every instance of an exchange shares one request budget, see RateLimiter
+    ALL_EXCHANGES = RateLimiter.install_all({
         'binance': ccxt.binance({'enableRateLimit': True}),
         'okx': ccxt.okx({'enableRateLimit': True}),
         'bybit': ccxt.bybit({'enableRateLimit': True}),
@@ -100,14 +60,36 @@ class ReyaDataCrawler:
         'reya': Reya({'enableRateLimit': True}),
         "lighter": Lighter({'enableRateLimit': True}),
         "edgex": EdgeX({'enableRateLimit': True})
-    }
+    })
     # Jupiter, DyDx, orderly, avantis, myx, radium, drift, ligther
 
     TELEGRAM_NOTIFY = True
 
+    # crawl every symbol listed on Reya and at least one other exchange instead of the SYMBOLS subset
+    FULL_UNIVERSE = False
+
+    # base -> native symbol per exchange, conventional symbol names are used until it is loaded
+    universe = None
+
+    # only write a row when the values changed, otherwise extend the validity of the last row
+    DELTA_WRITES = True
+
+    # z-score, percentile and EWMA per rate and spread, checkpointed every STATISTICS_CHECKPOINT_CYCLES cycles
+    statistics = FundingStatistics()
+    STATISTICS_CHECKPOINT_CYCLES = 12
+
+    # only alert spreads at least this many standard deviations above their EWMA, None alerts every spread
+    ALERT_MIN_ZSCORE = None
+
+    # write latest.arrow for the arbitrage page after every cycle, the Parquet export runs as a scheduled job
+    EXPORT_LATEST = False
+
     # Store last sent arbitrages in memory (dict)
     last_sent = {}
 
+    # Last persisted row per series: (table, *series ids) -> (row id, compared values)
+    last_written = {}
+
     # Track last funding rate summary sent
     last_funding_summary_sent = None
     last_fag = None
@@ -127,37 +109,68 @@ class ReyaDataCrawler:
         })
         client = ReyaTradingClient()
         self.exchange.withClient(client)
+        RateLimiter.install(self.exchange)
         self.telegram = Telegram()
 
         # load markets
         self.exchange.load_markets()
-        #self.init_symbols()
+        self.init_symbols()
 
     def init_symbols(self):
-        # base are all reya symbols that are also available on binance
-        markets = self.exchange.load_markets()
-        market_names = list(markets.keys())
-        market_names = [name.replace("RUSD", "USDT") for name in market_names]
-        logging.info(f"Markets found: {market_names}")
-
-        binance_markets = self.ALL_EXCHANGES['binance'].load_markets()
-        binance_symbols = set(binance_markets.keys())
-
-        # keep only those symbols that exist on Binance
-        common_symbols = [s for s in market_names if s in binance_symbols]
-        self.SYMBOLS = common_symbols
-        logging.info(f"{len(self.SYMBOLS)} SYMBOLS found on reya and binance: {self.SYMBOLS}")
+        self.universe = SymbolUniverse(self.ALL_EXCHANGES).load()
+        if self.FULL_UNIVERSE:
+            # base are all reya symbols that are also listed on at least one other exchange
+            bases = self.universe.bases()
+            if bases:
+                self.SYMBOLS = [f"{base}/USDT:USDT" for base in bases]
+            logging.info(f"{len(self.SYMBOLS)} SYMBOLS found on reya and other exchanges: {self.SYMBOLS}")
+            return
+
+        # the configured symbols are crawled everywhere, a venue without the market only logs it
+        bases = [self.extract_base_symbol(symbol) for symbol in self.SYMBOLS]
+        for exchange_name in self.ALL_EXCHANGES:
+            missing = self.universe.missing_on(exchange_name, bases)
+            if missing:
+                logging.warning(f"{exchange_name} does not list the configured symbols {missing}")
+
+    def crawl_symbols(self, exchange_name, exchange):
+        """(base, native symbol) pairs to fetch from an exchange"""
+        bases = [self.extract_base_symbol(symbol) for symbol in self.SYMBOLS]
+        if self.universe is None:
+            return [(base, SymbolUniverse.conventional_symbol(exchange, base)) for base in bases]
+        return self.universe.symbols_on(exchange_name, bases, keep_unlisted=not self.FULL_UNIVERSE)
 
     def run(self):
+        rolling_averages = RollingAverages()
+        self.statistics = self.load_statistics()
         while True:
             print("fetch reya funding rates:")
             try:
-                self.fetching_reya_funding_and_apy()
-                self.fetch_funding_rates()
+                snapshot = self.start_snapshot()
+                with self.cycle.stage("reya"):
+                    self.fetching_reya_funding_and_apy(snapshot)
+                self.fetch_funding_rates(snapshot)
+                self.finish_snapshot(snapshot)
+
+                # completed hours go into the 7D/30D averages the history page reads
+                with self.cycle.stage("rollup"):
+                    try:
+                        rolling_averages.update()
+                    except Exception as e:
+                        logging.error(f"Error updating rolling averages: {e}")
+
+                if self.EXPORT_LATEST:
+                    with self.cycle.stage("export"):
+                        try:
+                            SnapshotExport().export_latest()
+                        except Exception as e:
+                            logging.error(f"Error exporting the latest rates: {e}")
 
                 # Check if we should send the 30-minute funding summary
-                self.send_funding_summary_if_needed()
-                self.send_fear_and_greed_and_reya_apy_if_needed()
+                with self.cycle.stage("notifications"):
+                    self.send_funding_summary_if_needed()
+                    self.send_fear_and_greed_and_reya_apy_if_needed()
+                CycleLog.write(self.cycle)
 
             except Exception as e:
                 print(f"Error occurred: {e}")
@@ -166,6 +179,30 @@ class ReyaDataCrawler:
             print("sleep 5min")
             time.sleep(300)
 
+    def start_snapshot(self):
+        """Open a new crawl cycle, all rows of the cycle share its id and timestamp"""
+        self.snapshot_started = time.monotonic()
+        self.snapshot_succeeded = set()
+        self.snapshot_failed = set()
+        self.snapshot_rows = 0
+        snapshot = Snapshot.create(timestamp=datetime.datetime.utcnow().replace(microsecond=0))
+        self.cycle = CycleLog.Cycle(snapshot.id)
+        return snapshot
+
+    def finish_snapshot(self, snapshot):
+        snapshot.duration = time.monotonic() - self.snapshot_started
+        snapshot.exchanges_succeeded = ",".join(sorted(self.snapshot_succeeded))
+        # an exchange counts as failed only if none of its symbols could be fetched
+        snapshot.exchanges_failed = ",".join(sorted(self.snapshot_failed - self.snapshot_succeeded))
+        snapshot.rows = self.snapshot_rows
+        snapshot.save()
+        Metrics.CYCLE_DURATION.set(snapshot.duration)
+        Metrics.CYCLE_TIMESTAMP.set(time.time())
+        Metrics.CYCLE_ROWS.set(snapshot.rows)
+        Metrics.CYCLE_FAILED_EXCHANGES.set(len(self.snapshot_failed - self.snapshot_succeeded))
+        logging.info(f"snapshot {snapshot.id} finished in {snapshot.duration:.1f}s, {snapshot.rows} rows, "
+                     f"failed: {snapshot.exchanges_failed or '-'}")
+
     def send_funding_summary_if_needed(self):
         """Send a funding rate summary every 30 minutes for BTC, ETH, SOL"""
         now = datetime.datetime.utcnow()
@@ -253,34 +290,36 @@ class ReyaDataCrawler:
         }
         summary_data = {symbol: [] for symbol in top_symbols}
 
-        def fetch_single_for_summary(exchange_name, exchange, symbol, max_retries=3, retry_delay=1):
+        def fetch_single_for_summary(exchange_name, exchange, symbol, max_retries=3):
+            # retries run right away through the breaker and the rate limiter, which do the backing off,
+            # a thread does not sleep on a failing venue and stops as soon as its circuit opens
+            breaker = CircuitBreaker.for_exchange(exchange_name)
             for attempt in range(max_retries):
+                if not breaker.allow():
+                    logging.warning(f"Skipping {exchange_name} {symbol}, circuit is {breaker.state}")
+                    return None
                 try:
-                    factor = 100
                     fetch_symbol = f"{symbol}/USDT:USDT"
 
                     if exchange.name == "Hyperliquid":
                         fetch_symbol = f"{symbol}/USDC:USDC"
                     elif exchange.name == "Reya":
                         fetch_symbol = f"{symbol}/RUSD:RUSD"
-                        factor = 1
-
-                    funding_rate = exchange.fetch_funding_rate(fetch_symbol)
-
-                    if funding_rate and 'fundingRate' in funding_rate:
-                        rate = funding_rate['fundingRate']
-                        interval = float((funding_rate.get('interval') or '8').replace("h", ""))
-                        if rate is not None:
-                            return {
-                                'exchange': exchange.name,
-                                'rate_1h': float(rate) * factor / interval,
-                                'rate_1y': (float(rate) / interval) * 24 * factor * 365,
-                            }
+
+                    with Metrics.track_request(exchange_name, "fetch_funding_rate",
+                                               cycle=self.cycle, symbol=fetch_symbol) as request, breaker.track():
+                        funding_rate = exchange.fetch_funding_rate(fetch_symbol)
+                        if not funding_rate or funding_rate.get('fundingRate') is None:
+                            request["result"] = "empty"
+
+                    if funding_rate and funding_rate.get('fundingRate') is not None:
+                        return RawFunding(symbol, exchange.name, float(funding_rate['fundingRate']),
+                                          funding_rate.get('interval'))
                 except Exception as e:
                     if attempt < max_retries - 1:
+                        Metrics.RETRIES.inc(exchange=exchange_name, method="fetch_funding_rate")
                         logging.warning(
-                            f"Error fetching {exchange_name} {symbol} (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {retry_delay}s...")
-                        time.sleep(retry_delay)
+                            f"Error fetching {exchange_name} {symbol} (attempt {attempt + 1}/{max_retries}): {e}. Retrying...")
                     else:
                         logging.error(f"Error fetching {exchange_name} {symbol} after {max_retries} attempts: {e}")
 
@@ -291,12 +330,12 @@ class ReyaDataCrawler:
             futures = []
             for symbol in top_symbols:
                 for exchange_name, exchange in SUMMARY_EXCHANGES.items():
-                    futures.append((symbol, executor.submit(fetch_single_for_summary, exchange_name, exchange, symbol)))
+                    futures.append(executor.submit(fetch_single_for_summary, exchange_name, exchange, symbol))
 
-            for symbol, future in futures:
-                result = future.result()
-                if result:
-                    summary_data[symbol].append(result)
+            raws = [raw for raw in (future.result() for future in futures) if raw]
+
+        for sample in FundingNormalizer.normalize(raws):
+            summary_data[sample.symbol].append(sample)
 
         # Format and send message
         message = self.format_funding_summary(summary_data)
@@ -316,11 +355,11 @@ class ReyaDataCrawler:
             message += f"<b>{symbol}</b>\n"
 
             # Sort by 1h rate
-            rates_sorted = sorted(rates, key=lambda x: x['rate_1y'], reverse=True)
+            rates_sorted = sorted(rates, key=lambda sample: sample.rate_1y, reverse=True)
 
-            for rate_data in rates_sorted:
-                rate_1y = rate_data['rate_1y']
-                exchange = rate_data['exchange']
+            for sample in rates_sorted:
+                rate_1y = sample.rate_1y
+                exchange = sample.exchange
 
                 # Add emoji based on rate direction
                 emoji = "🔴" if rate_1y < -1 else "🟢" if rate_1y > 1 else "⚪"
@@ -332,27 +371,34 @@ class ReyaDataCrawler:
 
         return message if len(summary_data) > 0 else None
 
-    def fetching_reya_funding_and_apy(self):
-        apy = self.exchange.get_current_stake_apy()
+    def fetching_reya_funding_and_apy(self, snapshot):
+        with Metrics.track_request("reya", "get_current_stake_apy", cycle=self.cycle):
+            apy = self.exchange.get_current_stake_apy()
         stakeApy = apy['apy']
         price = apy['share_price']
-        Staking.create(timestamp=datetime.datetime.utcnow(),
-                       stakeApy=stakeApy,
-                       sharePrice=price)
+        self.write_deltas(Staking, [((stakeApy, price), dict(
+            timestamp=snapshot.timestamp,
+            snapshot_id=snapshot.id,
+            stakeApy=stakeApy,
+            sharePrice=price))], snapshot)
         logging.info(f"stake APY: {stakeApy}, share price: {price}")
+        rates = []
         for symbol in self.top3_symbols:
             try:
-                funding = self.exchange.fetch_funding_rate(symbol)
+                with Metrics.track_request("reya", "fetch_funding_rate", cycle=self.cycle, symbol=symbol):
+                    funding = self.exchange.fetch_funding_rate(symbol)
+                Metrics.FUNDING_UPDATED.set(time.time(), exchange="reya", symbol=symbol)
 
-                FundingRate.create(
-                    timestamp=datetime.datetime.utcnow(),
-                    symbol=symbol,
-                    ticker=funding['info'].get('ticker', ''),
+                interval = funding.get('interval')
+                fields = dict(
+                    symbol_id=Symbol.id_for(symbol, ticker=funding['info'].get('ticker')),
                     fundingRate=funding['info'].get('fundingRate', None),
-                    interval=funding.get('interval', ''),
-                    fundingDatetime=funding.get('fundingDatetime', ''),
+                    interval=float(interval.replace("h", "")) if interval else None,
+                    fundingDatetime=funding.get('fundingTimestamp'),
                     fundingRateAnnualized=funding['info'].get('fundingRateAnnualized', None),
                 )
+                rates.append((tuple(fields.values()),
+                              dict(timestamp=snapshot.timestamp, snapshot_id=snapshot.id, **fields)))
 
                 logging.info(f"[{datetime.datetime.utcnow().isoformat()}] {symbol} funding rate: "
                              f"{funding['info'].get('fundingRate', '')}@{funding.get('interval', '')}, "
@@ -360,87 +406,109 @@ class ReyaDataCrawler:
 
             except Exception as e:
                 logging.error(f"Error fetching {symbol}: {e}")
+        self.write_deltas(FundingRate, rates, snapshot)
 
-    def fetch_funding_rates(self):
+    def fetch_funding_rates(self, snapshot):
         """Fetch funding rates from all exchanges in parallel"""
-        funding_data = []
 
-        def fetch_single(exchange_name, exchange, symbol, sem):
-            with sem:  # allow only 2 concurrent tasks per exchange
-                try:
-                    logging.info(f"Fetching {exchange_name}/{symbol}")
-                    factor = 100
-                    if exchange.name == "Hyperliquid":
-                        symbol = symbol.replace("USDT", "USDC")
-                    elif exchange.name == "Reya":
-                        symbol = symbol.replace("USDT", "RUSD")
-                        factor = 1
+        def fetch_single(exchange_name, exchange, base, symbol):
+            # a venue that keeps failing is skipped until its circuit probes it again
+            breaker = CircuitBreaker.for_exchange(exchange_name)
+            if not breaker.allow():
+                self.snapshot_failed.add(exchange.name)
+                return None
+            try:
+                logging.info(f"Fetching {exchange_name}/{symbol}")
 
+                with Metrics.track_request(exchange_name, "fetch_funding_rate",
+                                           cycle=self.cycle, symbol=symbol) as request, breaker.track():
                     funding_rate = exchange.fetch_funding_rate(symbol)
-
-                    if funding_rate and 'fundingRate' in funding_rate:
-                        rate = funding_rate['fundingRate']
-                        interval = float((funding_rate.get('interval') or '8').replace("h", ""))
-                        if rate is not None and rate != 0:
-                            return {
-                                'Symbol': self.extract_base_symbol(symbol),
-                                'Exchange': exchange.name,
-                                'Rate': float(rate) * factor / interval,
-                                'Yearly Rate': (float(rate) / interval) * 24 * factor * 365,
-                                'Next Funding': funding_rate.get('fundingDatetime') or 'N/A',
-                                'Interval': interval,
-                            }
-                except Exception as e:
-                    logging.error(f"Error fetching {exchange_name} {symbol} rate: {e}")
-                return None
+                    if not funding_rate or funding_rate.get('fundingRate') is None:
+                        request["result"] = "empty"
+
+                if funding_rate and 'fundingRate' in funding_rate:
+                    rate = funding_rate['fundingRate']
+                    self.snapshot_succeeded.add(exchange.name)
+                    Metrics.FUNDING_UPDATED.set(time.time(), exchange=exchange_name, symbol=base)
+                    if rate is not None and rate != 0:
+                        return RawFunding(
+                            symbol=base,
+                            exchange=exchange.name,
+                            funding_rate=float(rate),
+                            interval=funding_rate.get('interval'),
+                            next_funding=funding_rate.get('fundingTimestamp'),
+                        )
+            except Exception as e:
+                self.snapshot_failed.add(exchange.name)
+                logging.error(f"Error fetching {exchange_name} {symbol} rate: {e}")
+            return None
 
         tasks = []
-        semaphores = {ex: threading.Semaphore(2) for ex in self.ALL_EXCHANGES}  # max 2 per exchange
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with self.cycle.stage("exchanges"), ThreadPoolExecutor(max_workers=10) as executor:
+            # requests per exchange are paced by the shared rate limiter
             for exchange_name, exchange in self.ALL_EXCHANGES.items():
-                sem = semaphores[exchange_name]
-                for symbol in self.SYMBOLS:
-                    tasks.append(executor.submit(fetch_single, exchange_name, exchange, symbol, sem))
-
-            for future in as_completed(tasks):
-                result = future.result()
-                if result:
-                    df = pd.DataFrame([result])  # create a 1-row DataFrame
-                    self.insert_from_dataframe(df)  # insert immediately
-                    funding_data.append(result)
-
-        df = pd.DataFrame(funding_data)
-        # self.insert_from_dataframe(df)
-        if self.TELEGRAM_NOTIFY:
-            best, all = self.find_best_arbitrage_opportunities(df)
-            for _, row in best.iterrows():
-                if not self.should_send(row):
-                    continue  # Skip if still in cooldown
-                try:
-                    self.sendMessage(row)
-                except Exception as e:
-                    logging.error(f"Error sending message: {e}")
+                for base, symbol in self.crawl_symbols(exchange_name, exchange):
+                    tasks.append(executor.submit(fetch_single, exchange_name, exchange, base, symbol))
 
-    def sendMessage(self, row):
+            raws = [raw for raw in (future.result() for future in tasks) if raw]
+
+        # one normalization pass and one transaction for the whole cycle
+        with self.cycle.stage("normalize"):
+            funding_data = FundingNormalizer.normalize(raws)
+        self.insert_samples(funding_data, snapshot)
+
+        opportunities = None
+        if self.TELEGRAM_NOTIFY:
+            with self.cycle.stage("arbitrage"):
+                best, opportunities = self.find_best_arbitrage_opportunities(funding_data)
+            with self.cycle.stage("notifications"):
+                for opportunity in best:
+                    if not self.should_send(opportunity):
+                        continue  # Skip if still in cooldown
+                    try:
+                        self.sendMessage(opportunity)
+                    except Exception as e:
+                        logging.error(f"Error sending message: {e}")
+
+        # after the alerts, so they compare the spreads with the previous cycles only
+        with self.cycle.stage("statistics"):
+            self.statistics.update(funding_data)
+            if snapshot.id % self.STATISTICS_CHECKPOINT_CYCLES == 0:
+                self.save_statistics()
+
+        # readers of the snapshot api get the new cycle without querying the database
+        with self.cycle.stage("api"):
+            SnapshotApi.STORE.publish(snapshot, funding_data, opportunities)
+
+    def sendMessage(self, opportunity):
         formatted = f"""Arbitrage Opportunity
-🚀 <b>{row['Symbol']}</b>
+🚀 <b>{opportunity.symbol}</b>
                 
-📈 <b>Long</b> on <b>{row['Long Exchange']}</b>  
-at <b>{row['Long Rate (1h)']:.4f}% (1h)</b> | <b>{row['Long Rate (1Y)']:.2f}% (1Y)</b>
+📈 <b>Long</b> on <b>{opportunity.long_exchange}</b>  
+at <b>{opportunity.long_rate:.4f}% (1h)</b> | <b>{opportunity.long_rate_1y:.2f}% (1Y)</b>
                 
-📉 <b>Short</b> on <b>{row['Short Exchange']}</b>  
-at <b>{row['Short Rate (1h)']:.4f}% (1h)</b> | <b>{row['Short Rate (1Y)']:.2f}% (1Y)</b>
+📉 <b>Short</b> on <b>{opportunity.short_exchange}</b>  
+at <b>{opportunity.short_rate:.4f}% (1h)</b> | <b>{opportunity.short_rate_1y:.2f}% (1Y)</b>
 
-🔎 <b>Spread:</b> <b>{row['Spread (1h)']:.4f}% (1h)</b> | <b>{row['Spread (1Y)']:.2f}% (1Y)</b>
+🔎 <b>Spread:</b> <b>{opportunity.spread:.4f}% (1h)</b> | <b>{opportunity.spread_1y:.2f}% (1Y)</b>
 """
+        statistics = self.spread_statistics(opportunity)
+        if statistics:
+            formatted += (f"📊 <b>z-score:</b> {statistics['zscore']:+.2f} | <b>percentile:</b> {statistics['percentile']:.0f}% "
+                          f"| <b>mean:</b> {statistics['mean']:.2f}% (1Y)\n")
         self.telegram.sendMessage(formatted)
 
-    def should_send(self, row, cooldown_hours=24):
+    def should_send(self, opportunity, cooldown_hours=24):
         """Check if we should send this arbitrage opportunity via telegram."""
-        key = (row['Symbol'], row['Long Exchange'], row['Short Exchange'])
+        key = (opportunity.symbol, opportunity.long_exchange, opportunity.short_exchange)
         now = datetime.datetime.utcnow()
 
+        if self.ALERT_MIN_ZSCORE is not None:
+            statistics = self.spread_statistics(opportunity)
+            if statistics and statistics["zscore"] < self.ALERT_MIN_ZSCORE:
+                return False  # not unusual for this pair
+
         if key not in self.last_sent:
             self.last_sent[key] = now
             return True
@@ -452,87 +520,77 @@ at <b>{row['Short Rate (1h)']:.4f}% (1h)</b> | <b>{row['Short Rate (1Y)']:.2f}%
 
         return False
 
+    def spread_statistics(self, opportunity):
+        return self.statistics.describe_spread(opportunity.symbol, opportunity.long_exchange,
+                                               opportunity.short_exchange, opportunity.spread_1y)
+
+    def load_statistics(self):
+        rows = StatisticsCheckpoint.select(StatisticsCheckpoint.series, StatisticsCheckpoint.state).tuples()
+        statistics = FundingStatistics.from_rows(rows)
+        logging.info(f"statistics of {len(statistics.series)} series restored")
+        return statistics
+
+    def save_statistics(self):
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        rows = [dict(series=key, state=state, updated=now) for key, state in self.statistics.to_rows()]
+        with Metrics.DB_WRITE_LATENCY.time(table="statisticscheckpoint", operation="checkpoint"):
+            upsert(StatisticsCheckpoint, rows)
+
     def extract_base_symbol(self, symbol):
         return symbol.replace('/USDT:USDT', '').replace("/USDC:USDC", "").replace("/RUSD:RUSD", "")
 
-    def insert_from_dataframe(self, df: pd.DataFrame):
-        logging.info("Inserting from dataframe")
-        with db.atomic():
-            for _, row in df.iterrows():
-                FundingData.create(
-                    symbol=row["Symbol"],
-                    exchange=row["Exchange"],
-                    rate=row["Rate"],
-                    rate_1y=row["Yearly Rate"],
-                    next_funding=row["Next Funding"],
-                    interval=row["Interval"],
-                    timestamp=datetime.datetime.utcnow()
-                )
+    def insert_samples(self, samples, snapshot):
+        self.write_deltas(FundingData, [
+            ((sample.rate, sample.interval, sample.next_funding), FundingData.row(
+                sample.symbol,
+                sample.exchange,
+                rate=sample.rate,
+                rate_1y=sample.rate_1y,
+                next_funding=sample.next_funding,
+                interval=sample.interval,
+                timestamp=snapshot.timestamp,
+                snapshot_id=snapshot.id
+            )) for sample in samples], snapshot)
+
+    def write_deltas(self, model, series, snapshot):
+        """Insert the rows of the series whose values changed, only extend the validity of the last row of the others.
+
+        series are (compared values, row fields) pairs; one UPDATE and one batched INSERT per table and cycle.
+        """
+        table = model._meta.table_name
+        columns = SERIES_COLUMNS[model]
+        unchanged, changed = [], {}
+        for values, fields in series:
+            key = (table, *(fields[column] for column in columns))
+            last = self.last_written.get(key)
+            if self.DELTA_WRITES and last is not None and last[1] == values:
+                unchanged.append(last[0])
+            else:
+                changed[key] = (values, dict(fields, valid_until=snapshot.timestamp))
+
+        with self.cycle.stage("db_write"), db.atomic():
+            if unchanged:
+                with Metrics.DB_WRITE_LATENCY.time(table=table, operation="extend"):
+                    extend_validity(model, unchanged, snapshot.timestamp)
+            if changed:
+                with Metrics.DB_WRITE_LATENCY.time(table=table, operation="insert"):
+                    bulk_insert(model, [fields for _, fields in changed.values()])
+                    # the ids of the new rows, a table is written once per snapshot
+                    inserted = (model.select(model.id, *(getattr(model, column) for column in columns))
+                                .where(model.snapshot_id == snapshot.id).tuples())
+                for row_id, *series_ids in inserted:
+                    key = (table, *series_ids)
+                    if key in changed:
+                        self.last_written[key] = (row_id, changed[key][0])
+        self.snapshot_rows += len(changed)
 
     # ==========================
     # Arbitrage Detection
     # ==========================
-    def find_best_arbitrage_opportunities(self, df):
+    def find_best_arbitrage_opportunities(self, samples):
+        """Best opportunity per symbol with Reya on one side, and every positive/negative pair"""
         logging.info(f"Finding best arbitrage opportunities")
-        best_results = []
-        all_results = []
-        for symbol in df["Symbol"].unique():
-            sub = df[df["Symbol"] == symbol]
-            positives = sub[sub["Rate"] > 0]
-            negatives = sub[sub["Rate"] < 0]
-
-            if positives.empty or negatives.empty:
-                continue  # no arbitrage possible for this symbol
-
-            # Find max positive & min negative
-            best_pos = positives.loc[positives["Rate"].idxmax()]
-            best_neg = negatives.loc[negatives["Rate"].idxmin()]
-
-            # ✅ only keep if Reya is involved on either side
-            if "reya" in (best_pos["Exchange"].lower(), best_neg["Exchange"].lower()):
-                # # Compare all positive vs negative exchanges
-                # for _, pos in positives.iterrows():
-                #     for _, neg in negatives.iterrows():
-                #         best_results.append({
-                #             "Symbol": symbol,
-                #             "Long Exchange": neg["Exchange"],
-                #             "Long Rate": neg["Rate"],
-                #             "Short Exchange": pos["Exchange"],
-                #             "Short Rate": pos["Rate"],
-                #             "Spread": pos["Rate"] - neg["Rate"]
-                #         })
-                best_results.append({
-                    "Symbol": symbol,
-                    "Long Exchange": best_neg["Exchange"],
-                    "Long Rate (1h)": best_neg["Rate"],
-                    "Long Rate (1Y)": best_neg["Yearly Rate"],
-                    "Short Exchange": best_pos["Exchange"],
-                    "Short Rate (1h)": best_pos["Rate"],
-                    "Short Rate (1Y)": best_pos["Yearly Rate"],
-                    "Spread (1h)": best_pos["Rate"] - best_neg["Rate"],
-                    "Spread (1Y)": best_pos["Yearly Rate"] - best_neg["Yearly Rate"]
-
-                })
-
-            # Compare ALL positives vs negatives
-            for _, pos in positives.iterrows():
-                for _, neg in negatives.iterrows():
-                    all_results.append({
-                        "Symbol": symbol,
-                        "Long Exchange": neg["Exchange"],
-                        "Long Rate (1h)": neg["Rate"],
-                        "Long Rate (1Y)": neg["Yearly Rate"],
-                        "Short Exchange": pos["Exchange"],
-                        "Short Rate (1h)": pos["Rate"],
-                        "Short Rate (1Y)": pos["Yearly Rate"],
-                        "Spread (1h)": pos["Rate"] - neg["Rate"],
-                        "Spread (1Y)": pos["Yearly Rate"] - neg["Yearly Rate"],
-                    })
-        logging.info(f"sort")
-        all_results = pd.DataFrame(all_results).sort_values(by="Spread (1h)", ascending=False)
-        best_results = pd.DataFrame(best_results).sort_values(by="Spread (1h)", ascending=False)
-        return pd.DataFrame(best_results), pd.DataFrame(all_results)
-
+        return ArbitrageOpportunity.find(samples)
 
 if __name__ == '__main__':
     create_table()
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import logging
+from collections import defaultdict, deque
+
+from peewee import fn
+
+from Database import CYCLE, FundingRate, Staking, RollingAverage, create_table, upsert
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the hourly 7D/30D rolling averages of funding and APY")
+    parser.add_argument("--rebuild", action="store_true", help="drop the stored averages and recompute the whole history")
+    args = parser.parse_args()
+
+    create_table()
+    averages = RollingAverages()
+    if args.rebuild:
+        RollingAverage.delete().execute()
+    averages.update()
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class RunningMean:
+    """Mean of the hourly values of the last `hours` hours, kept as a running sum"""
+
+    def __init__(self, hours):
+        self.window = datetime.timedelta(hours=hours)
+        self.values = deque()
+        self.sum = 0.0
+
+    def add(self, hour, value):
+        self.values.append((hour, value))
+        self.sum += value
+        while self.values[0][0] <= hour - self.window:
+            self.sum -= self.values.popleft()[1]
+        return self.sum / len(self.values)
+
+
+class RollingAverages:
+    """Hourly time weighted means of the Reya funding rates and the staking APY, with trailing 7 and
+    30 day averages over those hours.
+
+    Only completed hours after the last stored one are computed, the running sums of every series are
+    restored from the stored hourly means of the last 30 days, so an update costs a few rows per cycle.
+    """
+    WINDOWS = {"avg_7d": 7 * 24, "avg_30d": 30 * 24}
+    CHUNK = datetime.timedelta(days=7)
+
+    # series name -> (model, value column, has symbol)
+    SERIES = {
+        "funding": (FundingRate, FundingRate.fundingRateAnnualized, True),
+        "staking": (Staking, Staking.stakeApy, False),
+    }
+
+    def __init__(self):
+        self.running = {}  # (series, symbol_id) -> {window column: RunningMean}
+
+    def update(self, until=None):
+        until = floor_hour(until or datetime.datetime.utcnow())
+        written = 0
+        for series in self.SERIES:
+            start = self.next_hour(series)
+            if start is None:
+                continue
+            # bounded chunks keep the first run over the full history small in memory
+            while start < until:
+                end = min(start + self.CHUNK, until)
+                written += self.update_window(series, start, end)
+                start = end
+        if written:
+            logging.info(f"rolling averages: {written} hourly rows written")
+        return written
+
+    def next_hour(self, series):
+        """First hour to compute, None if the series has no data yet"""
+        last = (RollingAverage.select(RollingAverage.hour)
+                .where(RollingAverage.series == series)
+                .order_by(RollingAverage.hour.desc()).limit(1).scalar())
+        if last is not None:
+            return last + HOUR
+        model = self.SERIES[series][0]
+        first = model.select(model.timestamp).order_by(model.timestamp).limit(1).scalar()
+        return floor_hour(first) if first else None
+
+    def update_window(self, series, start, end):
+        model, column, has_symbol = self.SERIES[series]
+        keys = [model.symbol_id] if has_symbol else []
+        fields = keys + [model.timestamp, model.valid_until, column.alias('value')]
+
+        # the row that was valid at the start, however old it is, and every row of the window
+        latest = (model.select(*keys, fn.MAX(model.timestamp).alias('max_ts'))
+                  .where(model.timestamp < start)
+                  .group_by(*keys)
+                  .alias('latest'))
+        on = model.timestamp == latest.c.max_ts
+        if has_symbol:
+            on &= model.symbol_id == latest.c.symbol_id
+        previous = model.select(*fields).join(latest, on=on).tuples()
+        current = (model.select(*fields)
+                   .where((model.timestamp >= start) & (model.timestamp < end))
+                   .order_by(model.timestamp)
+                   .tuples())
+
+        rows = defaultdict(list)
+        for row in list(previous) + list(current):
+            symbol_id = row[0] if has_symbol else 0
+            rows[symbol_id].append(row[-3:])
+
+        records = []
+        for symbol_id, series_rows in rows.items():
+            running = self.running_means(series, symbol_id, start)
+            for hour, mean in hourly_means(series_rows, start, end).items():
+                records.append(dict(series=series, symbol_id=symbol_id, hour=hour, mean=mean,
+                                    **{name: window.add(hour, mean) for name, window in running.items()}))
+
+        upsert(RollingAverage, records)
+        return len(records)
+
+    def running_means(self, series, symbol_id, start):
+        key = (series, symbol_id)
+        if key not in self.running:
+            self.running[key] = {name: RunningMean(hours) for name, hours in self.WINDOWS.items()}
+            history = (RollingAverage.select(RollingAverage.hour, RollingAverage.mean)
+                       .where((RollingAverage.series == series) &
+                              (RollingAverage.symbol_id == symbol_id) &
+                              (RollingAverage.hour >= start - datetime.timedelta(hours=max(self.WINDOWS.values()))) &
+                              (RollingAverage.hour < start))
+                       .order_by(RollingAverage.hour)
+                       .tuples())
+            for hour, mean in history:
+                for window in self.running[key].values():
+                    window.add(hour, mean)
+        return self.running[key]
+
+
+def hourly_means(rows, start, end):
+    """Time weighted mean per hour of a step series of (timestamp, valid_until, value) rows.
+
+    A row holds until the next row, at most until one cycle after its valid_until. Hours without any
+    valid row are left out.
+    """
+    sums = defaultdict(float)
+    covered = defaultdict(float)
+    for i, (timestamp, valid_until, value) in enumerate(rows):
+        if value is None:
+            continue
+        stop = (valid_until or timestamp) + CYCLE
+        if i + 1 < len(rows):
+            stop = min(stop, rows[i + 1][0])
+        begin = max(timestamp, start)
+        stop = min(stop, end)
+        while begin < stop:
+            hour = floor_hour(begin)
+            part_end = min(stop, hour + HOUR)
+            seconds = (part_end - begin).total_seconds()
+            sums[hour] += value * seconds
+            covered[hour] += seconds
+            begin = part_end
+    return {hour: sums[hour] / covered[hour] for hour in sorted(sums) if covered[hour] > 0}
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pyarrow as pa
+from dotenv import load_dotenv
+
+import Database
+from Database import CYCLE, FundingData, Snapshot, Symbol, Exchange, as_of
+from FundingSample import ArbitrageOpportunity, FundingSample
+
+load_dotenv()
+HISTORY_DAYS = int(os.getenv("SNAPSHOT_API_HISTORY_DAYS", 30))
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+HOUR = 3600
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the latest funding snapshot, arbitrage and history over HTTP")
+    parser.add_argument("--port", type=int, default=int(os.getenv("SNAPSHOT_API_PORT") or 9109))
+    parser.add_argument("--host", default=os.getenv("SNAPSHOT_API_HOST", "127.0.0.1"))
+    parser.add_argument("--interval", type=float, default=30, help="seconds between checks for a new snapshot")
+    args = parser.parse_args()
+
+    # without a crawler in this process the store follows the database, one query per new snapshot
+    start_server(args.port, args.host)
+    while True:
+        time.sleep(args.interval)
+        try:
+            STORE.refresh()
+        except Exception as e:
+            logging.error(f"Error refreshing the snapshot store: {e}")
+
+
+class HourlyBuckets:
+    """Sum of rate and rate_1y and the row count per symbol, exchange and hour of the last `days` days.
+
+    The sums live in one array of series x hours, an hour slot is reused once it drops out of the window.
+    Rows are added like they are written to fundingdata, so a bucket averages the same rows as a GROUP BY
+    on the table.
+    """
+
+    def __init__(self, days=HISTORY_DAYS):
+        self.hours = days * 24
+        self.series = {}
+        self.sums = np.zeros((16, self.hours, 3))
+        self.slot_hour = np.full(self.hours, -1, dtype=np.int64)
+
+    def add(self, symbol, exchange, hour, rate, rate_1y, count=1):
+        """hour in hours since epoch, rate and rate_1y are sums if count > 1"""
+        slot = hour % self.hours
+        if hour < self.slot_hour[slot]:
+            return  # older than the window
+        if hour > self.slot_hour[slot]:
+            self.sums[:, slot] = 0
+            self.slot_hour[slot] = hour
+        index = self.series.get((symbol, exchange))
+        if index is None:
+            index = self.series[(symbol, exchange)] = len(self.series)
+            if index == len(self.sums):
+                self.sums = np.concatenate([self.sums, np.zeros_like(self.sums)])
+        self.sums[index, slot] += (rate, rate_1y, count)
+
+    def query(self, symbols=None, days=None, bucket_hours=1):
+        """(symbol, exchange, bucket start, mean rate, mean rate_1y) of the buckets with rows, by bucket"""
+        newest = self.slot_hour.max()
+        if newest < 0:
+            return []
+        first = newest - min(days * 24 if days else self.hours, self.hours) + 1
+        hours = np.arange(first // bucket_hours * bucket_hours, newest + 1)
+        hours = hours[(hours >= first) & (self.slot_hour[hours % self.hours] == hours)]
+        keys = [(key, index) for key, index in self.series.items() if symbols is None or key[0] in symbols]
+        if not len(hours) or not keys:
+            return []
+
+        # hours x series x (rate, rate_1y, count), summed per bucket
+        buckets = hours // bucket_hours
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        sums = np.add.reduceat(self.sums[[index for _, index in keys]][:, hours % self.hours].swapaxes(0, 1),
+                               starts, axis=0)
+        rows = []
+        for b, s in zip(*np.nonzero(sums[:, :, 2])):
+            rate, rate_1y, count = sums[b, s]
+            symbol, exchange = keys[s][0]
+            rows.append((symbol, exchange, int(buckets[starts[b]]) * bucket_hours * HOUR, rate / count, rate_1y / count))
+        return rows
+
+
+# One published snapshot with the responses encoded from it, replaced as a whole so a reader never pairs
+# the body of one snapshot with the ETag of another
+State = namedtuple("State", "snapshot_id timestamp samples opportunities responses")
+
+
+def new_state(snapshot_id, timestamp, samples, opportunities):
+    return State(snapshot_id, timestamp, samples, opportunities, OrderedDict())
+
+
+class SnapshotStore:
+    """Latest rates, arbitrage table and hourly history in memory, fed by the crawler after every cycle
+    or by refresh() from the database. Encoded responses are cached per snapshot, so a request for
+    unchanged data costs a dict lookup and a 304 costs nothing else.
+    """
+    CACHE_SIZE = 256
+
+    def __init__(self, days=HISTORY_DAYS):
+        self.days = days
+        self.state = None
+        self.history = HourlyBuckets(days)
+        # (symbol, exchange) -> values compared by the delta writes, a changed value is a new row
+        self.last_values = {}
+        # (symbol, exchange) -> time the rate was last confirmed, a rate expires one CYCLE later like in as_of
+        self.confirmed = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Latest snapshot and the hourly history of the last days from the database"""
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=self.days)
+        storage = Database.storage
+        query = f"""
+            SELECT symbol, exchange, {storage.time_bucket("timestamp", HOUR)} AS bucket,
+                   SUM(rate), SUM(rate_1y), COUNT(*)
+            FROM fundingdata_v
+            WHERE timestamp >= %s
+            GROUP BY symbol, exchange, bucket
+            ORDER BY bucket
+        """
+        cursor = Database.db.execute_sql(query.replace("%s", storage.database.param), (start,))
+        history = HourlyBuckets(self.days)
+        for symbol, exchange, bucket, rate, rate_1y, count in cursor.fetchall():
+            if isinstance(bucket, str):  # SQLite returns text
+                bucket = datetime.datetime.fromisoformat(bucket)
+            history.add(symbol, exchange, epoch_hour(bucket), rate, rate_1y, count)
+
+        snapshot = Snapshot.select().order_by(Snapshot.id.desc()).first()
+        samples, confirmed = self.latest_samples()
+        with self.lock:
+            self.history = history
+            self.last_values = {(sample.symbol, sample.exchange): values_of(sample) for sample in samples}
+            self.confirmed = confirmed
+            self.state = new_state(snapshot.id if snapshot else 0, snapshot.timestamp if snapshot else None,
+                                   samples, ArbitrageOpportunity.find(samples)[1])
+        logging.info(f"snapshot store loaded: snapshot {self.state.snapshot_id}, {len(samples)} rates, "
+                     f"{len(history.series)} series of history")
+        return self
+
+    def latest_samples(self):
+        """Rates of the as_of view and the time each of them was last confirmed"""
+        fields = (FundingData.rate, FundingData.rate_1y, FundingData.interval, FundingData.next_funding)
+        rows = (as_of(datetime.datetime.utcnow())
+                .select(Symbol.name, Exchange.name, *fields, FundingData.valid_until)
+                .tuples())
+        samples = [FundingSample(*row[:-1]) for row in rows]
+        return samples, {(sample.symbol, sample.exchange): row[-1] for sample, row in zip(samples, rows)}
+
+    def refresh(self):
+        """Follow the database: rows of the snapshots written since the last publish"""
+        snapshot = Snapshot.select().order_by(Snapshot.id.desc()).first()
+        if snapshot is None or self.state is None or snapshot.id <= self.state.snapshot_id:
+            return False
+        rows = (FundingData.named()
+                .select(Symbol.name, Exchange.name, FundingData.rate, FundingData.rate_1y, FundingData.timestamp)
+                .where(FundingData.snapshot_id > self.state.snapshot_id)
+                .tuples())
+        samples, confirmed = self.latest_samples()
+        with self.lock:
+            for symbol, exchange, rate, rate_1y, timestamp in rows:
+                self.history.add(symbol, exchange, epoch_hour(timestamp), rate, rate_1y)
+            self.last_values = {(sample.symbol, sample.exchange): values_of(sample) for sample in samples}
+            self.confirmed = confirmed
+            self.state = new_state(snapshot.id, snapshot.timestamp, samples, ArbitrageOpportunity.find(samples)[1])
+        return True
+
+    def publish(self, snapshot, samples, opportunities=None):
+        """New cycle from the crawler, a no-op until the store has been loaded.
+
+        opportunities are the crawler's, found on samples, they are only reused if no rate was carried forward.
+        """
+        if self.state is None:
+            return
+        hour = epoch_hour(snapshot.timestamp)
+        with self.lock:
+            for sample in samples:
+                key = (sample.symbol, sample.exchange)
+                values = values_of(sample)
+                if self.last_values.get(key) != values:
+                    self.history.add(sample.symbol, sample.exchange, hour, sample.rate, sample.rate_1y)
+                    self.last_values[key] = values
+                self.confirmed[key] = snapshot.timestamp
+            # rates that were not fetched this cycle keep their last value until they expire, like in as_of
+            stale = snapshot.timestamp - CYCLE
+            for key in [key for key, confirmed in self.confirmed.items() if confirmed < stale]:
+                del self.confirmed[key]
+            latest = {(sample.symbol, sample.exchange): sample for sample in self.state.samples
+                      if (sample.symbol, sample.exchange) in self.confirmed}
+            latest.update(((sample.symbol, sample.exchange), sample) for sample in samples)
+            latest = list(latest.values())
+            if opportunities is None or len(latest) != len(samples):
+                opportunities = ArbitrageOpportunity.find(latest)[1]
+            self.state = new_state(snapshot.id, snapshot.timestamp, latest, opportunities)
+
+    # ==========================
+    # Responses
+    # ==========================
+    def response(self, path, params, arrow):
+        """(ETag, body) of a resource, None if there is no such resource"""
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())), arrow)
+        with self.lock:
+            state = self.state
+            cached = state.responses.get(key)
+            if cached is not None:
+                state.responses.move_to_end(key)
+                return cached
+            # the history is updated in place, it is read together with the state it belongs to
+            history = self.history_rows(params) if path == "/history" else None
+        table = self.table(state, path, params, history)
+        if table is None:
+            return None
+        body = encode_arrow(table) if arrow else encode_json(table)
+        etag = f'"{state.snapshot_id}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        with self.lock:
+            state.responses[key] = (etag, body)
+            if len(state.responses) > self.CACHE_SIZE:
+                state.responses.popitem(last=False)
+        return etag, body
+
+    def history_rows(self, params):
+        symbols = set(",".join(params["symbol"]).split(",")) if "symbol" in params else None
+        days = int(params.get("days", [self.days])[0])
+        bucket_hours = max(1, int(params.get("bucket", [HOUR])[0]) // HOUR)
+        return self.history.query(symbols, days, bucket_hours)
+
+    def table(self, state, path, params, history=None):
+        symbols = set(",".join(params["symbol"]).split(",")) if "symbol" in params else None
+        metadata = {"snapshot_id": str(state.snapshot_id),
+                    "timestamp": state.timestamp.isoformat() if state.timestamp else ""}
+        if path == "/latest":
+            samples = [sample for sample in state.samples if symbols is None or sample.symbol in symbols]
+            samples.sort(key=lambda sample: (sample.symbol, sample.exchange))
+            return pa.table({
+                "symbol": [sample.symbol for sample in samples],
+                "exchange": [sample.exchange for sample in samples],
+                "rate": pa.array([sample.rate for sample in samples], pa.float64()),
+                "rate_1y": pa.array([sample.rate_1y for sample in samples], pa.float64()),
+                "interval": pa.array([sample.interval for sample in samples], pa.float64()),
+                "next_funding": pa.array([sample.next_funding for sample in samples], pa.timestamp("ms")),
+            }).replace_schema_metadata(metadata)
+        if path == "/arbitrage":
+            opportunities = [opportunity for opportunity in state.opportunities
+                             if symbols is None or opportunity.symbol in symbols]
+            columns = ("symbol", "long_exchange", "long_rate", "long_rate_1y", "short_exchange", "short_rate",
+                       "short_rate_1y", "spread", "spread_1y")
+            return pa.table({column: [getattr(opportunity, column) for opportunity in opportunities]
+                             for column in columns},
+                            schema=pa.schema([(column, pa.string() if column in ("symbol", "long_exchange", "short_exchange")
+                                               else pa.float64()) for column in columns])
+                            ).replace_schema_metadata(metadata)
+        if path == "/history":
+            symbol, exchange, bucket, rate, rate_1y = zip(*history) if history else ([],) * 5
+            return pa.table({
+                "symbol": pa.array(symbol, pa.string()),
+                "exchange": pa.array(exchange, pa.string()),
+                "bucket": pa.array(bucket, pa.int64()).cast(pa.timestamp("s")),
+                "rate": pa.array(rate, pa.float64()),
+                "rate_1y": pa.array(rate_1y, pa.float64()),
+            }).replace_schema_metadata(metadata)
+        return None
+
+
+def epoch_hour(timestamp):
+    return int(timestamp.replace(tzinfo=datetime.timezone.utc).timestamp()) // HOUR
+
+
+def values_of(sample):
+    # the values write_deltas compares
+    return sample.rate, sample.interval, sample.next_funding
+
+
+def encode_json(table):
+    """{"snapshot_id", "timestamp", "columns", "rows"} with ISO timestamps"""
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    columns = []
+    for column in table.columns:
+        values = column.to_pylist()
+        if pa.types.is_timestamp(column.type):
+            values = [value.isoformat() if value is not None else None for value in values]
+        columns.append(values)
+    return json.dumps({
+        "snapshot_id": int(metadata.get("snapshot_id", 0)),
+        "timestamp": metadata.get("timestamp") or None,
+        "columns": table.column_names,
+        "rows": list(zip(*columns)),
+    }, separators=(",", ":")).encode()
+
+
+def encode_arrow(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+STORE = SnapshotStore()
+
+
+def start_server(port=None, host=None, store=STORE):
+    """Load the store and serve it from a background thread, SNAPSHOT_API_PORT unset or 0 disables it"""
+    port = int(os.getenv("SNAPSHOT_API_PORT") or 0) if port is None else port
+    if not port:
+        return None
+    store.load()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            if url.path == "/health":
+                body = {"snapshot_id": store.state.snapshot_id, "history_days": store.days}
+                self.send_body(200, json.dumps(body).encode(), "application/json")
+                return
+            arrow = params.pop("format", ["json"])[0] == "arrow" or ARROW_TYPE in self.headers.get("Accept", "")
+            try:
+                response = store.response(url.path, params, arrow)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            if response is None:
+                self.send_error(404)
+                return
+            etag, body = response
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_body(200, body, ARROW_TYPE if arrow else "application/json", etag)
+
+        def send_body(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                # clients revalidate every time, an unchanged snapshot answers 304 without a body
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Vary", "Accept")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or os.getenv("SNAPSHOT_API_HOST", "127.0.0.1"), port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"snapshot api served on http://{server.server_address[0]}:{port}/ (latest, arbitrage, history)")
+    return server
+
+
+if __name__ == '__main__':
+    main()
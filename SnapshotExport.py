@@ -0,0 +1,137 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from dotenv import load_dotenv
+
+from Database import FundingData, FundingRate, Staking, Symbol, Exchange, as_of, create_table
+
+load_dotenv()
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+LATEST_FILE = "latest.arrow"
+STATE_FILE = "export_state.json"
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the time series tables to Parquet and the latest rates to Arrow")
+    parser.add_argument("--days", type=int, default=30, help="days to export on the first run")
+    parser.add_argument("--dir", default=EXPORT_DIR, help="export directory")
+    parser.add_argument("--latest", action="store_true", help="only write the latest rates file")
+    args = parser.parse_args()
+
+    create_table()
+    export = SnapshotExport(args.dir)
+    if not args.latest:
+        export.export_tables(args.days)
+    export.export_latest()
+
+
+class SnapshotExport:
+    """Parquet copy of fundingdata, fundingrate and staking for the dashboards and ad-hoc analysis.
+
+    Every table is partitioned by day and symbol (<dir>/<table>/day=2025-01-01/symbol=BTC/). A day holds
+    its own rows plus the rows that were still valid at its start, so every day can be read on its
+    own; rows read from more than one day are deduplicated by id. The last exported day is exported
+    again on the next run because the validity of its rows may have been extended since.
+    latest.arrow holds the latest rate per symbol and exchange as an uncompressed Arrow IPC file that
+    readers memory map.
+    """
+    # table -> (model, query with the names joined in, exported columns)
+    TABLES = {
+        "fundingdata": (FundingData, FundingData.named, pa.schema([
+            ("id", pa.int64()), ("symbol", pa.string()), ("exchange", pa.string()), ("rate", pa.float64()),
+            ("rate_1y", pa.float64()), ("next_funding", pa.int64()), ("interval", pa.float64()),
+            ("timestamp", pa.timestamp("s")), ("valid_until", pa.timestamp("s")), ("snapshot_id", pa.int64()),
+        ])),
+        "fundingrate": (FundingRate, FundingRate.named, pa.schema([
+            ("id", pa.int64()), ("symbol", pa.string()), ("fundingRate", pa.float64()), ("interval", pa.float64()),
+            ("fundingDatetime", pa.int64()), ("fundingRateAnnualized", pa.float64()),
+            ("timestamp", pa.timestamp("s")), ("valid_until", pa.timestamp("s")), ("snapshot_id", pa.int64()),
+        ])),
+        "staking": (Staking, Staking.select, pa.schema([
+            ("id", pa.int64()), ("stakeApy", pa.float64()), ("sharePrice", pa.float64()),
+            ("timestamp", pa.timestamp("s")), ("valid_until", pa.timestamp("s")), ("snapshot_id", pa.int64()),
+        ])),
+    }
+    LATEST_SCHEMA = pa.schema([
+        ("symbol", pa.string()), ("exchange", pa.string()), ("rate", pa.float64()), ("rate_1y", pa.float64()),
+        ("next_funding", pa.timestamp("ms")), ("interval", pa.float64()), ("timestamp", pa.timestamp("s")),
+    ])
+
+    def __init__(self, export_dir=EXPORT_DIR):
+        self.export_dir = export_dir
+        self.state_file = os.path.join(export_dir, STATE_FILE)
+
+    def export_tables(self, days=30):
+        state = self.load_state()
+        today = datetime.datetime.utcnow().date()
+        for table in self.TABLES:
+            last = state.get(table)
+            day = datetime.date.fromisoformat(last) if last else today - datetime.timedelta(days=days)
+            while day <= today:
+                rows = self.export_day(table, day)
+                logging.info(f"{table} {day}: {rows} rows exported")
+                state[table] = day.isoformat()
+                self.save_state(state)
+                day += datetime.timedelta(days=1)
+
+    def export_day(self, table, day):
+        model, query, schema = self.TABLES[table]
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1)
+        fields = [model._meta.fields[name] if name in model._meta.fields else
+                  (Symbol.name if name == "symbol" else Exchange.name).alias(name) for name in schema.names]
+        rows = (query().select(*fields)
+                .where(((model.timestamp >= start) & (model.timestamp < end)) |
+                       ((model.timestamp < start) & (model.valid_until >= start)))
+                .tuples())
+
+        columns = list(zip(*rows)) or [[] for _ in schema]
+        data = pa.table([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+        data = data.append_column("day", pa.array([day.isoformat()] * len(data), type=pa.string()))
+        partitions = ["day", "symbol"] if "symbol" in schema.names else ["day"]
+        if len(data):
+            ds.write_dataset(data, os.path.join(self.export_dir, table), format="parquet",
+                             partitioning=partitions, partitioning_flavor="hive",
+                             existing_data_behavior="delete_matching",
+                             basename_template=f"{table}-{day.isoformat()}-{{i}}.parquet")
+        return len(data)
+
+    def export_latest(self):
+        """Latest rate per symbol and exchange, as the arbitrage page shows them"""
+        fields = [Symbol.name.alias("symbol"), Exchange.name.alias("exchange"), FundingData.rate,
+                  FundingData.rate_1y, FundingData.next_funding, FundingData.interval, FundingData.timestamp]
+        columns = list(zip(*as_of(datetime.datetime.utcnow()).select(*fields).tuples())) or [[] for _ in fields]
+        data = pa.table([pa.array(column, type=field.type) for column, field in zip(columns, self.LATEST_SCHEMA)],
+                        schema=self.LATEST_SCHEMA)
+
+        os.makedirs(self.export_dir, exist_ok=True)
+        path = os.path.join(self.export_dir, LATEST_FILE)
+        # readers map the file, it is replaced instead of rewritten
+        with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, data.schema) as writer:
+            writer.write_table(data)
+        os.replace(path + ".tmp", path)
+        return len(data)
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        os.makedirs(self.export_dir, exist_ok=True)
+        with open(self.state_file + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+from peewee import SqliteDatabase, chunked
+from playhouse.mysql_ext import MariaDBConnectorDatabase, MySQLConnectorDatabase
+
+
+# Storage backends shared by the crawler models (Database.py) and the dashboard loaders (pages/).
+# MariaDB is the production database, SQLite a single file that needs no server, for running and
+# benchmarking the whole pipeline locally or in CI. The queries of the pages use %s placeholders and
+# the helpers below for the parts of the SQL that differ between the databases.
+
+
+class MariaDBStorage:
+    name = "mariadb"
+    # rows per INSERT, keeps a statement well below max_allowed_packet
+    INSERT_BATCH_SIZE = 1000
+
+    def __init__(self, schema, user=None, password=None, host="localhost", port=3306, driver="mariadb"):
+        # the crawler uses the MariaDB connector, the dashboards mysql-connector-python
+        database_class = MariaDBConnectorDatabase if driver == "mariadb" else MySQLConnectorDatabase
+        self.database = database_class(schema, user=user, password=password, host=host, port=int(port))
+
+    def bulk_insert(self, model, rows):
+        with self.database.atomic():
+            for batch in chunked(rows, self.INSERT_BATCH_SIZE):
+                model.insert_many(batch).execute()
+
+    def upsert(self, model, rows):
+        """Insert rows, or update the non key columns of the rows that already exist"""
+        if not rows:
+            return
+        # ON DUPLICATE KEY UPDATE changes the row in place, REPLACE would delete and reinsert it
+        preserve = self.updated_fields(model, rows)
+        with self.database.atomic():
+            for batch in chunked(rows, self.INSERT_BATCH_SIZE):
+                model.insert_many(batch).on_conflict(preserve=preserve).execute()
+
+    def updated_fields(self, model, rows):
+        """Non key fields set by the rows"""
+        keys = {field.name for field in model._meta.get_primary_keys()}
+        return [field for name, field in model._meta.fields.items() if name not in keys and name in rows[0]]
+
+    def create_view(self, name, query):
+        self.database.execute_sql(f"CREATE OR REPLACE VIEW {name} AS {query}")
+
+    # the datetimes are UTC, FROM_UNIXTIME/UNIX_TIMESTAMP/NOW would convert them with the session time zone
+    def from_millis(self, column):
+        """UTC datetime of a ms since epoch column"""
+        return f"TIMESTAMPADD(MICROSECOND, {column} * 1000, TIMESTAMP '1970-01-01 00:00:00')"
+
+    def days_ago(self):
+        """UTC datetime a number of days (one parameter) before now"""
+        return "DATE_SUB(UTC_TIMESTAMP(), INTERVAL %s DAY)"
+
+    def time_bucket(self, column, seconds):
+        """Start of the bucket of the given size a datetime column falls into"""
+        epoch = f"TIMESTAMPDIFF(SECOND, TIMESTAMP '1970-01-01 00:00:00', {column})"
+        return f"TIMESTAMPADD(SECOND, FLOOR({epoch} / {int(seconds)}) * {int(seconds)}, TIMESTAMP '1970-01-01 00:00:00')"
+
+    def read_sql(self, query, params=()):
+        """Result of a query as a DataFrame, with its own connection unless one is open in this thread"""
+        import pandas as pd  # only the dashboards read frames
+
+        opened = self.database.connect(reuse_if_open=True)
+        try:
+            cursor = self.database.execute_sql(query.replace("%s", self.database.param), params)
+            columns = [column[0] for column in cursor.description]
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        finally:
+            if opened:
+                self.database.close()
+
+
+class SqliteStorage(MariaDBStorage):
+    name = "sqlite"
+
+    def __init__(self, path="reya.db"):
+        # WAL lets the dashboards read while the crawler writes, NORMAL only syncs at checkpoints
+        self.database = SqliteDatabase(path, pragmas={
+            "journal_mode": "wal",
+            "synchronous": "normal",
+            "cache_size": -64 * 1000,
+            "busy_timeout": 5000,
+        })
+
+    def bulk_insert(self, model, rows):
+        with self.database.atomic():
+            for batch in chunked(rows, self.batch_size(rows)):
+                model.insert_many(batch).execute()
+
+    def upsert(self, model, rows):
+        if not rows:
+            return
+        keys = model._meta.get_primary_keys()
+        preserve = self.updated_fields(model, rows)
+        with self.database.atomic():
+            for batch in chunked(rows, self.batch_size(rows)):
+                model.insert_many(batch).on_conflict(conflict_target=keys, preserve=preserve).execute()
+
+    def batch_size(self, rows):
+        # every value is a bound parameter, SQLite allows 32766 per statement
+        return max(1, 32766 // max(1, len(rows[0]) if rows else 1))
+
+    def create_view(self, name, query):
+        with self.database.atomic():
+            self.database.execute_sql(f"DROP VIEW IF EXISTS {name}")
+            self.database.execute_sql(f"CREATE VIEW {name} AS {query}")
+
+    def from_millis(self, column):
+        return f"datetime({column} / 1000, 'unixepoch')"
+
+    def days_ago(self):
+        return "datetime('now', '-' || %s || ' days')"
+
+    def time_bucket(self, column, seconds):
+        # datetimes are stored as text, julianday() reads them
+        epoch = f"CAST(ROUND((julianday({column}) - 2440587.5) * 86400) AS INTEGER)"
+        return f"datetime({epoch} / {int(seconds)} * {int(seconds)}, 'unixepoch')"
+
+
+def open_storage(backend="mariadb", path="reya.db", **mariadb):
+    """Storage by name: "mariadb" with the schema, user, password, host, port and driver, "sqlite" with a file path"""
+    if backend == "sqlite":
+        return SqliteStorage(path)
+    if backend == "mariadb":
+        return MariaDBStorage(**mariadb)
+    raise ValueError(f"unknown storage backend {backend!r}, expected 'mariadb' or 'sqlite'")
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+CACHE_FILE = os.getenv("UNIVERSE_CACHE_FILE", "symbol_universe.json")
+TTL_HOURS = float(os.getenv("UNIVERSE_TTL_HOURS", 24))
+
+
+class SymbolUniverse:
+    """Index of base asset -> native perpetual symbol per exchange.
+
+    The markets of all exchanges are loaded in parallel and the index is cached on disk, so a restart
+    within the TTL needs no market request at all. Exchanges without market data (no or empty
+    load_markets) are not part of the index and fall back to the conventional symbol names.
+    """
+    ANCHOR = "reya"
+    # preferred settlement currency when an exchange lists a base more than once
+    QUOTES = ("USDT", "USDC", "RUSD", "USD")
+
+    def __init__(self, exchanges, cache_file=CACHE_FILE, ttl_hours=TTL_HOURS):
+        self.exchanges = exchanges
+        self.cache_file = cache_file
+        self.ttl = ttl_hours * 3600
+        self.index = {}
+        self.indexed = set()
+
+    @staticmethod
+    def conventional_symbol(exchange, base):
+        """Symbol naming used for exchanges without market data"""
+        if exchange.name == "Hyperliquid":
+            return f"{base}/USDC:USDC"
+        elif exchange.name == "Reya":
+            return f"{base}/RUSD:RUSD"
+        return f"{base}/USDT:USDT"
+
+    def load(self):
+        if not self.load_cache():
+            complete = self.build()
+            # an exchange that could not be loaded is retried on the next start
+            if complete:
+                self.save_cache()
+        logging.info(f"symbol universe: {len(self.index)} bases on {len(self.indexed)} exchanges with market data")
+        return self
+
+    def build(self):
+        """Load all markets and build the index, False if an exchange failed"""
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.exchanges) or 1) as executor:
+            markets = dict(zip(self.exchanges, executor.map(self.load_markets, self.exchanges.values())))
+
+        self.index = {}
+        self.indexed = set()
+        for exchange_name, exchange_markets in markets.items():
+            if not exchange_markets:
+                continue
+            self.indexed.add(exchange_name)
+            for market in exchange_markets:
+                # perpetuals only, the custom adapters do not set every flag
+                if market.get('spot') or market.get('future') or market.get('option') \
+                        or market.get('linear') is False or market.get('active') is False:
+                    continue
+                symbols = self.index.setdefault(market['base'], {})
+                current = symbols.get(exchange_name)
+                if current is None or self.quote_rank(market['symbol']) < self.quote_rank(current):
+                    symbols[exchange_name] = market['symbol']
+        logging.info(f"symbol universe built in {time.monotonic() - start:.1f}s")
+        return None not in markets.values()
+
+    def load_markets(self, exchange):
+        try:
+            markets = exchange.load_markets()
+            if not isinstance(markets, dict) or not markets:
+                # the custom adapters only implement fetch_markets
+                markets = {market['symbol']: market for market in exchange.fetch_markets() or []}
+            return list(markets.values())
+        except Exception as e:
+            logging.error(f"{exchange.name}: loading markets failed: {e}")
+            return None
+
+    def quote_rank(self, symbol):
+        settle = symbol.split(":")[-1]
+        return self.QUOTES.index(settle) if settle in self.QUOTES else len(self.QUOTES)
+
+    # ==========================
+    # Queries
+    # ==========================
+    def bases(self, subset=None):
+        """Bases listed on Reya and on at least one other exchange with market data"""
+        bases = [base for base, symbols in self.index.items()
+                 if self.ANCHOR in symbols and len(symbols) > 1 and (subset is None or base in subset)]
+        return sorted(bases)
+
+    def symbols_on(self, exchange_name, bases, keep_unlisted=False):
+        """(base, native symbol) pairs of an exchange, bases it does not list are left out or, with
+        keep_unlisted, fetched with the conventional symbol"""
+        exchange = self.exchanges[exchange_name]
+        if exchange_name not in self.indexed:
+            return [(base, self.conventional_symbol(exchange, base)) for base in bases]
+        listed = ((base, self.index.get(base, {}).get(exchange_name)) for base in bases)
+        if keep_unlisted:
+            return [(base, symbol or self.conventional_symbol(exchange, base)) for base, symbol in listed]
+        return [(base, symbol) for base, symbol in listed if symbol]
+
+    def missing_on(self, exchange_name, bases):
+        """Bases an exchange with market data does not list"""
+        if exchange_name not in self.indexed:
+            return []
+        return [base for base in bases if exchange_name not in self.index.get(base, {})]
+
+    # ==========================
+    # Cache
+    # ==========================
+    def load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return False
+        with open(self.cache_file) as f:
+            cache = json.load(f)
+        if time.time() - cache["created"] > self.ttl or set(cache["exchanges"]) != set(self.exchanges):
+            return False
+        self.index = cache["index"]
+        self.indexed = set(cache["indexed"])
+        return True
+
+    def save_cache(self):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"created": time.time(), "exchanges": list(self.exchanges), "indexed": sorted(self.indexed),
+                       "index": self.index}, f, indent=1)
+        os.replace(tmp_file, self.cache_file)
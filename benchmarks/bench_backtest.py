@@ -0,0 +1,55 @@
+"""Threshold sweep of the backtest on a synthetic rate grid.
+
+    python -m benchmarks.bench_backtest --symbols 8 50 --exchanges 8 --days 365
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from Backtest import Backtest, HOURS_PER_YEAR
+
+END = np.datetime64("2025-01-01T00:00:00")
+
+
+def synthetic_backtest(symbols, exchanges, days, seed=0):
+    """Mean reverting yearly rates around 10% on a 5 minute grid, a few gaps per exchange"""
+    rng = np.random.default_rng(seed)
+    steps = days * 288
+    noise = rng.normal(0, 2, (steps, exchanges, symbols)).astype(np.float32)
+    rates = np.empty_like(noise)
+    rates[0] = 10
+    for t in range(1, steps):
+        rates[t] = rates[t - 1] + 0.01 * (10 - rates[t - 1]) + noise[t]
+    rates /= HOURS_PER_YEAR
+    rates[rng.random((steps, exchanges, symbols)) < 0.001] = np.nan
+    times = END - np.arange(steps)[::-1] * np.timedelta64(300, 's')
+    return Backtest(times, rates, ["Reya"] + [f"Exchange{i}" for i in range(1, exchanges)],
+                    [f"SYM{i}" for i in range(symbols)])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Threshold sweep of the backtest on synthetic data")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[8, 50])
+    parser.add_argument("--exchanges", type=int, nargs="+", default=[8])
+    parser.add_argument("--days", type=int, nargs="+", default=[365])
+    parser.add_argument("--entry", type=float, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--exit", type=float, nargs="+", default=[0, 10])
+    args = parser.parse_args()
+
+    for symbols in args.symbols:
+        for exchanges in args.exchanges:
+            for days in args.days:
+                backtest = synthetic_backtest(symbols, exchanges, days)
+                start = time.perf_counter()
+                results = backtest.sweep(args.entry, args.exit)
+                seconds = time.perf_counter() - start
+                trades = sum(result["trades"] for result in results)
+                print(f"{symbols:4d} symbols {exchanges:3d} exchanges {days:4d} days: {len(results)} runs, "
+                      f"{trades} trades in {seconds:.2f}s ({seconds / len(results):.2f}s per run)")
+
+
+if __name__ == '__main__':
+    main()
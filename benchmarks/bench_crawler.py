@@ -0,0 +1,158 @@
+"""End-to-end crawler benchmark against recorded exchange responses.
+
+    python -m benchmarks.bench_crawler record                      # one live cycle, stores the responses
+    python -m benchmarks.bench_crawler replay --cycles 10 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import Database
+from ReyaDataCrawler import ReyaDataCrawler
+from Storage import SqliteStorage
+from benchmarks.replay import Cassette, ReplayServer, RequestCounter, install_recorder, install_replay
+
+CASSETTE = os.path.join(os.path.dirname(__file__), "cassettes", "crawler.json")
+
+
+class CountingTelegram:
+    """Counts the messages instead of sending them"""
+
+    def __init__(self):
+        self.messages = 0
+
+    def sendMessage(self, message):
+        self.messages += 1
+
+
+def use_database(kind):
+    if kind == "sqlite":
+        Database.use_storage(SqliteStorage(os.path.join(tempfile.mkdtemp(), "bench.db")))
+    Database.create_table()
+    return Database.db
+
+
+def create_crawler():
+    # skips __init__, the trading client is not needed for crawling public data
+    crawler = ReyaDataCrawler.__new__(ReyaDataCrawler)
+    crawler.exchange = ReyaDataCrawler.ALL_EXCHANGES['reya']
+    crawler.telegram = CountingTelegram()
+    return crawler
+
+
+def count_rows():
+    return sum(model.select().count() for model in [Database.FundingRate, Database.Staking, Database.FundingData])
+
+
+def run_cycle(crawler, counter):
+    rows_before = count_rows()
+    messages_before = crawler.telegram.messages
+    counter.reset()
+    stages = {}
+
+    start = time.perf_counter()
+    snapshot = crawler.start_snapshot()
+    crawler.fetching_reya_funding_and_apy(snapshot)
+    stages["reya"] = time.perf_counter() - start
+
+    stage_start = time.perf_counter()
+    # includes the db writes, arbitrage detection and alerts
+    crawler.fetch_funding_rates(snapshot)
+    crawler.finish_snapshot(snapshot)
+    stages["funding_rates"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    crawler.send_funding_summary()
+    stages["summary"] = time.perf_counter() - stage_start
+
+    return {
+        "latency": time.perf_counter() - start,
+        "stages": stages,
+        "requests": counter.reset(),
+        "rows": count_rows() - rows_before,
+        "messages": crawler.telegram.messages - messages_before,
+        "failed_exchanges": snapshot.exchanges_failed,
+    }
+
+
+def summarize(cycles):
+    latencies = sorted(cycle["latency"] for cycle in cycles)
+    return {
+        "cycles": len(cycles),
+        "latency_mean": statistics.mean(latencies),
+        "latency_p50": statistics.median(latencies),
+        "latency_max": latencies[-1],
+        "stages_mean": {stage: statistics.mean(cycle["stages"][stage] for cycle in cycles)
+                        for stage in cycles[0]["stages"]},
+        "requests_per_cycle": statistics.mean(cycle["requests"] for cycle in cycles),
+        "rows_per_cycle": statistics.mean(cycle["rows"] for cycle in cycles),
+        "messages": sum(cycle["messages"] for cycle in cycles),
+    }
+
+
+def record(args):
+    use_database("sqlite")
+    cassette = Cassette(args.cassette)
+    for exchange in ReyaDataCrawler.ALL_EXCHANGES.values():
+        install_recorder(exchange, cassette)
+
+    cycle = run_cycle(create_crawler(), RequestCounter())
+    os.makedirs(os.path.dirname(args.cassette), exist_ok=True)
+    cassette.save()
+    logging.info(f"recorded {len(cassette.responses)} responses to {args.cassette} ({cycle['latency']:.2f}s live)")
+
+
+def replay(args):
+    use_database(args.db)
+    cassette = Cassette(args.cassette).load()
+    host_latency = dict((host, float(seconds)) for host, seconds in (item.split("=") for item in args.host_latency))
+    server = ReplayServer(cassette, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, host_latency=host_latency).start()
+    counter = RequestCounter()
+    for exchange in ReyaDataCrawler.ALL_EXCHANGES.values():
+        install_replay(exchange, server, counter)
+
+    crawler = create_crawler()
+    try:
+        cycles = [run_cycle(crawler, counter) for _ in range(args.cycles)]
+    finally:
+        server.stop()
+
+    result = summarize(cycles)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": result, "cycles": cycles}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline crawler benchmark with recorded exchange responses")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="run one live cycle and record all responses")
+    record_parser.add_argument("--cassette", default=CASSETTE)
+
+    replay_parser = subparsers.add_parser("replay", help="run cycles against the recorded responses")
+    replay_parser.add_argument("--cassette", default=CASSETTE)
+    replay_parser.add_argument("--cycles", type=int, default=5)
+    replay_parser.add_argument("--db", choices=["sqlite", "mariadb"], default="sqlite")
+    replay_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    replay_parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency up to this many seconds")
+    replay_parser.add_argument("--host-latency", nargs="*", default=[], help="per host latency, e.g. api.bybit.com=0.2")
+    replay_parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    replay_parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    replay_parser.add_argument("--output", help="write the per cycle results as JSON")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == '__main__':
+    main()
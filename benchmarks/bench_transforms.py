@@ -0,0 +1,282 @@
+"""Scaling benchmark for the arbitrage detection and dashboard transforms on synthetic funding data.
+
+    python -m benchmarks.bench_transforms --symbols 8 50 200 --exchanges 8 16 --days 7 90 360
+    python -m benchmarks.bench_transforms --compare benchmarks/results/transforms-20250101-120000.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from Database import CYCLE
+from pages.common import analytics
+from pages.common.timeseries import forward_fill
+from pages.common.transforms import (
+    visual_downsample, add_rolling_averages, melt_averages, pivot_rates, find_best_arbitrage_opportunities
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# fixed end keeps the generated data identical between runs
+END = pd.Timestamp("2025-01-01")
+
+
+def crawler_arbitrage():
+    """The crawler's copy of the arbitrage detection, None if the crawler dependencies are missing"""
+    try:
+        from ReyaDataCrawler import ReyaDataCrawler
+    except ImportError as e:
+        logging.warning(f"skipping crawler arbitrage benchmark: {e}")
+        return None
+    from FundingSample import FundingSample
+
+    def run(df):
+        return ReyaDataCrawler.find_best_arbitrage_opportunities(None, samples(df))
+
+    def samples(df):
+        # the crawler works on FundingSample records, converted once per frame
+        if id(df) not in converted:
+            converted.clear()
+            converted[id(df)] = [FundingSample(symbol, exchange, rate, rate_1y, 8.0) for symbol, exchange, rate, rate_1y
+                                 in df[["Symbol", "Exchange", "Rate", "Yearly Rate"]].itertuples(index=False)]
+        return converted[id(df)]
+
+    converted = {}
+    return run
+
+
+# ==========================
+# Synthetic data
+# ==========================
+def synthetic_latest(symbols, exchanges, seed=0):
+    """Latest rate per symbol and exchange, as the arbitrage page and the crawler see it"""
+    rng = np.random.default_rng(seed)
+    exchange_names = ["Reya"] + [f"Exchange{i}" for i in range(1, exchanges)]
+    symbol_names = [f"SYM{i}" for i in range(symbols)]
+    df = pd.DataFrame({
+        "Symbol": np.repeat(symbol_names, exchanges),
+        "Exchange": np.tile(exchange_names, symbols),
+        "Rate": rng.normal(0, 0.005, symbols * exchanges),
+    })
+    df["Yearly Rate"] = df["Rate"] * 24 * 365
+    return df
+
+
+def synthetic_history(symbols, days, seed=0):
+    """5 minute funding history per symbol, as loaded by the history page"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(end=END, periods=days * 288, freq="5min")
+    rates = rng.normal(0, 0.001, (symbols, len(timestamps))).cumsum(axis=1) / 10
+    df = pd.DataFrame({
+        "timestamp": np.tile(timestamps, symbols),
+        "symbol": np.repeat([f"SYM{i}/RUSD:RUSD" for i in range(symbols)], len(timestamps)),
+        "fundingRate": rates.ravel(),
+    })
+    df["fundingRateAnnualized"] = df["fundingRate"] * 24 * 365
+    return df
+
+
+def synthetic_staking(days, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(end=END, periods=days * 288, freq="5min")
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "stakeApy": 0.1 + rng.normal(0, 0.01, len(timestamps)),
+        "sharePrice": np.linspace(1, 1.05, len(timestamps)),
+    })
+
+
+def synthetic_averages(history, value_col):
+    """Hourly averages per symbol like rollingaverage, from the synthetic history"""
+    hourly = (history.assign(hour=history["timestamp"].dt.floor("1h"))
+              .groupby(["symbol", "hour"], as_index=False)[value_col].mean())
+    hourly["avg_7d"] = hourly.groupby("symbol")[value_col].transform(lambda values: values.rolling(168, 1).mean())
+    hourly["avg_30d"] = hourly.groupby("symbol")[value_col].transform(lambda values: values.rolling(720, 1).mean())
+    return hourly.drop(columns=value_col)
+
+
+def write_export(history, export_dir):
+    """The history as fundingrate Parquet export, partitioned like SnapshotExport writes it"""
+    df = history.assign(id=np.arange(len(history)), valid_until=history["timestamp"],
+                        day=history["timestamp"].dt.strftime("%Y-%m-%d"))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(table.schema.get_field_index("timestamp"), "timestamp",
+                             table["timestamp"].cast(pa.timestamp("ms")))
+    table = table.set_column(table.schema.get_field_index("valid_until"), "valid_until",
+                             table["valid_until"].cast(pa.timestamp("ms")))
+    ds.write_dataset(table, os.path.join(export_dir, "fundingrate"), format="parquet",
+                     partitioning=ds.partitioning(pa.schema([("day", pa.string()), ("symbol", pa.string())]),
+                                                  flavor="hive"))
+
+
+def check_parity(duckdb):
+    """The DuckDB backend has to return the frames of the pandas backend, row order included"""
+    pandas = analytics.PandasAnalytics()
+    # every symbol shares the timestamps, rows of equal time have to come out in the same order
+    history = synthetic_history(8, 2)
+    history["timestamp"] += pd.Timestamp.now("UTC").tz_localize(None).floor("5min") - END
+    averages = synthetic_averages(history, "fundingRateAnnualized")
+    latest = synthetic_latest(8, 8)
+
+    def same(name, left, right):
+        pd.testing.assert_frame_equal(left.reset_index(drop=True), right.reset_index(drop=True),
+                                      check_dtype=False, check_exact=False, rtol=1e-9, obj=name)
+
+    same("pivot_rates", pandas.pivot_rates(latest, "Yearly Rate", fill_value=0),
+         duckdb.pivot_rates(latest, "Yearly Rate", fill_value=0))
+    same("rolling_averages",
+         pandas.rolling_averages(history, "fundingRateAnnualized", prefix="funding", group_col="symbol"),
+         duckdb.rolling_averages(history, "fundingRateAnnualized", prefix="funding", group_col="symbol"))
+    same("join_averages", pandas.join_averages(history, averages, prefix="funding", group_col="symbol"),
+         duckdb.join_averages(history, averages, prefix="funding", group_col="symbol"))
+    with tempfile.TemporaryDirectory() as export_dir:
+        write_export(history, export_dir)
+        for columns in (None, ["symbol", "fundingRateAnnualized", "valid_until"]):
+            same("read_history", pandas.read_history(export_dir, "fundingrate", 1, columns=columns),
+                 duckdb.read_history(export_dir, "fundingrate", 1, columns=columns))
+    logging.info("duckdb backend returns the frames of the pandas backend")
+
+
+def check_forward_fill():
+    """Delta rows have to cover the 5 minute grid until one cycle past their last confirmation"""
+    # cycles of 5 minutes of sleep plus a crawl of 40 seconds, SYM0 changes every cycle and is written with
+    # valid_until = timestamp, SYM1 never changes and is confirmed by every cycle, SYM2 stops after 4 cycles
+    cycles = pd.Timestamp("2025-01-01 00:00:30") + pd.to_timedelta(np.arange(12) * 340, unit="s")
+    df = pd.concat([
+        pd.DataFrame({"timestamp": cycles, "symbol": "SYM0", "rate": np.arange(12.0), "valid_until": cycles}),
+        pd.DataFrame({"timestamp": cycles[:1], "symbol": "SYM1", "rate": [1.0], "valid_until": cycles[-1:]}),
+        pd.DataFrame({"timestamp": cycles[:1], "symbol": "SYM2", "rate": [2.0], "valid_until": cycles[3:4]}),
+    ])
+    filled = forward_fill(df, "5min", group_col="symbol", valid_col="valid_until")
+    grid = pd.date_range(cycles[0].ceil("5min"), cycles[-1], freq="5min")
+    for symbol, stop in (("SYM0", cycles[-1]), ("SYM1", cycles[-1]), ("SYM2", cycles[3] + CYCLE)):
+        series = filled[filled["symbol"] == symbol].set_index("timestamp")["rate"]
+        expected = grid[grid <= stop]
+        assert series.index.equals(expected), f"{symbol}: {len(series)} of {len(expected)} grid points"
+    sym0 = filled[filled["symbol"] == "SYM0"]
+    assert (sym0["rate"].to_numpy() == np.searchsorted(cycles, sym0["timestamp"], side="right") - 1).all()
+    logging.info("forward_fill holds delta rows until one cycle past their last confirmation")
+
+
+# ==========================
+# Benchmarks
+# ==========================
+def measure(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(args):
+    results = []
+
+    def record(name, seconds, rows, **size):
+        results.append(dict(name=name, seconds=seconds, rows=rows, **size))
+        logging.info(f"{name:28s} {str(size):45s} rows={rows:<10d} {seconds * 1000:10.2f} ms")
+
+    check_forward_fill()
+    crawler_copy = crawler_arbitrage()
+    duckdb = analytics.DuckDBAnalytics() if analytics.duckdb is not None else None
+    if duckdb is not None:
+        check_parity(duckdb)
+    for symbols in args.symbols:
+        for exchanges in args.exchanges:
+            latest = synthetic_latest(symbols, exchanges)
+            size = dict(symbols=symbols, exchanges=exchanges)
+            record("arbitrage_page", measure(lambda: find_best_arbitrage_opportunities(latest), args.repeat),
+                   len(latest), **size)
+            if crawler_copy is not None:
+                record("arbitrage_crawler", measure(lambda: crawler_copy(latest), args.repeat), len(latest), **size)
+            record("pivot_rates", measure(lambda: pivot_rates(latest, "Yearly Rate", fill_value=0), args.repeat),
+                   len(latest), **size)
+            if duckdb is not None:
+                record("duckdb_pivot_rates", measure(lambda: duckdb.pivot_rates(latest, "Yearly Rate", fill_value=0),
+                                                     args.repeat), len(latest), **size)
+
+    metric_map = {"fundingRateAnnualized": "Raw Funding Rate", "funding_7d": "7D Avg", "funding_30d": "30D Avg"}
+    for days in args.days:
+        staking = synthetic_staking(days)
+        staking["stakeApy_pct"] = staking["stakeApy"] * 100
+        record("rolling_staking", measure(lambda: add_rolling_averages(staking, "stakeApy_pct", prefix="stakeApy"),
+                                          args.repeat), len(staking), days=days)
+
+        for symbols in args.symbols:
+            history = synthetic_history(symbols, days)
+            size = dict(symbols=symbols, days=days)
+            for method in ("lttb", "minmax"):
+                record(f"{method}_downsample", measure(
+                    lambda: visual_downsample(history, "fundingRateAnnualized", group_col="symbol", points=1400,
+                                              method=method), args.repeat), len(history), **size)
+            record("rolling_funding", measure(
+                lambda: add_rolling_averages(history, "fundingRateAnnualized", prefix="funding", group_col="symbol"),
+                args.repeat), len(history), **size)
+            if duckdb is not None:
+                record("duckdb_rolling_funding", measure(
+                    lambda: duckdb.rolling_averages(history, "fundingRateAnnualized", prefix="funding", group_col="symbol"),
+                    args.repeat), len(history), **size)
+            averaged = add_rolling_averages(history, "fundingRateAnnualized", prefix="funding", group_col="symbol")
+            record("melt_averages", measure(lambda: melt_averages(averaged, metric_map), args.repeat),
+                   len(averaged), **size)
+
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result["name"], result.get("symbols"), result.get("exchanges"), result.get("days"))
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous:
+            ratio = result["seconds"] / previous["seconds"]
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{result['name']:28s} {str(result_key(result)[1:]):20s} {ratio:6.2f}x{flag}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Scaling benchmark for arbitrage detection and dashboard transforms")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[8, 50, 200])
+    parser.add_argument("--exchanges", type=int, nargs="+", default=[8, 16])
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 90, 360])
+    parser.add_argument("--repeat", type=int, default=3, help="the best of this many runs is reported")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/transforms-<time>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"transforms-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"revision": git_revision(), "created": datetime.datetime.now().isoformat(), "results": results},
+                  f, indent=2)
+    logging.info(f"results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
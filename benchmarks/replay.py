@@ -0,0 +1,158 @@
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def request_key(method, url, body=None):
+    return f"{method} {url} {body or ''}".strip()
+
+
+class Cassette:
+    """Recorded exchange responses, keyed by method, url and body"""
+
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        with open(self.path) as f:
+            self.responses = json.load(f)
+        return self
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.responses, f, indent=1)
+
+    def record(self, key, response):
+        with self.lock:
+            self.responses[key] = response
+
+
+def install_recorder(exchange, cassette):
+    """Wrap the exchange's http layer to store every response in the cassette"""
+    fetch = exchange.fetch
+
+    def recording_fetch(url, method='GET', headers=None, body=None):
+        response = fetch(url, method, headers, body)
+        cassette.record(request_key(method, url, body), response)
+        return response
+
+    exchange.fetch = recording_fetch
+
+
+class RequestCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def increment(self):
+        with self.lock:
+            self.count += 1
+
+    def reset(self):
+        with self.lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def install_replay(exchange, server, counter=None):
+    """Send the exchange's requests to the local replay server instead of the real api"""
+    fetch = exchange.fetch
+
+    def replay_fetch(url, method='GET', headers=None, body=None):
+        if counter is not None:
+            counter.increment()
+        return fetch(server.url_for(url), method, headers, body)
+
+    exchange.fetch = replay_fetch
+
+
+class ReplayServer:
+    """Local stand-in for the exchange apis, serves a cassette with configurable latency and errors.
+
+    A request for https://api.example.com/path?x=1 is sent to http://127.0.0.1:<port>/api.example.com/path?x=1
+    and answered with the recorded response. Unknown requests get a 404.
+    """
+
+    def __init__(self, cassette, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, host_latency=None):
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.host_latency = host_latency or {}
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def url_for(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        return f"{self.base_url}/{parsed.netloc}{parsed.path}" + (f"?{parsed.query}" if parsed.query else "")
+
+    def start(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                replay.handle(self, "GET")
+
+            def do_POST(self):
+                replay.handle(self, "POST")
+
+            def do_DELETE(self):
+                replay.handle(self, "DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"replay server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handle(self, request, method):
+        host = request.path.lstrip("/").split("/", 1)[0]
+        url = "https://" + request.path.lstrip("/")
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length).decode() if length else None
+
+        delay = self.host_latency.get(host, self.latency)
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            return self.respond(request, 429, {"error": "rate limited"}, {"Retry-After": "1"})
+        if self.error_rate and random.random() < self.error_rate:
+            return self.respond(request, 500, {"error": "injected error"})
+
+        key = request_key(method, url, body)
+        if key not in self.cassette.responses:
+            return self.respond(request, 404, {"error": f"not recorded: {key}"})
+        return self.respond(request, 200, self.cassette.responses[key])
+
+    def respond(self, request, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
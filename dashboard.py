@@ -3,7 +3,8 @@ import streamlit as st
 
 history = st.Page("pages/1_fundingRateAndApyHistory.py", title="Funding Rate and APY Monitor", icon="📊")
 arbitrage = st.Page("pages/2_fundingRateArbitrage.py", title="Funding Rate Arbitrage", icon="📊")
+exchange_history = st.Page("pages/3_fundingRateHistory.py", title="Cross-Exchange Funding History", icon="📊")
 
-pg = st.navigation([history, arbitrage])
+pg = st.navigation([history, arbitrage, exchange_history])
 st.set_page_config(page_title="Reya Dashboard", page_icon=":material/home:")
 pg.run()
\ No newline at end of file
@@ -1,61 +1,136 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
-import mysql.connector
 
-DB_HOST = st.secrets["DB_HOST"]
-DB_PORT = st.secrets["DB_PORT"]
-DB_USER = st.secrets["DB_USER"]
-DB_PASSWORD = st.secrets["DB_PASSWORD"]
-DB_SCHEMA = st.secrets["DB_SCHEMA"]
+from Storage import open_storage
+from pages.common import snapshot_api
+from pages.common.analytics import backend
+from pages.common.charts import CHART_WIDTH, DOWNSAMPLE_METHOD, averages_chart, chart_frame, line_chart
+from pages.common.timeseries import forward_fill
+
+# "mariadb", or "sqlite" with the file DB_PATH written by a local crawler
+DB_BACKEND = st.secrets.get("DB_BACKEND", "mariadb")
+DB_PATH = st.secrets.get("DB_PATH", "reya.db")
+DB_HOST = st.secrets.get("DB_HOST", "localhost")
+DB_PORT = st.secrets.get("DB_PORT", 3306)
+DB_USER = st.secrets.get("DB_USER")
+DB_PASSWORD = st.secrets.get("DB_PASSWORD")
+DB_SCHEMA = st.secrets.get("DB_SCHEMA")
+# Parquet export of SnapshotExport, read instead of the database if configured
+EXPORT_DIR = st.secrets.get("EXPORT_DIR")
+# SnapshotApi.py, asked for the latest snapshot id instead of the database if configured
+SNAPSHOT_API_URL = st.secrets.get("SNAPSHOT_API_URL")
+# "pandas" or "duckdb" (optional dependency), both compute the same frames
+ANALYTICS_BACKEND = st.secrets.get("ANALYTICS_BACKEND", "pandas")
+# seconds between two checks for a new snapshot in live mode
+LIVE_SECONDS = 30
 
 st.set_page_config(page_title="Funding Rate Monitor", layout="wide")
 
 st.title("📈 Reya Funding Rate and APY Monitor")
 
+analytics = st.cache_resource(backend)(ANALYTICS_BACKEND)
+
 
 # --- DB CONNECTION ---
-def get_connection():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_SCHEMA,
-    )
+@st.cache_resource
+def get_storage():
+    return open_storage(DB_BACKEND, path=DB_PATH, schema=DB_SCHEMA, user=DB_USER, password=DB_PASSWORD,
+                        host=DB_HOST, port=DB_PORT, driver="mysql-connector")
 
 
 # --- LOAD DATA WITH TIME FILTER ---
 def load_funding_data(days=30):
-    conn = get_connection()
-    # Aggregate to hourly for data older than 7 days
-    query = """
-            SELECT symbol, timestamp, fundingRate, fundingRateAnnualized
-            FROM fundingrate
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+    if EXPORT_DIR:
+        df = analytics.read_history(EXPORT_DIR, "fundingrate", days,
+                          columns=["symbol", "fundingRate", "fundingRateAnnualized", "valid_until"])
+        if df is not None:
+            return df[["symbol", "timestamp", "fundingRate", "fundingRateAnnualized", "valid_until"]]
+    storage = get_storage()
+    query = f"""
+            SELECT symbol, timestamp, fundingRate, fundingRateAnnualized, valid_until
+            FROM fundingrate_v
+            WHERE timestamp >= {storage.days_ago()}
             ORDER BY timestamp ASC \
             """
-    df = pd.read_sql(query, conn, params=(days,))
-    conn.close()
+    df = storage.read_sql(query, params=(days,))
     df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["valid_until"] = pd.to_datetime(df["valid_until"])
     return df
 
 
 def load_staking_apy(days=30):
-    conn = get_connection()
-    query = """
+    if EXPORT_DIR:
+        df = analytics.read_history(EXPORT_DIR, "staking", days, columns=["stakeApy", "sharePrice", "valid_until"])
+        if df is not None:
+            return df[["timestamp", "stakeApy", "sharePrice", "valid_until"]]
+    storage = get_storage()
+    query = f"""
             SELECT
-                timestamp, stakeApy, sharePrice
+                timestamp, stakeApy, sharePrice, valid_until
             FROM staking
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            WHERE timestamp >= {storage.days_ago()}
             ORDER BY timestamp ASC \
             """
-    df = pd.read_sql(query, conn, params=(days,))
-    conn.close()
+    df = storage.read_sql(query, params=(days,))
     df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["valid_until"] = pd.to_datetime(df["valid_until"])
+    return df
+
+
+def load_rolling_averages(series, days=30):
+    """Hourly 7D/30D averages precomputed by RollingAverages"""
+    storage = get_storage()
+    query = f"""
+            SELECT s.name AS symbol, r.hour, r.avg_7d, r.avg_30d
+            FROM rollingaverage r
+            LEFT JOIN symbol s ON s.id = r.symbol_id
+            WHERE r.series = %s AND r.hour >= {storage.days_ago()}
+            ORDER BY r.hour ASC \
+            """
+    df = storage.read_sql(query, params=(series, days + 1))
+    df["hour"] = pd.to_datetime(df["hour"])
     return df
 
 
+@st.cache_data(ttl=LIVE_SECONDS / 3)
+def load_snapshot_version():
+    """Id of the last snapshot the crawler finished, changes once per cycle"""
+    if SNAPSHOT_API_URL:
+        return snapshot_api.status(SNAPSHOT_API_URL)["snapshot_id"]
+    df = get_storage().read_sql("SELECT MAX(id) AS id FROM snapshot WHERE duration IS NOT NULL")
+    return int(df["id"].iloc[0] or 0)
+
+
+# version is only the cache key, every viewer shares the frames of a snapshot until the next one is written
+@st.cache_data(max_entries=8)
+def load_history(version, days):
+    """Funding and staking rows of the last days on the crawler's grid, downsampled and joined with their averages"""
+    df_funding = load_funding_data(days=days)
+    df_staking = load_staking_apy(days=days)
+    df_funding_averages = load_rolling_averages("funding", days=days)
+    df_staking_averages = load_rolling_averages("staking", days=days).drop(columns="symbol")
+
+    # rows are only written on changes, expand them to the crawler's 5 minute grid
+    df_funding = forward_fill(df_funding, "5min", group_col="symbol", valid_col="valid_until").drop(columns="valid_until")
+    df_staking = forward_fill(df_staking, "5min", valid_col="valid_until").drop(columns="valid_until")
+
+    # keep the rows that shape the lines at the chart's resolution, spikes included
+    df_funding = analytics.downsample(df_funding, "fundingRateAnnualized", group_col="symbol", points=CHART_WIDTH,
+                                      method=DOWNSAMPLE_METHOD)
+    df_staking = analytics.downsample(df_staking, "stakeApy", points=CHART_WIDTH, method=DOWNSAMPLE_METHOD)
+
+    # Precomputed rolling averages per symbol
+    df_funding = analytics.join_averages(df_funding, df_funding_averages, prefix="funding", group_col="symbol")
+
+    # Convert decimal (0.21) → percent (21.0)
+    df_staking["stakeApy_pct"] = df_staking["stakeApy"] * 100
+
+    # Precomputed rolling averages, in percent like the raw APY
+    df_staking = analytics.join_averages(df_staking, df_staking_averages, prefix="stakeApy")
+    df_staking[["stakeApy_7d", "stakeApy_30d"]] *= 100
+    return df_funding, df_staking
+
+
 # Sidebar - Time Range Filter (at the top)
 st.sidebar.subheader("⏱️ Time Range")
 time_options = {
@@ -74,228 +149,105 @@ days_to_load = time_options[time_range]
 
 # Load data with time filter
 with st.spinner("Loading data from database..."):
-    df_funding = load_funding_data(days=days_to_load)
-    print(f"funding data: Loaded {len(df_funding)} rows from database ✅")
-    df_staking = load_staking_apy(days=days_to_load)
-    print(f"staking data: Loaded {len(df_staking)} rows from database ✅")
-
-
-# Downsample if still too many points
-def smart_downsample(df, time_col='timestamp', max_points=2000):
-    """Intelligently downsample based on data volume"""
-    if len(df) <= max_points:
-        return df
-
-    # Calculate appropriate frequency
-    time_span = (df[time_col].max() - df[time_col].min()).total_seconds()
-    target_freq_seconds = time_span / max_points
-
-    if target_freq_seconds < 3600:  # Less than 1 hour
-        freq = '1H'
-    elif target_freq_seconds < 86400:  # Less than 1 day
-        freq = '6H'
-    else:
-        freq = '1D'
-
-    if 'symbol' in df.columns:
-        return (df.set_index(time_col)
-                .groupby('symbol')
-                .resample(freq)
-                .mean()
-                .reset_index())
-    else:
-        return (df.set_index(time_col)
-                .resample(freq)
-                .mean()
-                .reset_index())
-
-
-df_funding = smart_downsample(df_funding)
-df_staking = smart_downsample(df_staking)
+    df_funding, df_staking = load_history(load_snapshot_version(), days_to_load)
 
 # Sidebar - Symbol filters
 symbols = df_funding["symbol"].unique().tolist()
 selected_symbols = st.sidebar.multiselect("Select symbols", symbols, default=symbols)
 
-# Filter data
-filtered_df = df_funding[df_funding["symbol"].isin(selected_symbols)]
-
-# --- INFO CARDS ---
-st.subheader("📊 Latest Funding Rates")
-if selected_symbols:
-    cols = st.columns(len(selected_symbols))
-    for i, symbol in enumerate(selected_symbols):
-        sub_df = filtered_df[filtered_df["symbol"] == symbol]
-        if not sub_df.empty:
-            latest = sub_df.sort_values("timestamp").iloc[-1]
-            try:
-                annualized = float(latest['fundingRateAnnualized'])
-                annualized_str = f"{annualized:.2f}%"
-            except:
-                annualized_str = str(latest['fundingRateAnnualized'])
-            cols[i].metric(
-                label=f"{symbol} (annualized)",
-                value=annualized_str
-            )
-
-st.subheader("📊 Latest sRUSD APY")
-cols = st.columns(2)
-if not df_staking.empty:
-    latest = df_staking.sort_values("timestamp").iloc[-1]
-
-    try:
-        annualized = float(latest['stakeApy'])
-        annualized_str = f"{annualized * 100:.2f}%"
-    except:
-        annualized_str = str(latest['stakeApy'])
-
-    cols[0].metric(
-        label=f"RUSD APY",
-        value=annualized_str
-    )
-    cols[1].metric(
-        label=f"RUSD SharePrice",
-        value=f"{latest['sharePrice']:.4f}"
-    )
-
-# Annualized funding rate chart with legend
-st.subheader("Funding Rate Over Time")
-annualized_chart = (
-    alt.Chart(filtered_df)
-    .mark_line(point=False)  # Remove points for performance
-    .encode(
-        x=alt.X("timestamp:T", axis=alt.Axis(format="%d.%m %H:%M")),
-        y=alt.Y("fundingRateAnnualized:Q", title="Annualized Funding Rate (%)"),
-        color="symbol:N",
-        tooltip=["timestamp:T", "symbol:N", alt.Tooltip("fundingRateAnnualized:Q", format=".2f")]
-    )
-    .interactive()
-)
-st.altair_chart(annualized_chart, use_container_width=True)
-
-# Convert decimal (0.21) → percent (21.0)
-df_staking["stakeApy_pct"] = df_staking["stakeApy"] * 100
-
-# Set timestamp as index for rolling
-df_staking = df_staking.set_index("timestamp")
-
-# Rolling averages (time-based)
-df_staking["stakeApy_7d"] = (
-    df_staking["stakeApy_pct"]
-    .rolling("7D", min_periods=1).mean()
-    .reset_index(level=0, drop=True)
-)
-
-df_staking["stakeApy_30d"] = (
-    df_staking["stakeApy_pct"]
-    .rolling("30D", min_periods=1).mean()
-    .reset_index(level=0, drop=True)
-)
-
-# Reset index
-df_staking = df_staking.reset_index()
-
-st.subheader("Average APY")
-
-avg_chart = (
-    alt.Chart(df_staking)
-    .transform_fold(
-        ["stakeApy_pct", "stakeApy_7d", "stakeApy_30d"],
-        as_=["metric", "value"]
-    )
-    .transform_calculate(
-        metric_label=f"datum.metric == 'stakeApy_pct' ? 'Raw APY' : "
-                     f"datum.metric == 'stakeApy_7d' ? '7D Avg' : '30D Avg'"
-    )
-    .mark_line(point=False)
-    .encode(
-        x=alt.X("timestamp:T", axis=alt.Axis(format="%d.%m %H:%M")),
-        y=alt.Y("value:Q", title="APY (%)"),
-        color=alt.Color("metric_label:N", title="Metric"),
-        tooltip=["timestamp:T", "metric_label:N", alt.Tooltip("value:Q", format=".2f")]
-    )
-    .interactive()
-)
-
-st.altair_chart(avg_chart, use_container_width=True)
-
-st.subheader("Funding Rate Averages")
-
-# Set timestamp as index for rolling
-filtered_df = filtered_df.sort_values(["symbol", "timestamp"]).drop_duplicates(subset=["symbol", "timestamp"])
-filtered_df = filtered_df.set_index("timestamp")
-
-filtered_df["funding_7d"] = (
-    filtered_df.groupby("symbol")["fundingRateAnnualized"]
-    .rolling("7D", min_periods=1).mean()
-    .reset_index(level=0, drop=True)
-)
-
-filtered_df["funding_30d"] = (
-    filtered_df.groupby("symbol")["fundingRateAnnualized"]
-    .rolling("30D", min_periods=1).mean()
-    .reset_index(level=0, drop=True)
-)
-
-# Reset index
-filtered_df = filtered_df.reset_index()
-
-# Melt for Altair
-avg_df = filtered_df.melt(
-    id_vars=["timestamp", "symbol"],
-    value_vars=["fundingRateAnnualized", "funding_7d", "funding_30d"],
-    var_name="metric",
-    value_name="value"
-)
-
-# Map column names to friendly labels
-metric_map = {
-    "fundingRateAnnualized": "Raw Funding Rate",
-    "funding_7d": "7D Avg",
-    "funding_30d": "30D Avg"
-}
-avg_df["metric_label"] = avg_df["metric"].map(metric_map)
-
-# Plot
-annualized_chart = (
-    alt.Chart(avg_df)
-    .mark_line(point=False)
-    .encode(
-        x=alt.X("timestamp:T", axis=alt.Axis(format="%d.%m %H:%M")),
-        y=alt.Y("value:Q", title="Funding Rate (%)"),
-        color=alt.Color("symbol:N", title="Symbol"),
-        strokeDash="metric_label:N",
-        tooltip=["timestamp:T", "symbol:N", "metric_label:N", alt.Tooltip("value:Q", format=".2f")]
-    )
-    .interactive()
-)
-
-st.altair_chart(annualized_chart, use_container_width=True)
-
-# Hourly funding rate chart
-st.subheader("Hourly Funding Rate Over Time")
-funding_chart = (
-    alt.Chart(filtered_df)
-    .mark_line(point=False)
-    .encode(
-        x=alt.X("timestamp:T", axis=alt.Axis(format="%d.%m %H:%M")),
-        y=alt.Y("fundingRate:Q", title="Hourly Funding Rate (%)"),
-        color="symbol:N",
-        tooltip=["timestamp:T", "symbol:N", alt.Tooltip("fundingRate:Q", format=".4f")]
-    )
-    .interactive()
-)
-st.altair_chart(funding_chart, use_container_width=True)
-
-# Show data info
-st.sidebar.markdown("---")
-st.sidebar.info(f"📊 Showing {len(filtered_df)} funding data points\n\n📊 Showing {len(df_staking)} staking data points")
-
-# Show table
-with st.expander("📂 Funding Rate Data"):
-    st.dataframe(filtered_df.sort_values("timestamp", ascending=False))
-with st.expander("📂 Staking Data"):
-    st.dataframe(df_staking.sort_values("timestamp", ascending=False))
+live = st.sidebar.toggle(f"🔄 Live ({LIVE_SECONDS}s)", value=False,
+                         help="Reruns only the cards, charts and tables, they reload once the crawler wrote a new snapshot")
+
+
+# Only this fragment reruns in live mode, the controls in the sidebar stay as they are
+@st.fragment(run_every=LIVE_SECONDS if live else None)
+def history_section():
+    df_funding, df_staking = load_history(load_snapshot_version(), days_to_load)
+
+    # Filter data
+    filtered_df = df_funding[df_funding["symbol"].isin(selected_symbols)]
+
+    # --- INFO CARDS ---
+    st.subheader("📊 Latest Funding Rates")
+    if selected_symbols:
+        cols = st.columns(len(selected_symbols))
+        for i, symbol in enumerate(selected_symbols):
+            sub_df = filtered_df[filtered_df["symbol"] == symbol]
+            if not sub_df.empty:
+                latest = sub_df.sort_values("timestamp").iloc[-1]
+                try:
+                    annualized = float(latest['fundingRateAnnualized'])
+                    annualized_str = f"{annualized:.2f}%"
+                except:
+                    annualized_str = str(latest['fundingRateAnnualized'])
+                cols[i].metric(
+                    label=f"{symbol} (annualized)",
+                    value=annualized_str
+                )
+
+    st.subheader("📊 Latest sRUSD APY")
+    cols = st.columns(2)
+    if not df_staking.empty:
+        latest = df_staking.sort_values("timestamp").iloc[-1]
+
+        try:
+            annualized = float(latest['stakeApy'])
+            annualized_str = f"{annualized * 100:.2f}%"
+        except:
+            annualized_str = str(latest['stakeApy'])
+
+        cols[0].metric(
+            label=f"RUSD APY",
+            value=annualized_str
+        )
+        cols[1].metric(
+            label=f"RUSD SharePrice",
+            value=f"{latest['sharePrice']:.4f}"
+        )
+
+    # Annualized funding rate chart with legend
+    st.subheader("Funding Rate Over Time")
+    # every chart only gets its own columns, averaged down to a fixed number of points
+    annualized_chart = line_chart(chart_frame(filtered_df, "fundingRateAnnualized"), "fundingRateAnnualized",
+                                  "Annualized Funding Rate (%)", "symbol")
+    st.altair_chart(annualized_chart, use_container_width=True)
+
+    st.subheader("Average APY")
+
+    avg_chart = averages_chart(df_staking, {"stakeApy_pct": "Raw APY", "stakeApy_7d": "7D Avg", "stakeApy_30d": "30D Avg"},
+                               "APY (%)")
+
+    st.altair_chart(avg_chart, use_container_width=True)
+
+    st.subheader("Funding Rate Averages")
+
+    # Map column names to friendly labels, folded into long format before the chart
+    metric_map = {
+        "fundingRateAnnualized": "Raw Funding Rate",
+        "funding_7d": "7D Avg",
+        "funding_30d": "30D Avg"
+    }
+    annualized_chart = averages_chart(filtered_df, metric_map, "Funding Rate (%)", color_title="Symbol")
+
+    st.altair_chart(annualized_chart, use_container_width=True)
+
+    # Hourly funding rate chart
+    st.subheader("Hourly Funding Rate Over Time")
+    funding_chart = line_chart(chart_frame(filtered_df, "fundingRate"), "fundingRate", "Hourly Funding Rate (%)",
+                               "symbol", value_format=".4f")
+    st.altair_chart(funding_chart, use_container_width=True)
+
+    # Show data info
+    st.caption(f"📊 Showing {len(filtered_df)} funding data points | 📊 Showing {len(df_staking)} staking data points")
+
+    # Show table
+    with st.expander("📂 Funding Rate Data"):
+        st.dataframe(filtered_df.sort_values("timestamp", ascending=False))
+    with st.expander("📂 Staking Data"):
+        st.dataframe(df_staking.sort_values("timestamp", ascending=False))
+
+
+history_section()
 
 # --- Footer ---
 st.markdown("---")
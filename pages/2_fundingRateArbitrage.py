@@ -1,19 +1,40 @@
 
+import logging
+
 import streamlit as st
 import pandas as pd
 from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
 import plotly.graph_objects as go
-from datetime import datetime
-import mysql.connector
+from peewee import DatabaseError
+
+from FundingStatistics import FundingStatistics
+from Storage import open_storage
+from pages.common import snapshot_api
+from pages.common.snapshots import latest_version, read_latest
+from pages.common.analytics import backend
+from pages.common.transforms import best_arbitrage_opportunities, find_best_arbitrage_opportunities
 
 st.set_page_config(page_title="Funding Rate Heatmap", layout="wide")
 st.title("📊 Funding Rates")
 
-DB_HOST = st.secrets["DB_HOST"]
-DB_PORT = st.secrets["DB_PORT"]
-DB_USER = st.secrets["DB_USER"]
-DB_PASSWORD = st.secrets["DB_PASSWORD"]
-DB_SCHEMA = st.secrets["DB_SCHEMA"]
+# "mariadb", or "sqlite" with the file DB_PATH written by a local crawler
+DB_BACKEND = st.secrets.get("DB_BACKEND", "mariadb")
+DB_PATH = st.secrets.get("DB_PATH", "reya.db")
+DB_HOST = st.secrets.get("DB_HOST", "localhost")
+DB_PORT = st.secrets.get("DB_PORT", 3306)
+DB_USER = st.secrets.get("DB_USER")
+DB_PASSWORD = st.secrets.get("DB_PASSWORD")
+DB_SCHEMA = st.secrets.get("DB_SCHEMA")
+# latest.arrow of SnapshotExport, read instead of the database if configured
+EXPORT_DIR = st.secrets.get("EXPORT_DIR")
+# SnapshotApi.py, read instead of the export and the database if configured
+SNAPSHOT_API_URL = st.secrets.get("SNAPSHOT_API_URL")
+# "pandas" or "duckdb" (optional dependency), both compute the same frames
+ANALYTICS_BACKEND = st.secrets.get("ANALYTICS_BACKEND", "pandas")
+# seconds between two checks for a new snapshot in live mode
+LIVE_SECONDS = 30
+
+analytics = st.cache_resource(backend)(ANALYTICS_BACKEND)
 
 # --- Exchange configurations ---
 ALL_EXCHANGES = {
@@ -32,38 +53,127 @@ ALL_EXCHANGES = {
 
 SYMBOLS = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT']
 
+# /arbitrage columns of SnapshotApi -> columns of find_best_arbitrage_opportunities
+ARBITRAGE_COLUMNS = {
+    "symbol": "Symbol",
+    "long_exchange": "Long Exchange",
+    "long_rate": "Long Rate (1h)",
+    "long_rate_1y": "Long Rate (1Y)",
+    "short_exchange": "Short Exchange",
+    "short_rate": "Short Rate (1h)",
+    "short_rate_1y": "Short Rate (1Y)",
+    "spread": "Spread (1h)",
+    "spread_1y": "Spread (1Y)",
+}
+
 # --- DB CONNECTION ---
-def get_connection():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_SCHEMA,
-    )
+@st.cache_resource
+def get_storage():
+    return open_storage(DB_BACKEND, path=DB_PATH, schema=DB_SCHEMA, user=DB_USER, password=DB_PASSWORD,
+                        host=DB_HOST, port=DB_PORT, driver="mysql-connector")
 
 # --- LOAD DATA ---
 def load_funding_data():
-    conn = get_connection()
+    if SNAPSHOT_API_URL:
+        return snapshot_api.read_latest(SNAPSHOT_API_URL).sort_values("timestamp", ascending=False)
+    if EXPORT_DIR:
+        df = read_latest(EXPORT_DIR)
+        if df is not None:
+            return df.sort_values("timestamp", ascending=False)
     query = """
-        SELECT f.*
-        FROM fundingdata f
+        SELECT f.symbol, f.exchange, f.rate, f.rate_1y, f.next_funding, f.`interval`, f.timestamp
+        FROM fundingdata_v f
         JOIN (
-            SELECT symbol, exchange, MAX(timestamp) AS max_ts
+            SELECT symbol_id, exchange_id, MAX(timestamp) AS max_ts
             FROM fundingdata
-            GROUP BY symbol, exchange
+            GROUP BY symbol_id, exchange_id
         ) latest
-          ON f.symbol = latest.symbol
-        AND f.exchange = latest.exchange
+          ON f.symbol_id = latest.symbol_id
+        AND f.exchange_id = latest.exchange_id
         AND f.timestamp = latest.max_ts ORDER BY TIMESTAMP desc;
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    df = get_storage().read_sql(query)
     # Convert timestamps
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     return df
 
 
+def load_spread_statistics():
+    """Streaming spread statistics checkpointed by the crawler, empty if there is no checkpoint yet"""
+    try:
+        df = get_storage().read_sql("SELECT series, state FROM statisticscheckpoint WHERE series LIKE 'spread|%'")
+        rows = df.itertuples(index=False, name=None)
+    except DatabaseError as e:
+        logging.warning(f"spread statistics not available: {e}")
+        rows = []
+    return FundingStatistics.from_rows(rows)
+
+
+@st.cache_data(ttl=LIVE_SECONDS / 3)
+def load_snapshot_version():
+    """Changes when the crawler finished a cycle: the API's snapshot id, the mtime of latest.arrow or the id of
+    the last finished snapshot"""
+    if SNAPSHOT_API_URL:
+        return snapshot_api.status(SNAPSHOT_API_URL)["snapshot_id"]
+    if EXPORT_DIR:
+        version = latest_version(EXPORT_DIR)
+        if version is not None:
+            return version
+    df = get_storage().read_sql("SELECT MAX(id) AS id FROM snapshot WHERE duration IS NOT NULL")
+    return int(df["id"].iloc[0] or 0)
+
+
+# version is only the cache key, every viewer shares the frames of a snapshot until the next one is written
+@st.cache_data(max_entries=8)
+def load_snapshot(version, exchanges):
+    """Latest rates of the exchanges and the pivot, opportunities and hourly rates derived from them, None if empty"""
+    funding_data = load_funding_data()
+    if funding_data is None or len(funding_data) == 0:
+        return None
+
+    last_update = funding_data.iloc[-1]["timestamp"]
+    funding_data = funding_data.rename(columns={
+        "symbol": "Symbol",
+        "exchange": "Exchange",
+        "rate": "Rate",
+        "rate_1y": "Yearly Rate",
+        "next_funding": "Next Funding",
+        "interval": "Interval"
+    })
+    funding_data = funding_data.drop(columns="timestamp")
+    df = funding_data[funding_data["Exchange"].isin(exchanges)]
+
+    # Create pivot table for heatmap
+    df_pivot = analytics.pivot_rates(df, 'Yearly Rate', fill_value=0)  # Fill NaN values with 0
+
+    if SNAPSHOT_API_URL:
+        # every pair is computed by the API once per snapshot, only the selected exchanges are kept
+        arb_df_all = snapshot_api.read_arbitrage(SNAPSHOT_API_URL).rename(columns=ARBITRAGE_COLUMNS)
+        arb_df_all = arb_df_all[arb_df_all["Long Exchange"].isin(exchanges) &
+                                arb_df_all["Short Exchange"].isin(exchanges)].reset_index(drop=True)
+        arb_df = best_arbitrage_opportunities(arb_df_all)
+    else:
+        arb_df, arb_df_all = find_best_arbitrage_opportunities(df)
+    spread_statistics = load_spread_statistics()
+    arb_df = add_spread_statistics(arb_df, spread_statistics)
+    arb_df_all = add_spread_statistics(arb_df_all, spread_statistics)
+
+    df_symbol_rate = analytics.pivot_rates(df[["Exchange", "Symbol", "Rate"]], "Rate").reset_index()
+    return last_update, df, df_pivot, arb_df, arb_df_all, df_symbol_rate
+
+
+def add_spread_statistics(df, statistics):
+    """z-score against the 7D EWMA and percentile rank of the yearly spread of each opportunity"""
+    if df.empty:
+        return df
+    described = [statistics.describe_spread(row["Symbol"], row["Long Exchange"], row["Short Exchange"], row["Spread (1Y)"])
+                 or {} for _, row in df.iterrows()]
+    df = df.copy()
+    df["Spread z-score"] = [d.get("zscore") for d in described]
+    df["Spread Percentile"] = [d.get("percentile") for d in described]
+    return df
+
+
 def create_heatmap(df_pivot):
     """Create a heatmap using Plotly"""
 
@@ -103,68 +213,6 @@ def create_heatmap(df_pivot):
     return fig
 
 
-# ==========================
-# Arbitrage Detection
-# ==========================
-def find_best_arbitrage_opportunities(df):
-    best_results = []
-    all_results = []
-    for symbol in df["Symbol"].unique():
-        sub = df[df["Symbol"] == symbol]
-        positives = sub[sub["Rate"] > 0]
-        negatives = sub[sub["Rate"] < 0]
-
-        if positives.empty or negatives.empty:
-            continue  # no arbitrage possible for this symbol
-
-        # Find max positive & min negative
-        best_pos = positives.loc[positives["Rate"].idxmax()]
-        best_neg = negatives.loc[negatives["Rate"].idxmin()]
-
-        if "reya" in (best_pos["Exchange"].lower(), best_neg["Exchange"].lower()):
-            # # Compare all positive vs negative exchanges
-            # for _, pos in positives.iterrows():
-            #     for _, neg in negatives.iterrows():
-            #         best_results.append({
-            #             "Symbol": symbol,
-            #             "Long Exchange": neg["Exchange"],
-            #             "Long Rate": neg["Rate"],
-            #             "Short Exchange": pos["Exchange"],
-            #             "Short Rate": pos["Rate"],
-            #             "Spread": pos["Rate"] - neg["Rate"]
-            #         })
-            best_results.append({
-                "Symbol": symbol,
-                "Long Exchange": best_neg["Exchange"],
-                "Long Rate (1h)": best_neg["Rate"],
-                "Long Rate (1Y)": best_neg["Yearly Rate"],
-                "Short Exchange": best_pos["Exchange"],
-                "Short Rate (1h)": best_pos["Rate"],
-                "Short Rate (1Y)": best_pos["Yearly Rate"],
-                "Spread (1h)": best_pos["Rate"] - best_neg["Rate"],
-                "Spread (1Y)": best_pos["Yearly Rate"] - best_neg["Yearly Rate"]
-            })
-
-        # Compare ALL positives vs negatives
-        for _, pos in positives.iterrows():
-            for _, neg in negatives.iterrows():
-                all_results.append({
-                    "Symbol": symbol,
-                    "Long Exchange": neg["Exchange"],
-                    "Long Rate (1h)": neg["Rate"],
-                    "Long Rate (1Y)": neg["Yearly Rate"],
-                    "Short Exchange": pos["Exchange"],
-                    "Short Rate (1h)": pos["Rate"],
-                    "Short Rate (1Y)": pos["Yearly Rate"],
-                    "Spread (1h)": pos["Rate"] - neg["Rate"],
-                    "Spread (1Y)": pos["Yearly Rate"] - neg["Yearly Rate"],
-                })
-    all_results = pd.DataFrame(all_results).sort_values(by="Spread (1h)", ascending=False)
-    best_results = pd.DataFrame(best_results).sort_values(by="Spread (1h)", ascending=False)
-
-    return pd.DataFrame(best_results), pd.DataFrame(all_results)
-
-
 # --- Sidebar Controls ---
 st.sidebar.header("⚙️ Controls")
 
@@ -189,246 +237,222 @@ if st.sidebar.button("🔄 Refresh Data", type="primary"):
     st.cache_data.clear()
     st.rerun()
 
-# auto_refresh = st.sidebar.checkbox("🔄 Auto-refresh (30s)", value=False)
-#
-# if auto_refresh:
-#     st.sidebar.info("Auto-refresh enabled")
-#     # Auto refresh every 30 seconds
-#     import time
-#
-#     time.sleep(30)
-#     st.rerun()
-
-# Show last update time
-if 'last_update' not in st.session_state:
-    st.session_state.last_update = datetime.now()
+live = st.sidebar.toggle(f"🔄 Live ({LIVE_SECONDS}s)", value=False,
+                         help="Reruns only the data sections, they reload once the crawler wrote a new snapshot")
 
 
 # --- Main Content ---
-try:
-    # Fetch funding rates
-
-    with st.spinner("Loading data from database..."):
-        funding_data = load_funding_data()
-        print(f"funding data: Loaded {len(funding_data)} entries from database ✅")
-
-    if funding_data is None or len(funding_data) == 0:
-        st.error("❌ No funding rate data available. Please check your internet connection or try again later.")
-        st.stop()
-
-    # Update last update time
-    st.session_state.last_update = funding_data.iloc[-1]["timestamp"]
-    st.sidebar.info(f"**Last updated:**  \n{st.session_state.last_update.strftime('%Y-%m-%d %H:%M:%S')} (UTC)")
-    funding_data = funding_data.rename(columns={
-        "symbol": "Symbol",
-        "exchange": "Exchange",
-        "rate": "Rate",
-        "rate_1y": "Yearly Rate",
-        "next_funding": "Next Funding",
-        "interval": "Interval"
-    })
-    funding_data = funding_data.drop(columns="timestamp")
-    funding_data = funding_data[funding_data["Exchange"].isin(selected_exchanges)]
-    df = funding_data
-
-
-    # Create pivot table for heatmap
-    df_pivot = df.pivot(index='Symbol', columns='Exchange', values='Yearly Rate')
-    df_pivot = df_pivot.fillna(0)  # Fill NaN values with 0
-
-    # Display metrics
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        st.metric("📊 Total Symbols", len(df_pivot.index))
-
-    with col2:
-        st.metric("🏢 Total Exchanges", len(df_pivot.columns))
-
-    with col3:
-        highest_rate = df['Yearly Rate'].max()
-        st.metric("📈 Highest Rate", f"{highest_rate:.3f}%")
-
-    with col4:
-        lowest_rate = df['Yearly Rate'].min()
-        st.metric("📉 Lowest Rate", f"{lowest_rate:.3f}%")
-
-    # Create two tabs
-    tab1, tab2 = st.tabs(["📊 Arbitrage Opportunities", "📋 Data Table"])
-
-    with tab1:
-        st.subheader("📊 Arbitrage Opportunities")
-        st.markdown("Finds all pairs with the biggest spread between a negative and a positive rate between reya and another exchange.")
-
-        arb_df, arb_df_all = find_best_arbitrage_opportunities(df)
+# Only this fragment reruns in live mode, the page around it stays as rendered
+@st.fragment(run_every=LIVE_SECONDS if live else None)
+def snapshot_section():
+    try:
+        with st.spinner("Loading data from database..."):
+            snapshot = load_snapshot(load_snapshot_version(), tuple(sorted(selected_exchanges)))
+
+        if snapshot is None:
+            st.error("❌ No funding rate data available. Please check your internet connection or try again later.")
+            return
+        last_update, df, df_pivot, arb_df, arb_df_all, df_symbol_rate = snapshot
+
+        st.caption(f"**Last updated:** {last_update.strftime('%Y-%m-%d %H:%M:%S')} (UTC)"
+                   + (f" | 🔄 live, checked every {LIVE_SECONDS}s" if live else ""))
+
+        # Display metrics
+        col1, col2, col3, col4 = st.columns(4)
+
+        with col1:
+            st.metric("📊 Total Symbols", len(df_pivot.index))
+
+        with col2:
+            st.metric("🏢 Total Exchanges", len(df_pivot.columns))
+
+        with col3:
+            highest_rate = df['Yearly Rate'].max()
+            st.metric("📈 Highest Rate", f"{highest_rate:.3f}%")
+
+        with col4:
+            lowest_rate = df['Yearly Rate'].min()
+            st.metric("📉 Lowest Rate", f"{lowest_rate:.3f}%")
+
+        # Create two tabs
+        tab1, tab2 = st.tabs(["📊 Arbitrage Opportunities", "📋 Data Table"])
+
+        with tab1:
+            st.subheader("📊 Arbitrage Opportunities")
+            st.markdown("Finds all pairs with the biggest spread between a negative and a positive rate between reya and another exchange.")
+
+            tabArb1, tabArb2 = st.tabs(["🚀 Best Arbitrage Opportunities", "📋 All Arbitrage Opportunities"])
+            with tabArb1:
+                st.subheader("🚀 Best Arbitrage Opportunities")
+
+                for _, row in arb_df.iterrows():
+                    spread_color = "#228B22" if row['Spread (1h)'] > 0 else "#B22222"
+                    statistics_line = ""
+                    if pd.notna(row['Spread z-score']):
+                        statistics_line = (f"<p style=\"margin:4px 0;\">📊 z-score <b>{row['Spread z-score']:+.2f}</b> | "
+                                           f"percentile <b>{row['Spread Percentile']:.0f}%</b></p>")
+                    with st.container():
+                        st.markdown(f"""
+                             <div style="padding:18px; border-radius:14px; margin-bottom:14px;
+                                         background: linear-gradient(135deg, #f0f4f8, #d9e2ec);
+                                         color:#1a1a1a; font-family:Arial, sans-serif;
+                                         box-shadow: 0px 3px 8px rgba(0,0,0,0.12)">
+                                 <h3 style="margin:0; color:#2c5282;">{row['Symbol']}</h3>
+                                 <p style="margin:4px 0;">📈 <b>Long</b> on <b>{row['Long Exchange']}</b> 
+                                    at <b>{row['Long Rate (1h)']:.4f}% (1h)</b> | <b>{row['Long Rate (1Y)']:.2f}% (1Y)</b></p>
+                                 <p style="margin:4px 0;">📉 <b>Short</b> on <b>{row['Short Exchange']}</b> 
+                                    at <b>{row['Short Rate (1h)']:.4f}% (1h)</b> | <b>{row['Short Rate (1Y)']:.2f}% (1Y)</b></p>
+                                 <h4 style="margin:8px 0; color:{spread_color};">
+                                     Spread: {row['Spread (1h)']:.4f}% (1h) | {row['Spread (1Y)']:.2f}% (1Y)
+                                 </h4>
+                                 {statistics_line}
+                             </div>
+                             """, unsafe_allow_html=True)
+                if (len(arb_df) == 0):
+                    st.info("No arbitrage opportunities detected ⚖️")
+
+            with tabArb2:
+                st.subheader("📂 All Arbitrage Opportunities")
+
+                if not arb_df_all.empty:
+                    st.dataframe(
+                        arb_df_all,
+                        column_config={
+                            "Long Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Long Rate (1Y)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Short Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Short Rate (1Y)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Spread Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Short Spread (1Y)": st.column_config.NumberColumn(format="%.6f%%"),
+                            "Spread z-score": st.column_config.NumberColumn(format="%+.2f"),
+                            "Spread Percentile": st.column_config.NumberColumn(format="%.0f%%")
+                        },
+                        use_container_width=True,
+                    )
+
+            # Display heatmap
+            fig = create_heatmap(df_pivot)
+            st.plotly_chart(fig, use_container_width=True)
+
+            # -- funding table --
+
+            st.subheader("Hourly Funding Rates")
+
+            # --- Build AgGrid ---
+            gb = GridOptionsBuilder.from_dataframe(df_symbol_rate)
+
+            # JS for coloring negative green, positive red
+            cell_style_jscode = JsCode("""
+            function(params) {
+                if (params.value < 0) {
+                    return { 'color': 'green', 'font-weight': 'bold' };
+                } else if (params.value > 0) {
+                    return { 'color': 'red', 'font-weight': 'bold' };
+                }
+                return {};
+            }
+            """)
 
-        tabArb1, tabArb2 = st.tabs(["🚀 Best Arbitrage Opportunities", "📋 All Arbitrage Opportunities"])
-        with tabArb1:
-            st.subheader("🚀 Best Arbitrage Opportunities")
-
-            for _, row in arb_df.iterrows():
-                spread_color = "#228B22" if row['Spread (1h)'] > 0 else "#B22222"
-                with st.container():
-                    st.markdown(f"""
-                         <div style="padding:18px; border-radius:14px; margin-bottom:14px;
-                                     background: linear-gradient(135deg, #f0f4f8, #d9e2ec);
-                                     color:#1a1a1a; font-family:Arial, sans-serif;
-                                     box-shadow: 0px 3px 8px rgba(0,0,0,0.12)">
-                             <h3 style="margin:0; color:#2c5282;">{row['Symbol']}</h3>
-                             <p style="margin:4px 0;">📈 <b>Long</b> on <b>{row['Long Exchange']}</b> 
-                                at <b>{row['Long Rate (1h)']:.4f}% (1h)</b> | <b>{row['Long Rate (1Y)']:.2f}% (1Y)</b></p>
-                             <p style="margin:4px 0;">📉 <b>Short</b> on <b>{row['Short Exchange']}</b> 
-                                at <b>{row['Short Rate (1h)']:.4f}% (1h)</b> | <b>{row['Short Rate (1Y)']:.2f}% (1Y)</b></p>
-                             <h4 style="margin:8px 0; color:{spread_color};">
-                                 Spread: {row['Spread (1h)']:.4f}% (1h) | {row['Spread (1Y)']:.2f}% (1Y)
-                             </h4>
-                         </div>
-                         """, unsafe_allow_html=True)
-            if (len(arb_df) == 0):
-                st.info("No arbitrage opportunities detected ⚖️")
-
-        with tabArb2:
-            st.subheader("📂 All Arbitrage Opportunities")
-
-            if not arb_df_all.empty:
-                st.dataframe(
-                    arb_df_all,
-                    column_config={
-                        "Long Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
-                        "Long Rate (1Y)": st.column_config.NumberColumn(format="%.6f%%"),
-                        "Short Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
-                        "Short Rate (1Y)": st.column_config.NumberColumn(format="%.6f%%"),
-                        "Spread Rate (1h)": st.column_config.NumberColumn(format="%.6f%%"),
-                        "Short Spread (1Y)": st.column_config.NumberColumn(format="%.6f%%")
-                    },
-                    use_container_width=True,
+            # JS for formatting values as percentages
+            value_formatter = JsCode("""
+            function(params) {
+                if (params.value === null || params.value === undefined) return '';
+                return (params.value).toFixed(4) + '%';
+            }
+            """)
+
+            for col in df_symbol_rate.columns[1:]:
+                gb.configure_column(
+                    col,
+                    filter=False,
+                    cellStyle=cell_style_jscode,
+                    valueFormatter=value_formatter
                 )
 
-        # Display heatmap
-        fig = create_heatmap(df_pivot)
-        st.plotly_chart(fig, use_container_width=True)
-
-        # -- funding table --
-
-        st.subheader("Hourly Funding Rates")
-        # Convert to DataFrame
-
-        df = pd.DataFrame(funding_data)
-        df_symbol_rate = df[["Exchange", "Symbol", "Rate"]]
-        df_symbol_rate = df_symbol_rate.pivot(index="Symbol", columns="Exchange", values="Rate").reset_index()
-
-        # --- Build AgGrid ---
-        gb = GridOptionsBuilder.from_dataframe(df_symbol_rate)
-
-        # JS for coloring negative green, positive red
-        cell_style_jscode = JsCode("""
-        function(params) {
-            if (params.value < 0) {
-                return { 'color': 'green', 'font-weight': 'bold' };
-            } else if (params.value > 0) {
-                return { 'color': 'red', 'font-weight': 'bold' };
-            }
-            return {};
-        }
-        """)
-
-        # JS for formatting values as percentages
-        value_formatter = JsCode("""
-        function(params) {
-            if (params.value === null || params.value === undefined) return '';
-            return (params.value).toFixed(4) + '%';
-        }
-        """)
-
-        for col in df_symbol_rate.columns[1:]:
-            gb.configure_column(
-                col,
-                filter=False,
-                cellStyle=cell_style_jscode,
-                valueFormatter=value_formatter
+            gb.configure_default_column(resizable=True, filter=False, sortable=True)
+            grid_options = gb.build()
+            #grid_options['domLayout'] = 'autoHeight'
+            # --- Display table ---
+            AgGrid(
+                df_symbol_rate,
+                gridOptions=grid_options,
+                fit_columns_on_grid_load=True,
+                theme="alpine",
+                allow_unsafe_jscode=True  # <-- this fixes the JSON serialization error
             )
 
-        gb.configure_default_column(resizable=True, filter=False, sortable=True)
-        grid_options = gb.build()
-        #grid_options['domLayout'] = 'autoHeight'
-        # --- Display table ---
-        AgGrid(
-            df_symbol_rate,
-            gridOptions=grid_options,
-            fit_columns_on_grid_load=True,
-            theme="alpine",
-            allow_unsafe_jscode=True  # <-- this fixes the JSON serialization error
-        )
-
-        # Show summary statistics
-        st.subheader("📊 Summary Statistics")
-        summary_col1, summary_col2 = st.columns(2)
-
-        with summary_col1:
-            st.write("**Average Funding Rate by Exchange:**")
-            exchange_avg = df.groupby('Exchange')['Yearly Rate'].mean().sort_values(ascending=False)
-            st.dataframe(exchange_avg.round(4))
-
-        with summary_col2:
-            st.write("**Average Funding Rate by Symbol:**")
-            symbol_avg = df.groupby('Symbol')['Yearly Rate'].mean().sort_values(ascending=False)
-            st.dataframe(symbol_avg.round(4))
-
-    with tab2:
-        # Display data table with AgGrid
-        st.subheader("📋 Funding Rates Data")
-
-        # --- Build AgGrid ---
-        gb = GridOptionsBuilder.from_dataframe(df)
-
-        # JS for coloring negative green, positive red
-        cell_style_jscode = JsCode("""
-        function(params) {
-            // Only apply styling to the 'rate' column
-            if (!params.colDef.field.toLowerCase().includes('rate')) {
+            # Show summary statistics
+            st.subheader("📊 Summary Statistics")
+            summary_col1, summary_col2 = st.columns(2)
+
+            with summary_col1:
+                st.write("**Average Funding Rate by Exchange:**")
+                exchange_avg = df.groupby('Exchange')['Yearly Rate'].mean().sort_values(ascending=False)
+                st.dataframe(exchange_avg.round(4))
+
+            with summary_col2:
+                st.write("**Average Funding Rate by Symbol:**")
+                symbol_avg = df.groupby('Symbol')['Yearly Rate'].mean().sort_values(ascending=False)
+                st.dataframe(symbol_avg.round(4))
+
+        with tab2:
+            # Display data table with AgGrid
+            st.subheader("📋 Funding Rates Data")
+
+            # --- Build AgGrid ---
+            gb = GridOptionsBuilder.from_dataframe(df)
+
+            # JS for coloring negative green, positive red
+            cell_style_jscode = JsCode("""
+            function(params) {
+                // Only apply styling to the 'rate' column
+                if (!params.colDef.field.toLowerCase().includes('rate')) {
+                    return {};
+                }
+                if (params.value < 0) {
+                    return { 'color': 'green', 'font-weight': 'bold' };
+                } else if (params.value > 0) {
+                    return { 'color': 'red', 'font-weight': 'bold' };
+                }
                 return {};
             }
-            if (params.value < 0) {
-                return { 'color': 'green', 'font-weight': 'bold' };
-            } else if (params.value > 0) {
-                return { 'color': 'red', 'font-weight': 'bold' };
-            }
-            return {};
-        }
-        """)
-
-        # # JS for formatting values as percentages
-        # value_formatter = JsCode("""
-        # function(params) {
-        #     if (params.value === null || params.value === undefined) return '';
-        #     return (params.value * 100).toFixed(3) + '%';
-        # }
-        # """)
-
-        for col in df.columns[1:]:
-            gb.configure_column(
-                col,
-                filter=False,
-                cellStyle=cell_style_jscode,
-                #valueFormatter=value_formatter
+            """)
+
+            # # JS for formatting values as percentages
+            # value_formatter = JsCode("""
+            # function(params) {
+            #     if (params.value === null || params.value === undefined) return '';
+            #     return (params.value * 100).toFixed(3) + '%';
+            # }
+            # """)
+
+            for col in df.columns[1:]:
+                gb.configure_column(
+                    col,
+                    filter=False,
+                    cellStyle=cell_style_jscode,
+                    #valueFormatter=value_formatter
+                )
+
+            gb.configure_default_column(resizable=True, filter=False, sortable=True)
+            grid_options = gb.build()
+
+            # --- Display table ---
+            AgGrid(
+                df,
+                gridOptions=grid_options,
+                height=300,
+                fit_columns_on_grid_load=True,
+                theme="alpine",
+                allow_unsafe_jscode=True  # <-- this fixes the JSON serialization error
             )
 
-        gb.configure_default_column(resizable=True, filter=False, sortable=True)
-        grid_options = gb.build()
-
-        # --- Display table ---
-        AgGrid(
-            df,
-            gridOptions=grid_options,
-            height=300,
-            fit_columns_on_grid_load=True,
-            theme="alpine",
-            allow_unsafe_jscode=True  # <-- this fixes the JSON serialization error
-        )
+    except Exception as e:
+        st.error(f"❌ An error occurred: {str(e)}")
+        st.info("Please check your internet connection and try refreshing the data.")
+
 
-except Exception as e:
-    st.error(f"❌ An error occurred: {str(e)}")
-    st.info("Please check your internet connection and try refreshing the data.")
+snapshot_section()
 
 
 # --- Footer ---
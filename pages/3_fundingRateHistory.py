@@ -0,0 +1,228 @@
+import streamlit as st
+import pandas as pd
+import altair as alt
+
+from Storage import open_storage
+from pages.common import snapshot_api
+from pages.common.snapshots import read_history
+from pages.common.timeseries import forward_fill
+
+# "mariadb", or "sqlite" with the file DB_PATH written by a local crawler
+DB_BACKEND = st.secrets.get("DB_BACKEND", "mariadb")
+DB_PATH = st.secrets.get("DB_PATH", "reya.db")
+DB_HOST = st.secrets.get("DB_HOST", "localhost")
+DB_PORT = st.secrets.get("DB_PORT", 3306)
+DB_USER = st.secrets.get("DB_USER")
+DB_PASSWORD = st.secrets.get("DB_PASSWORD")
+DB_SCHEMA = st.secrets.get("DB_SCHEMA")
+# Parquet export of SnapshotExport, read instead of the database if configured
+EXPORT_DIR = st.secrets.get("EXPORT_DIR")
+# SnapshotApi.py, serves the hourly buckets of its history window instead of the export and the database
+SNAPSHOT_API_URL = st.secrets.get("SNAPSHOT_API_URL")
+
+st.set_page_config(page_title="Cross-Exchange Funding History", layout="wide")
+
+st.title("📈 Cross-Exchange Funding History")
+
+# candidate bucket sizes in seconds, the smallest one that keeps a series below MAX_POINTS is used
+BUCKETS = [300, 900, 3600, 4 * 3600, 12 * 3600, 86400]
+MAX_POINTS = 1000
+
+
+# --- DB CONNECTION ---
+@st.cache_resource
+def get_storage():
+    return open_storage(DB_BACKEND, path=DB_PATH, schema=DB_SCHEMA, user=DB_USER, password=DB_PASSWORD,
+                        host=DB_HOST, port=DB_PORT, driver="mysql-connector")
+
+
+def bucket_seconds(days, max_points=MAX_POINTS):
+    """Pick the bucket size so that every series has at most max_points points"""
+    span = days * 86400
+    for seconds in BUCKETS:
+        if span / seconds <= max_points:
+            return seconds
+    return BUCKETS[-1]
+
+
+# --- LOAD DATA (aggregated in the database, only the buckets are transferred) ---
+@st.cache_data(ttl=300)
+def load_symbols():
+    if SNAPSHOT_API_URL:
+        return sorted(snapshot_api.read_latest(SNAPSHOT_API_URL)["symbol"].unique().tolist())
+    df = get_storage().read_sql("SELECT name AS symbol FROM symbol WHERE id IN (SELECT DISTINCT symbol_id FROM fundingdata) ORDER BY name")
+    return df["symbol"].tolist()
+
+
+def load_exported_buckets(symbol, days, bucket):
+    """Exported rows of the symbol averaged per exchange and bucket like the SQL below, None without export"""
+    df = read_history(EXPORT_DIR, "fundingdata", days, symbols=[symbol], columns=["exchange", "rate", "rate_1y"])
+    if df is None:
+        return None
+    df["bucket"] = df["timestamp"].dt.floor(f"{bucket}s")
+    return df.groupby(["exchange", "bucket"], as_index=False)[["rate", "rate_1y"]].mean().sort_values("bucket")
+
+
+@st.cache_data(ttl=300)
+def load_api_history_days():
+    return snapshot_api.status(SNAPSHOT_API_URL)["history_days"]
+
+
+def load_buckets(symbol, days, bucket):
+    """Rows averaged per exchange and bucket from the API or the export, None if neither covers the request"""
+    # the API keeps whole hours of its history window
+    if SNAPSHOT_API_URL and bucket % 3600 == 0 and days <= load_api_history_days():
+        return snapshot_api.read_history(SNAPSHOT_API_URL, symbol, days, bucket)
+    if EXPORT_DIR:
+        return load_exported_buckets(symbol, days, bucket)
+    return None
+
+
+@st.cache_data(ttl=300)
+def load_symbol_history(symbol, days, bucket):
+    df = load_buckets(symbol, days, bucket)
+    if df is not None:
+        return forward_fill(df, f"{bucket}s", time_col="bucket", group_col="exchange")
+    storage = get_storage()
+    query = f"""
+            SELECT exchange,
+                   {storage.time_bucket("timestamp", bucket)} AS bucket,
+                   AVG(rate) AS rate,
+                   AVG(rate_1y) AS rate_1y
+            FROM fundingdata_v
+            WHERE symbol = %s
+              AND timestamp >= {storage.days_ago()}
+            GROUP BY exchange, bucket
+            ORDER BY bucket ASC \
+            """
+    df = storage.read_sql(query, params=(symbol, days))
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    # rows are only written on changes, buckets without a row keep the previous value
+    return forward_fill(df, f"{bucket}s", time_col="bucket", group_col="exchange")
+
+
+@st.cache_data(ttl=300)
+def load_spread_history(symbol, long_exchange, short_exchange, days, bucket):
+    df = load_buckets(symbol, days, bucket)
+    if df is not None:
+        df = (df.pivot(index="bucket", columns="exchange", values="rate_1y")
+              .reindex(columns=[long_exchange, short_exchange])
+              .set_axis(["long_rate_1y", "short_rate_1y"], axis=1)
+              .dropna(how="all")
+              .reset_index())
+        df = forward_fill(df, f"{bucket}s", time_col="bucket").dropna()
+        df["spread_1y"] = df["short_rate_1y"] - df["long_rate_1y"]
+        return df
+    storage = get_storage()
+    # both legs are aggregated into the same bucket in one pass, no time join needed
+    query = f"""
+            SELECT {storage.time_bucket("timestamp", bucket)} AS bucket,
+                   AVG(CASE WHEN exchange = %s THEN rate_1y END) AS long_rate_1y,
+                   AVG(CASE WHEN exchange = %s THEN rate_1y END) AS short_rate_1y
+            FROM fundingdata_v
+            WHERE symbol = %s
+              AND exchange IN (%s, %s)
+              AND timestamp >= {storage.days_ago()}
+            GROUP BY bucket
+            ORDER BY bucket ASC \
+            """
+    df = storage.read_sql(query, params=(long_exchange, short_exchange, symbol, long_exchange, short_exchange, days))
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    # a leg without a change in a bucket keeps its previous rate
+    df = forward_fill(df, f"{bucket}s", time_col="bucket").dropna()
+    df["spread_1y"] = df["short_rate_1y"] - df["long_rate_1y"]
+    return df
+
+
+# Sidebar - Time Range Filter (at the top)
+st.sidebar.subheader("⏱️ Time Range")
+time_options = {
+    "Last 24 Hours": 1,
+    "Last 7 Days": 7,
+    "Last 30 Days": 30,
+    "Last 90 Days": 90,
+    "Last 360 Days": 360
+}
+time_range = st.sidebar.selectbox(
+    "Select time period",
+    list(time_options.keys()),
+    index=3  # Default to 90 days
+)
+days_to_load = time_options[time_range]
+bucket = bucket_seconds(days_to_load)
+
+symbols = load_symbols()
+if not symbols:
+    st.error("❌ No funding rate data available.")
+    st.stop()
+
+symbol = st.sidebar.selectbox("Select symbol", symbols, index=symbols.index("BTC") if "BTC" in symbols else 0)
+
+with st.spinner("Loading data from database..."):
+    df_history = load_symbol_history(symbol, days_to_load, bucket)
+
+exchanges = sorted(df_history["exchange"].unique().tolist())
+selected_exchanges = st.sidebar.multiselect("Select exchanges", exchanges, default=exchanges)
+df_history = df_history[df_history["exchange"].isin(selected_exchanges)]
+
+# --- Per exchange funding ---
+st.subheader(f"{symbol} Funding Rate by Exchange")
+history_chart = (
+    alt.Chart(df_history)
+    .mark_line(point=False)
+    .encode(
+        x=alt.X("bucket:T", title="timestamp", axis=alt.Axis(format="%d.%m %H:%M")),
+        y=alt.Y("rate_1y:Q", title="Annualized Funding Rate (%)"),
+        color=alt.Color("exchange:N", title="Exchange"),
+        tooltip=["bucket:T", "exchange:N", alt.Tooltip("rate_1y:Q", format=".2f"),
+                 alt.Tooltip("rate:Q", format=".4f")]
+    )
+    .interactive()
+)
+st.altair_chart(history_chart, use_container_width=True)
+
+# --- Spread between two exchanges ---
+st.subheader(f"{symbol} Historical Spread")
+if len(exchanges) < 2:
+    st.info("At least two exchanges are needed for a spread ⚖️")
+else:
+    col1, col2 = st.columns(2)
+    long_exchange = col1.selectbox("📈 Long on", exchanges, index=0)
+    short_exchange = col2.selectbox("📉 Short on", exchanges, index=1)
+
+    if long_exchange == short_exchange:
+        st.info("Choose two different exchanges ⚖️")
+    else:
+        df_spread = load_spread_history(symbol, long_exchange, short_exchange, days_to_load, bucket)
+        if df_spread.empty:
+            st.info("No overlapping data for these exchanges ⚖️")
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Current Spread (1Y)", f"{df_spread['spread_1y'].iloc[-1]:.2f}%")
+            col2.metric("Average Spread (1Y)", f"{df_spread['spread_1y'].mean():.2f}%")
+            col3.metric("Positive", f"{(df_spread['spread_1y'] > 0).mean() * 100:.1f}% of the time")
+
+            spread_chart = (
+                alt.Chart(df_spread)
+                .mark_area(opacity=0.6, line=True)
+                .encode(
+                    x=alt.X("bucket:T", title="timestamp", axis=alt.Axis(format="%d.%m %H:%M")),
+                    y=alt.Y("spread_1y:Q", title="Spread Short - Long (%/1Y)"),
+                    tooltip=["bucket:T",
+                             alt.Tooltip("long_rate_1y:Q", title=f"{long_exchange} (long)", format=".2f"),
+                             alt.Tooltip("short_rate_1y:Q", title=f"{short_exchange} (short)", format=".2f"),
+                             alt.Tooltip("spread_1y:Q", title="spread", format=".2f")]
+                )
+                .interactive()
+            )
+            st.altair_chart(spread_chart, use_container_width=True)
+
+# Show data info
+st.sidebar.markdown("---")
+st.sidebar.info(f"📊 Showing {len(df_history)} buckets of {bucket // 60} minutes")
+
+# --- Footer ---
+st.markdown("---")
+st.markdown("💡 **Note:** Rates are averaged per time bucket in the database, the bucket size grows with the time range")
+st.markdown(
+    "⚠️ **Disclaimer:** This data is for informational purposes only and should not be considered as financial advice.")
@@ -0,0 +1,144 @@
+import datetime
+import logging
+import os
+
+from pages.common import snapshots, transforms
+
+try:
+    import duckdb
+except ImportError:  # optional, see [project.optional-dependencies]
+    duckdb = None
+
+# Analytics backends of the dashboard pages: "pandas" runs the transforms of pages/common/transforms.py,
+# "duckdb" runs the same transformations as SQL on DuckDB's multi-threaded columnar engine. Both return
+# the same frames, up to floating point rounding of the averages.
+
+
+class PandasAnalytics:
+    name = "pandas"
+
+    def read_history(self, export_dir, table, days, symbols=None, columns=None):
+        return snapshots.read_history(export_dir, table, days, symbols=symbols, columns=columns)
+
+    def downsample(self, df, value_col, time_col="timestamp", group_col=None, points=1000, method="lttb"):
+        return transforms.visual_downsample(df, value_col, time_col=time_col, group_col=group_col, points=points,
+                                            method=method)
+
+    def rolling_averages(self, df, value_col, prefix, group_col=None, time_col="timestamp"):
+        return transforms.add_rolling_averages(df, value_col, prefix, group_col=group_col, time_col=time_col)
+
+    def join_averages(self, df, averages, prefix, group_col=None, time_col="timestamp"):
+        return transforms.join_averages(df, averages, prefix, group_col=group_col, time_col=time_col)
+
+    def pivot_rates(self, df, values, fill_value=None):
+        return transforms.pivot_rates(df, values, fill_value=fill_value)
+
+
+class DuckDBAnalytics:
+    """The transforms as DuckDB SQL over the loaded frames or directly over the Parquet export"""
+    name = "duckdb"
+
+    def __init__(self, threads=None):
+        self.connection = duckdb.connect()
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+
+    def query(self, sql, params=None, arrow=False, **frames):
+        # Streamlit serves every session in its own thread, a cursor is a connection of its own
+        cursor = self.connection.cursor()
+        try:
+            for name, frame in frames.items():
+                cursor.register(name, frame)
+            result = cursor.execute(sql, params)
+            # through Arrow the column types come out like pyarrow's own Parquet reads
+            return result.fetch_arrow_table().to_pandas() if arrow else result.df()
+        finally:
+            cursor.close()
+
+    def read_history(self, export_dir, table, days, symbols=None, columns=None):
+        path = os.path.join(export_dir, table)
+        if not os.path.isdir(path):
+            return None
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        partitions = snapshots.PARTITIONS[table]
+        select = "* EXCLUDE (day)" if columns is None else ", ".join(
+            f'"{column}"' for column in dict.fromkeys(["id", "timestamp"] + list(columns)))
+        where = "day >= ? AND timestamp >= ?"
+        params = [start.date().isoformat(), start]
+        if symbols is not None:
+            where += f" AND symbol IN ({', '.join('?' for _ in symbols)})"
+            params += list(symbols)
+        hive_types = ", ".join(f"'{name}': VARCHAR" for name in partitions)
+        # a row is repeated in the days it is carried into, the newest copy has the latest valid_until
+        df = self.query(f"""
+            SELECT {select}
+            FROM read_parquet('{path}/**/*.parquet', hive_partitioning = true, hive_types = {{{hive_types}}})
+            WHERE {where}
+            QUALIFY row_number() OVER (PARTITION BY id ORDER BY valid_until DESC NULLS LAST) = 1
+            ORDER BY {", ".join(f'"{column}"' for column in snapshots.history_order(table, columns))}
+        """, params, arrow=True)
+        # Parquet stores the timestamps in milliseconds, DuckDB reads them as microseconds
+        return df.astype({column: "datetime64[ms]" for column in df.select_dtypes("datetime").columns})
+
+    def downsample(self, df, value_col, time_col="timestamp", group_col=None, points=1000, method="lttb"):
+        # every bucket of LTTB depends on the row kept in the bucket before, a sequential walk that does
+        # not map onto SQL; the vectorized NumPy version runs on the frame that is in memory already
+        return transforms.visual_downsample(df, value_col, time_col=time_col, group_col=group_col, points=points,
+                                            method=method)
+
+    def rolling_averages(self, df, value_col, prefix, group_col=None, time_col="timestamp", windows=("7D", "30D")):
+        partition = f'PARTITION BY "{group_col}"' if group_col is not None else ""
+        # pandas' time windows exclude their left edge
+        averages = ", ".join(
+            f'AVG("{value_col}") OVER ({partition} ORDER BY "{time_col}" RANGE BETWEEN '
+            f"INTERVAL '{int(window[:-1])} days' - INTERVAL '1 microsecond' PRECEDING AND CURRENT ROW) "
+            f'AS "{prefix}_{window.lower()}"'
+            for window in windows)
+        others = ", ".join(f'"{column}"' for column in df.columns if column != time_col)
+        order = f'"{group_col}", "{time_col}"' if group_col is not None else f'"{time_col}"'
+        dedupe = (f'QUALIFY row_number() OVER (PARTITION BY "{group_col}", "{time_col}" ORDER BY _row) = 1'
+                  if group_col is not None else "")
+        result = self.query(f"""
+            WITH numbered AS (
+                SELECT *, row_number() OVER () AS _row FROM df
+            ), unique_rows AS (
+                SELECT * FROM numbered {dedupe}
+            )
+            SELECT "{time_col}", {others}, {averages}
+            FROM unique_rows
+            ORDER BY {order}, _row
+        """, df=df)
+        return result.astype({time_col: df[time_col].dtype})
+
+    def join_averages(self, df, averages, prefix, group_col=None, time_col="timestamp"):
+        on = f'df."{group_col}" = a."{group_col}" AND ' if group_col is not None else ""
+        # rows of equal time in the order of the pandas backend
+        order = [time_col, *([group_col] if group_col is not None else []), *(["id"] if "id" in df.columns else [])]
+        # the averages of an hour are known at its end
+        result = self.query(f"""
+            SELECT df.*, a.avg_7d AS "{prefix}_7d", a.avg_30d AS "{prefix}_30d"
+            FROM df ASOF LEFT JOIN (
+                SELECT * EXCLUDE (hour), hour + INTERVAL 1 HOUR AS "{time_col}" FROM averages
+            ) a ON {on}df."{time_col}" >= a."{time_col}"
+            ORDER BY {", ".join(f'df."{column}"' for column in order)}
+        """, df=df, averages=averages)
+        return result.astype({time_col: df[time_col].dtype})
+
+    def pivot_rates(self, df, values, fill_value=None):
+        result = self.query(f"""
+            PIVOT (SELECT "Symbol", "Exchange", "{values}" FROM df)
+            ON "Exchange" USING first("{values}") GROUP BY "Symbol" ORDER BY "Symbol"
+        """, df=df).set_index("Symbol")
+        result = result[sorted(result.columns)].rename_axis(columns="Exchange")
+        if fill_value is not None:
+            result = result.fillna(fill_value)
+        return result
+
+
+def backend(name="pandas", threads=None):
+    """Analytics backend by name, pandas if DuckDB is not installed"""
+    if name == "duckdb":
+        if duckdb is not None:
+            return DuckDBAnalytics(threads)
+        logging.warning("duckdb is not installed, using the pandas analytics backend")
+    return PandasAnalytics()
@@ -0,0 +1,65 @@
+import altair as alt
+
+from pages.common.transforms import melt_averages, visual_downsample
+
+# px of a chart in the wide layout, a line cannot show more than one point per pixel column
+CHART_WIDTH = 1400
+# rows sent to the browser per chart, shared by its series, so the Vega payload does not grow with the time range
+MAX_CHART_POINTS = 5000
+# "lttb" or "minmax", see visual_downsample
+DOWNSAMPLE_METHOD = "lttb"
+TIME_AXIS = alt.Axis(format="%d.%m %H:%M")
+
+
+def points_per_series(series_count, width=CHART_WIDTH, max_points=MAX_CHART_POINTS):
+    """Points of every series of a chart: the chart width, less if the series would exceed max_points"""
+    return max(16, min(width, max_points // max(1, series_count)))
+
+
+def chart_frame(df, value, series=("symbol",), time_col="timestamp", max_points=MAX_CHART_POINTS):
+    """Only the time, series and value columns, downsampled per series to the points the chart can show"""
+    series = [column for column in series if column in df.columns]
+    df = df[[time_col, *series, value]]
+    count = df.groupby(series).ngroups if series else 1
+    points = points_per_series(count, max_points=max_points)
+    if len(df) <= points * count:
+        return df
+    return visual_downsample(df, value, time_col=time_col, group_col=series or None, points=points,
+                             method=DOWNSAMPLE_METHOD)
+
+
+def fold(df, labels, id_vars=("timestamp", "symbol")):
+    """Long format (id_vars, value, metric_label) of the labelled columns, folded here instead of in Vega"""
+    id_vars = [column for column in id_vars if column in df.columns]
+    return melt_averages(df, labels, id_vars).drop(columns="metric")
+
+
+def line_chart(data, y, y_title, color, color_title=None, stroke_dash=None, value_format=".2f"):
+    """Interactive line chart over timestamp, the tooltip shows the time, the series and y"""
+    encoding = dict(
+        x=alt.X("timestamp:T", axis=TIME_AXIS),
+        y=alt.Y(f"{y}:Q", title=y_title),
+        color=alt.Color(f"{color}:N", title=color_title) if color_title else f"{color}:N",
+        tooltip=["timestamp:T", f"{color}:N", *([f"{stroke_dash}:N"] if stroke_dash else []),
+                 alt.Tooltip(f"{y}:Q", format=value_format)],
+    )
+    if stroke_dash:
+        encoding["strokeDash"] = f"{stroke_dash}:N"
+    return (
+        alt.Chart(data)
+        .mark_line(point=False)  # Remove points for performance
+        .encode(**encoding)
+        .interactive()
+    )
+
+
+def averages_chart(df, labels, y_title, color="symbol", color_title=None, max_points=MAX_CHART_POINTS):
+    """Raw and averaged columns of a frame as one line per series and metric, dashed by metric if there
+    is a series column, coloured by metric otherwise"""
+    series = [color] if color in df.columns else []
+    # every metric is downsampled as a series of its own, so each keeps its extremes
+    data = chart_frame(fold(df, labels, id_vars=("timestamp", *series)), "value",
+                       series=(*series, "metric_label"), max_points=max_points)
+    if series:
+        return line_chart(data, "value", y_title, color, color_title, stroke_dash="metric_label")
+    return line_chart(data, "value", y_title, "metric_label", color_title or "Metric")
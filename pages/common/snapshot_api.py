@@ -0,0 +1,68 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+import pandas as pd
+import pyarrow as pa
+
+# Reader of SnapshotApi.py for the pages. Responses are kept per URL with their ETag and revalidated with
+# If-None-Match, an unchanged snapshot answers 304 without a body, so the pages' database load does not
+# grow with the number of viewers.
+
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+TIMEOUT = 10
+
+_responses = {}  # url -> (ETag, DataFrame, metadata)
+_lock = threading.Lock()
+
+
+def status(base_url):
+    """{"snapshot_id", "history_days"} of the API"""
+    with urllib.request.urlopen(f"{base_url.rstrip('/')}/health", timeout=TIMEOUT) as response:
+        return json.load(response)
+
+
+def fetch(base_url, path, **params):
+    """(DataFrame, metadata) of a resource, the cached frame if the snapshot did not change"""
+    url = f"{base_url.rstrip('/')}{path}?{urlencode(dict(params, format='arrow'))}"
+    with _lock:
+        cached = _responses.get(url)
+    headers = {"Accept": ARROW_TYPE}
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=TIMEOUT) as response:
+            table = pa.ipc.open_stream(response.read()).read_all()
+            etag = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached is not None:
+            return cached[1].copy(), cached[2]
+        raise
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    df = table.to_pandas()
+    if etag:
+        with _lock:
+            _responses[url] = (etag, df, metadata)
+    return df.copy(), metadata
+
+
+def read_latest(base_url):
+    """Latest rate per symbol and exchange with the snapshot time as timestamp, like the SQL of the pages"""
+    df, metadata = fetch(base_url, "/latest")
+    df["timestamp"] = pd.Timestamp(metadata["timestamp"]) if metadata.get("timestamp") else pd.NaT
+    return df
+
+
+def read_arbitrage(base_url, symbols=None):
+    """Every long/short pair of the latest snapshot, by spread"""
+    params = {"symbol": ",".join(symbols)} if symbols else {}
+    return fetch(base_url, "/arbitrage", **params)[0]
+
+
+def read_history(base_url, symbol, days, bucket):
+    """Mean rate and rate_1y per exchange and bucket of bucket seconds, a multiple of an hour"""
+    df = fetch(base_url, "/history", symbol=symbol, days=days, bucket=bucket)[0]
+    return df.drop(columns="symbol").sort_values("bucket").reset_index(drop=True)
+
@@ -0,0 +1,61 @@
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+# Readers of the files written by SnapshotExport, None if the export is missing so the pages fall back to SQL
+
+LATEST_FILE = "latest.arrow"
+# partition columns per table, see SnapshotExport
+PARTITIONS = {"fundingdata": ["day", "symbol"], "fundingrate": ["day", "symbol"], "staking": ["day"]}
+# columns of a series per table, rows of equal timestamps are ordered by them and the id
+SERIES_COLUMNS = {"fundingdata": ["symbol", "exchange"], "fundingrate": ["symbol"], "staking": []}
+
+
+def read_latest(export_dir):
+    """Latest rate per symbol and exchange from the memory mapped Arrow file"""
+    path = os.path.join(export_dir, LATEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def latest_version(export_dir):
+    """Modification time of latest.arrow, it is replaced once per export; None if there is no export"""
+    try:
+        return os.stat(os.path.join(export_dir, LATEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def history_order(table, columns=None):
+    """Sort columns of read_history, the same in every analytics backend"""
+    series = [column for column in SERIES_COLUMNS[table] if columns is None or column in columns]
+    return ["timestamp", *series, "id"]
+
+
+def read_history(export_dir, table, days, symbols=None, columns=None):
+    """Rows of an exported table of the last days, deduplicated over the day partitions"""
+    path = os.path.join(export_dir, table)
+    if not os.path.isdir(path):
+        return None
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS[table]]), flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning, filesystem=fs.LocalFileSystem(use_mmap=True))
+
+    # partition pruning on the day, the rows valid at the start of a day are dropped by the timestamp filter
+    condition = (ds.field("day") >= start.date().isoformat()) & (ds.field("timestamp") >= pa.scalar(start, pa.timestamp("s")))
+    if symbols is not None:
+        condition &= ds.field("symbol").isin(list(symbols))
+    if columns is not None:
+        columns = list(dict.fromkeys(["id", "timestamp"] + list(columns)))
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    # a row is repeated in the days it is carried into, the newest copy has the latest valid_until
+    if "valid_until" in df.columns:
+        df = df.sort_values("valid_until", na_position="first")
+    df = df.drop_duplicates(subset="id", keep="last").sort_values(history_order(table, columns)).reset_index(drop=True)
+    return df.drop(columns="day", errors="ignore")
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from Database import CYCLE
+
+
+def forward_fill(df, freq, time_col="timestamp", group_col=None, valid_col=None, end=None):
+    """Expand change-only rows to a regular time grid, every value holds until the next row.
+
+    The crawler only writes a row when a value changes, so readers that need a value at every
+    point in time (averages, spreads, rolling windows) fill the gaps here. If valid_col is given
+    a value is not carried more than one crawl cycle past the time it was last confirmed.
+    """
+    if df.empty:
+        return df
+
+    end = end or df[time_col].max()
+    if valid_col is not None and df[valid_col].notna().any():
+        end = max(end, df[valid_col].max())
+
+    def fill(group):
+        grid = pd.date_range(group[time_col].min().ceil(freq), end, freq=freq)
+        group = group.set_index(time_col)
+        group = group[~group.index.duplicated(keep="last")]
+        group = group.reindex(group.index.union(grid)).ffill().loc[grid]
+        if valid_col is not None:
+            expired = group[valid_col].notna() & (group.index > group[valid_col] + CYCLE)
+            group = group[~expired]
+        return group.rename_axis(time_col)
+
+    if group_col is None:
+        return fill(df).reset_index()
+    return (pd.concat({key: fill(group.drop(columns=group_col)) for key, group in df.groupby(group_col)},
+                      names=[group_col])
+            .reset_index())
@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+
+# ==========================
+# Visual Downsampling
+# ==========================
+def lttb_indices(x, y, starts, points):
+    """Largest-Triangle-Three-Buckets over the series x[starts[i]:starts[i + 1]], y[...] at once.
+
+    Positions of the kept rows: the first and last row of every series and in between one row per
+    bucket, the one spanning the largest triangle with the row kept before it and the mean of the next
+    bucket. Series with at most `points` rows are kept whole. The buckets are walked in one loop for all
+    series together, each step is a handful of array operations.
+    """
+    ends = np.r_[starts[1:], len(x)]
+    lengths = ends - starts
+    large = lengths > points
+    kept = [np.arange(start, end) for start, end in zip(starts[~large], ends[~large])]
+    if not large.any():
+        return np.concatenate(kept) if kept else np.array([], dtype=np.int64)
+
+    first, last = starts[large], ends[large] - 1
+    middle = points - 2
+    every = (last - first - 1) / middle
+    bounds = first[:, None] + 1 + np.floor(np.arange(middle + 1) * every[:, None]).astype(np.int64)
+    bounds[:, -1] = last
+
+    # mean of every bucket, the last bucket looks ahead to the last row
+    cx, cy = np.r_[0, np.cumsum(x)], np.r_[0, np.cumsum(y)]
+    counts = bounds[:, 1:] - bounds[:, :-1]
+    mean_x = np.column_stack([(cx[bounds[:, 1:]] - cx[bounds[:, :-1]]) / counts, x[last]])
+    mean_y = np.column_stack([(cy[bounds[:, 1:]] - cy[bounds[:, :-1]]) / counts, y[last]])
+
+    selected = np.empty((len(first), middle), dtype=np.int64)
+    ax, ay = x[first], y[first]
+    for i in range(middle):
+        lo, sizes = bounds[:, i], counts[:, i]
+        offsets = np.cumsum(sizes) - sizes
+        rows = np.arange(sizes.sum()) - np.repeat(offsets, sizes) + np.repeat(lo, sizes)
+        px, py = np.repeat(ax, sizes), np.repeat(ay, sizes)
+        area = np.abs((px - np.repeat(mean_x[:, i + 1], sizes)) * (y[rows] - py) -
+                      (px - x[rows]) * (np.repeat(mean_y[:, i + 1], sizes) - py))
+        # first row with the largest area of every bucket
+        largest = area == np.repeat(np.maximum.reduceat(area, offsets), sizes)
+        selected[:, i] = np.minimum.reduceat(np.where(largest, rows, len(x)), offsets)
+        ax, ay = x[selected[:, i]], y[selected[:, i]]
+
+    return np.concatenate(kept + [first, selected.ravel(), last])
+
+
+def minmax_indices(x, y, starts, points):
+    """Positions of the lowest and highest row per time bucket of every series, points // 2 buckets, plus
+    the first and last row. Keeps every spike, at the cost of twice the rows of LTTB per bucket."""
+    ends = np.r_[starts[1:], len(x)]
+    lengths = ends - starts
+    series = np.repeat(np.arange(len(starts)), lengths)
+    buckets = max(1, points // 2)
+    origin = x[starts][series]
+    span = (x[ends - 1] - x[starts])[series]
+    bucket = np.minimum(((x - origin) / np.where(span > 0, span, 1) * buckets).astype(np.int64), buckets - 1)
+
+    # rows sorted by y within every bucket, the first and last row of a bucket are its extremes
+    key = series * buckets + bucket
+    order = np.lexsort((y, key))
+    edges = np.flatnonzero(np.r_[True, key[order][1:] != key[order][:-1]])
+    extremes = np.r_[order[edges], order[np.r_[edges[1:], len(order)] - 1], starts, ends - 1]
+    small = np.repeat(lengths <= points, lengths)
+    return np.union1d(extremes, np.flatnonzero(small))
+
+
+def visual_downsample(df, value_col, time_col="timestamp", group_col=None, points=1000, method="lttb"):
+    """Rows of df that keep the shape and the extremes of every series at about `points` rows per series.
+
+    Unlike averaging over time buckets the kept rows are real rows, spikes stay visible. method "lttb"
+    keeps one row per bucket, "minmax" the lowest and highest.
+    """
+    group_cols = [] if group_col is None else [group_col] if isinstance(group_col, str) else list(group_col)
+    df = df.dropna(subset=[value_col]).sort_values([*group_cols, time_col], kind="stable")
+    if df.empty:
+        return df
+
+    starts = np.array([0])
+    if group_cols:
+        codes = df.groupby(group_cols, sort=False).ngroup().to_numpy()
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    x = df[time_col].to_numpy().astype("datetime64[ms]").astype(np.int64).astype(np.float64)
+    y = df[value_col].to_numpy(dtype=np.float64)
+    indices = (lttb_indices if method == "lttb" else minmax_indices)(x, y, starts, max(points, 3))
+    return df.iloc[np.sort(indices)].reset_index(drop=True)
+
+
+def add_rolling_averages(df, value_col, prefix, group_col=None, time_col="timestamp", windows=("7D", "30D")):
+    """Add time based rolling means of value_col as <prefix>_7d, <prefix>_30d columns"""
+    if group_col is not None:
+        df = df.sort_values([group_col, time_col]).drop_duplicates(subset=[group_col, time_col])
+    df = df.set_index(time_col)
+
+    for window in windows:
+        column = f"{prefix}_{window.lower()}"
+        if group_col is not None:
+            df[column] = (
+                df.groupby(group_col)[value_col]
+                .rolling(window, min_periods=1).mean()
+                .reset_index(level=0, drop=True)
+            )
+        else:
+            df[column] = df[value_col].rolling(window, min_periods=1).mean()
+
+    return df.reset_index()
+
+
+def join_averages(df, averages, prefix, group_col=None, time_col="timestamp"):
+    """Add the stored hourly averages (hour, avg_7d, avg_30d) as <prefix>_7d, <prefix>_30d columns.
+
+    Every row gets the averages of the last completed hour before it, so the result does not depend on
+    the loaded range or the downsampling like add_rolling_averages does.
+    """
+    averages = (averages.rename(columns={"hour": time_col, "avg_7d": f"{prefix}_7d", "avg_30d": f"{prefix}_30d"})
+                .sort_values(time_col))
+    # the averages of an hour are known at its end
+    averages[time_col] = averages[time_col] + pd.Timedelta("1h")
+    # rows of equal time in a fixed order, the same as the DuckDB backend's
+    order = [time_col, *([group_col] if group_col is not None else []), *(["id"] if "id" in df.columns else [])]
+    return pd.merge_asof(df.sort_values(order, kind="stable"), averages, on=time_col, by=group_col,
+                         direction="backward")
+
+
+def melt_averages(df, metric_map, id_vars=("timestamp", "symbol")):
+    """Long format of the raw and averaged columns for Altair, labelled with metric_map"""
+    avg_df = df.melt(
+        id_vars=list(id_vars),
+        value_vars=list(metric_map),
+        var_name="metric",
+        value_name="value"
+    )
+    avg_df["metric_label"] = avg_df["metric"].map(metric_map)
+    return avg_df
+
+
+def pivot_rates(df, values, fill_value=None):
+    """Symbols x exchanges table of one rate column"""
+    df_pivot = df.pivot(index='Symbol', columns='Exchange', values=values)
+    if fill_value is not None:
+        df_pivot = df_pivot.fillna(fill_value)
+    return df_pivot
+
+
+# ==========================
+# Arbitrage Detection
+# ==========================
+def find_best_arbitrage_opportunities(df):
+    best_results = []
+    all_results = []
+    for symbol in df["Symbol"].unique():
+        sub = df[df["Symbol"] == symbol]
+        positives = sub[sub["Rate"] > 0]
+        negatives = sub[sub["Rate"] < 0]
+
+        if positives.empty or negatives.empty:
+            continue  # no arbitrage possible for this symbol
+
+        # Find max positive & min negative
+        best_pos = positives.loc[positives["Rate"].idxmax()]
+        best_neg = negatives.loc[negatives["Rate"].idxmin()]
+
+        if "reya" in (best_pos["Exchange"].lower(), best_neg["Exchange"].lower()):
+            best_results.append({
+                "Symbol": symbol,
+                "Long Exchange": best_neg["Exchange"],
+                "Long Rate (1h)": best_neg["Rate"],
+                "Long Rate (1Y)": best_neg["Yearly Rate"],
+                "Short Exchange": best_pos["Exchange"],
+                "Short Rate (1h)": best_pos["Rate"],
+                "Short Rate (1Y)": best_pos["Yearly Rate"],
+                "Spread (1h)": best_pos["Rate"] - best_neg["Rate"],
+                "Spread (1Y)": best_pos["Yearly Rate"] - best_neg["Yearly Rate"]
+            })
+
+        # Compare ALL positives vs negatives
+        for _, pos in positives.iterrows():
+            for _, neg in negatives.iterrows():
+                all_results.append({
+                    "Symbol": symbol,
+                    "Long Exchange": neg["Exchange"],
+                    "Long Rate (1h)": neg["Rate"],
+                    "Long Rate (1Y)": neg["Yearly Rate"],
+                    "Short Exchange": pos["Exchange"],
+                    "Short Rate (1h)": pos["Rate"],
+                    "Short Rate (1Y)": pos["Yearly Rate"],
+                    "Spread (1h)": pos["Rate"] - neg["Rate"],
+                    "Spread (1Y)": pos["Yearly Rate"] - neg["Yearly Rate"],
+                })
+    all_results = pd.DataFrame(all_results).sort_values(by="Spread (1h)", ascending=False)
+    best_results = pd.DataFrame(best_results).sort_values(by="Spread (1h)", ascending=False)
+
+    return pd.DataFrame(best_results), pd.DataFrame(all_results)
+
+
+def best_arbitrage_opportunities(all_results):
+    """Best pair per symbol with Reya on one side out of every pair, as find_best_arbitrage_opportunities;
+    the highest positive and the lowest negative rate of a symbol are its pair with the largest spread"""
+    if all_results.empty:
+        return all_results
+    best = all_results.sort_values("Spread (1h)", ascending=False, kind="stable").drop_duplicates("Symbol")
+    reya = best["Long Exchange"].str.lower().eq("reya") | best["Short Exchange"].str.lower().eq("reya")
+    return best[reya].reset_index(drop=True)
@@ -5,6 +5,7 @@ import ccxt
 from typing import Any, Dict, Optional, List
 from ccxt.base.types import Strings, Int, FundingRate, Entry
 
+import FundingNormalizer
 from pages.exchanges.abstract.edgeX import ImplicitAPI
 
 class EdgeX(ccxt.Exchange, ImplicitAPI):
@@ -306,12 +307,14 @@ class EdgeX(ccxt.Exchange, ImplicitAPI):
         oraclePx = 0
         fundingTimestamp = (int(math.floor(self.milliseconds()) / 60 / 60 / 1000) + 1) * 60 * 60 * 1000
 
-        additionalInfo = {}
-        additionalInfo['fundingDatetime'] = fundingTimestamp
-        additionalInfo['fundingRateAnnualized'] = funding * 3 * 365
+        # one copy of the raw entry instead of self.extend per sample
+        # settlement every fundingRateIntervalMin minutes, 240 (4h) on all current contracts
+        interval = f"{self.safe_integer(rate[0], 'fundingRateIntervalMin', 240)}m"
+        info = dict(rate[0], fundingDatetime=fundingTimestamp,
+                    fundingRateAnnualized=FundingNormalizer.annualize(funding, FundingNormalizer.parse_interval(interval)))
 
         return {
-            'info': self.extend(rate[0], additionalInfo),
+            'info': info,
             'symbol': symbol,
             'markPrice': markPx,
             'indexPrice': oraclePx,
@@ -328,6 +331,6 @@ class EdgeX(ccxt.Exchange, ImplicitAPI):
             'previousFundingRate': None,
             'previousFundingTimestamp': None,
             'previousFundingDatetime': None,
-            'interval': '4h',
+            'interval': interval,
         }
 